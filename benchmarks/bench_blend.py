@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import time
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from PIL import Image, ImageDraw
+from modules.compositor import ImageCompositor
+
+# 测试的图片尺寸（约 2、12、50 百万像素）
+SIZES = {2: (1800, 1200), 12: (4200, 2800), 50: (8660, 5780)}
+
+
+def make_image(size: tuple) -> Image.Image:
+    """生成带噪点的RGB测试图片"""
+    return Image.merge('RGB', [Image.effect_noise(size, 40)] * 3)
+
+
+def make_layers(size: tuple) -> dict:
+    """
+    生成两种水印图层：
+        文字: 只覆盖图片一角的小图层（普通文字/图片水印）
+        整幅: 与图片一样大、按网格排列文字的稀疏图层（平铺或旋转水印）
+    """
+    width, height = size
+    step = max(200, width // 12)
+    corner = Image.new('RGBA', (width // 4, height // 10), (0, 0, 0, 0))
+    ImageDraw.Draw(corner).rectangle((0, 0, corner.width, corner.height), fill=(255, 255, 255, 128))
+
+    full = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(full)
+    for y in range(0, height, step):
+        for x in range(0, width, step):
+            draw.rectangle((x, y, x + step // 2, y + step // 8), fill=(255, 255, 255, 128))
+    return {"文字": (corner, (width // 20, height // 20)), "整幅": (full, (0, 0))}
+
+
+def legacy_composite(image: Image.Image, layer: Image.Image, position: tuple):
+    """旧版实现：水印区域转换为RGBA合成后再转换回原模式，仅用于对比"""
+    box = (position[0], position[1], position[0] + layer.width, position[1] + layer.height)
+    region = image.crop(box).convert('RGBA')
+    region.alpha_composite(layer)
+    image.paste(region.convert(image.mode), box)
+
+
+def measure(func, repeat: int) -> float:
+    """返回单次调用的平均耗时（毫秒）"""
+    func()  # 预热，同时生成预乘数据缓存
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def with_backend(backend: str, func):
+    def run():
+        ImageCompositor.set_backend(backend)
+        func()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="水印合成后端（Pillow / NumPy）在不同图片尺寸下的耗时对比")
+    parser.add_argument("--sizes", default="2,12,50", help="图片大小（百万像素），可选 2,12,50")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=4,
+                        help="批量导出测试的图片数量（同一水印图层依次合成到多张图片，预乘数据只计算一次）")
+    args = parser.parse_args()
+
+    backends = ['pillow'] + (['numpy'] if ImageCompositor.numpy_available() else [])
+    if len(backends) == 1:
+        print("未安装NumPy，只测试Pillow后端")
+
+    print(f"{'尺寸':<6}{'图层':<6}{'方法':<22}{'耗时(ms)':>10}{'MP/s':>10}")
+    for megapixels in (int(v) for v in args.sizes.split(",")):
+        size = SIZES[megapixels]
+        image = make_image(size)
+        gray = image.convert('L')
+        raw_rgb = bytearray(image.tobytes())
+        batch = [image.copy() for _ in range(args.batch)]
+        for layer_name, (layer, position) in make_layers(size).items():
+            cases = [("旧版 RGB", lambda: legacy_composite(image, layer, position))]
+            for backend in backends:
+                cases.append((f"{backend} RGB", with_backend(
+                    backend, lambda: ImageCompositor.composite_in_place(image, layer, position))))
+                cases.append((f"{backend} L", with_backend(
+                    backend, lambda: ImageCompositor.composite_in_place(gray, layer, position))))
+                cases.append((f"{backend} 原始像素", with_backend(
+                    backend, lambda: ImageCompositor.blend_raw(raw_rgb, size, 'RGB', 'RGB', layer, position))))
+                cases.append((f"{backend} 批量/张", with_backend(
+                    backend, lambda: [ImageCompositor.composite(item, layer, position) for item in batch])))
+
+            for name, func in cases:
+                elapsed = measure(func, args.repeat)
+                if name.endswith("批量/张"):
+                    elapsed /= args.batch
+                print(f"{megapixels:<6}{layer_name:<6}{name:<22}{elapsed:>10.1f}"
+                      f"{size[0] * size[1] / 1e6 / (elapsed / 1000):>10.1f}")
+        ImageCompositor.set_backend('auto')
+
+
+if __name__ == "__main__":
+    main()
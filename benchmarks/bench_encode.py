@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import time
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from PIL import Image, features
+from modules.file_handler import FileHandler
+
+
+def load_test_images(paths, size):
+    """读取测试图片；未提供时生成带渐变和噪点的合成图片（更接近照片的压缩特性）"""
+    file_handler = FileHandler()
+    images = []
+    for path in paths:
+        image = file_handler.load_image(path)
+        image.load()
+        images.append((os.path.basename(path), image.convert('RGB')))
+    if not images:
+        width, height = size
+        gradient = Image.linear_gradient('L').resize((width, height))
+        noise = Image.effect_noise((width, height), 40)
+        image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+        images.append((f"合成图片 {width}x{height}", image))
+    return images
+
+
+def measure(file_handler: FileHandler, image: Image.Image, extension: str, profile: str, repeat: int):
+    """返回 (单次编码平均耗时毫秒, 编码后字节数)"""
+    output_path = f"output{extension}"
+    data = file_handler.encode_image(image, output_path, profile=profile)  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        data = file_handler.encode_image(image, output_path, profile=profile)
+    return (time.perf_counter() - start) * 1000 / repeat, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各编码速度配置的编码耗时与文件大小对比")
+    parser.add_argument("images", nargs="*", help="测试图片，默认使用合成图片")
+    parser.add_argument("--size", default="3000x2000", help="合成图片尺寸，如 3000x2000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--formats", default="jpg,png,webp", help="测试的输出格式")
+    args = parser.parse_args()
+
+    file_handler = FileHandler()
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    extensions = [f".{ext.strip('.')}" for ext in args.formats.split(",")]
+    if ".webp" in extensions and not features.check("webp"):
+        print("当前Pillow不支持WebP，跳过WebP测试")
+        extensions.remove(".webp")
+
+    profiles = list(FileHandler.ENCODE_PROFILES)
+    baseline = FileHandler.DEFAULT_ENCODE_PROFILE
+    for name, image in load_test_images(args.images, size):
+        print(f"\n{name}，重复 {args.repeat} 次")
+        print(f"{'格式':<6}{'配置':<10}{'耗时(ms)':>10}{'大小(KB)':>10}{'相对耗时':>10}{'相对大小':>10}")
+        for extension in extensions:
+            results = {profile: measure(file_handler, image, extension, profile, args.repeat) for profile in profiles}
+            base_time, base_size = results[baseline]
+            for profile in profiles:
+                elapsed, length = results[profile]
+                print(f"{extension[1:]:<6}{profile:<10}{elapsed:>10.1f}{length / 1024:>10.1f}"
+                      f"{elapsed / base_time:>10.2f}{length / base_size:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
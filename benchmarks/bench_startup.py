@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+
+# 检查这些较重的依赖是否在启动时被导入
+WATCHED_MODULES = ("PyQt5", "numpy", "sqlite3", "multiprocessing")
+
+# 每项在新的解释器中执行，测量从启动进程到代码执行完毕的时间（冷启动）
+CASES = {
+    "python": "pass",
+    "import_core": "import modules.text_watermark, modules.image_watermark, modules.file_handler, utils.image_utils",
+    "import_cli": "import modules.batch_processor",
+    "cli_help": ("import modules.batch_processor as cli\n"
+                 "try:\n"
+                 "    cli.build_arg_parser().parse_args(['--help'])\n"
+                 "except SystemExit:\n"
+                 "    pass"),
+    "import_gui": "import main",
+    "gui_window": ("import main\n"
+                   "app = main.QApplication([])\n"
+                   "window = main.WatermarkApp()\n"
+                   "window.show()\n"
+                   "app.processEvents()"),
+}
+# 无界面的测试项，不应导入Qt
+HEADLESS_CASES = ("import_core", "import_cli", "cli_help")
+
+
+def run_case(code: str, env: dict, work_dir: str) -> tuple:
+    """
+    在新的解释器中执行代码
+
+    Returns:
+        (耗时毫秒, 已导入的被检查模块列表)
+    """
+    # 输出结果后直接退出，不等待图形界面的后台线程结束
+    report = ("\nimport json as _json, os as _os, sys as _sys\n"
+              f"print(_json.dumps([name for name in {WATCHED_MODULES!r} if name in _sys.modules]))\n"
+              "_sys.stdout.flush()\n"
+              "_os._exit(0)")
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", code + report], cwd=work_dir, env=env,
+                               capture_output=True, text=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        raise Exception(f"运行失败: {completed.stderr.strip()}")
+    return elapsed, json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="命令行和图形界面的冷启动耗时，以及启动时导入的重量级依赖")
+    parser.add_argument("--repeat", type=int, default=7, help="每项重复次数（取中位数）")
+    parser.add_argument("--cases", default=",".join(CASES), help="测试项，逗号分隔")
+    parser.add_argument("--no-gui", action="store_true", help="不测试图形界面（没有安装PyQt5时使用）")
+    args = parser.parse_args()
+
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"未知的测试项: {', '.join(unknown)}，可选: {', '.join(CASES)}")
+    if args.no_gui:
+        cases = [case for case in cases if not case.startswith("gui_") and case != "import_gui"]
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    # 没有显示器时使用离屏平台启动图形界面
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    print(f"{'测试项':<14}{'中位数(ms)':>12}{'最小(ms)':>10}  启动时导入")
+    failed = False
+    # 在临时文件夹中运行，图形界面生成的配置文件不会写入项目目录
+    with tempfile.TemporaryDirectory(prefix="watermark_startup_") as work_dir:
+        for case in cases:
+            timings = []
+            loaded = []
+            run_case(CASES[case], env, work_dir)  # 预热：生成字节码缓存，排除首次编译的耗时
+            for _ in range(args.repeat):
+                elapsed, loaded = run_case(CASES[case], env, work_dir)
+                timings.append(elapsed)
+            note = ", ".join(loaded) or "-"
+            if case in HEADLESS_CASES and "PyQt5" in loaded:
+                note += "  （无界面代码导入了Qt）"
+                failed = True
+            print(f"{case:<14}{statistics.median(timings):>12.1f}{min(timings):>10.1f}  {note}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import time
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from PIL import Image, ImageDraw
+from modules.text_watermark import TextWatermark
+
+
+def legacy_stroke_render(watermark: TextWatermark, image: Image.Image) -> Image.Image:
+    """旧版实现：通过 (2w+1)^2-1 次偏移绘制文字模拟描边，仅用于对比"""
+    layer = Image.new('RGBA', image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    font = watermark._load_font()
+    x, y = watermark.position
+    stroke_color = (*watermark.stroke_color, int(watermark.opacity * 0.8))
+    for dx in range(-watermark.stroke_width, watermark.stroke_width + 1):
+        for dy in range(-watermark.stroke_width, watermark.stroke_width + 1):
+            if dx != 0 or dy != 0:
+                draw.text((x + dx, y + dy), watermark.text, font=font, fill=stroke_color)
+    draw.text((x, y), watermark.text, font=font, fill=(*watermark.color, watermark.opacity))
+    return Image.alpha_composite(image.convert('RGBA'), layer)
+
+
+def measure(func, repeat: int) -> float:
+    """返回单次调用的平均耗时（毫秒）"""
+    func()  # 预热，加载字体缓存
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本水印描边渲染耗时随描边宽度变化的基准测试")
+    parser.add_argument("--font", help="字体文件，默认使用系统默认字体")
+    parser.add_argument("--font-size", type=int, default=72)
+    parser.add_argument("--size", default="3000x2000", help="测试图片尺寸，如 3000x2000")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--widths", default="0,1,2,3,5,8,12", help="描边宽度列表")
+    parser.add_argument("--no-legacy", action="store_true", help="不测试旧版多次绘制实现")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    image = Image.new('RGB', (width, height), (90, 120, 150))
+
+    watermark = TextWatermark()
+    watermark.set_text("Watermark 水印 2025")
+    watermark.set_font(args.font or watermark.font_family, args.font_size)
+    watermark.set_position((100, 100))
+    # 关闭图层缓存，每次都重新渲染文字
+    watermark.LAYER_CACHE_SIZE = 0
+
+    print(f"图片 {width}x{height}，字号 {args.font_size}，重复 {args.repeat} 次")
+    print(f"{'描边宽度':>8} {'当前实现(ms)':>14} {'旧版实现(ms)':>14}")
+    for stroke_width in (int(w) for w in args.widths.split(",")):
+        watermark.set_stroke(stroke_width > 0, (0, 0, 0), stroke_width)
+        current = measure(lambda: watermark.add_watermark(image), args.repeat)
+        if args.no_legacy or stroke_width == 0:
+            legacy = "-"
+        else:
+            legacy = f"{measure(lambda: legacy_stroke_render(watermark, image), args.repeat):.2f}"
+        print(f"{stroke_width:>8} {current:>14.2f} {legacy:>14}")
+
+
+if __name__ == "__main__":
+    main()
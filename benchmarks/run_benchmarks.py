@@ -0,0 +1,338 @@
+"""
+图片读取、水印和保存的基准测试
+
+基线 benchmarks/baseline.json 是在一台参考机器上用默认参数生成的（机器和测试设置见其中的 meta），
+只有在同一台机器、相同设置下运行时比较结果才有意义。在自己的机器上使用前先生成本机基线：
+
+    python benchmarks/run_benchmarks.py --save-baseline
+
+之后修改代码时与基线比较，出现回归时返回非0：
+
+    python benchmarks/run_benchmarks.py --baseline
+
+比较时使用的测试设置（--sizes、--cases、--font、--no-test-images、--repeat）应与生成基线时相同，
+设置不同时会输出提示。确认性能变化符合预期后（如优化后变快），重新运行 --save-baseline 更新基线。
+也可以用 --save-baseline/--baseline 指定其他文件，如为每台机器各保存一份。
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# 添加src目录到Python路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "src"))
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计内存峰值
+    resource = None
+
+from PIL import Image
+
+TEST_IMAGES_DIR = os.path.join(ROOT_DIR, "test-images")
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, "benchmarks", "baseline.json")
+# 合成图片尺寸（百万像素 -> 宽高，3:2）
+SYNTHETIC_SIZES = {1: (1224, 816), 12: (4242, 2828), 24: (6000, 4000), 50: (8660, 5774)}
+CASES = [
+    "load",
+    "text_plain", "text_shadow", "text_stroke", "text_rotated",
+    "logo_scaled", "logo_rotated",
+    "encode_jpeg", "encode_png",
+]
+
+
+def make_synthetic_image(size: tuple) -> Image.Image:
+    """生成带渐变和噪点的合成图片（压缩特性接近照片）"""
+    width, height = size
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    return Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+
+def make_logo(path: str):
+    """生成带透明度的测试水印图片"""
+    logo = Image.linear_gradient('L').resize((400, 200)).convert('RGBA')
+    logo.putalpha(Image.linear_gradient('L').rotate(90).resize((400, 200)))
+    logo.save(path)
+
+
+def collect_images(work_dir: str, sizes, use_test_images: bool) -> list:
+    """
+    准备测试图片
+
+    Returns:
+        [(名称, 文件路径)]
+    """
+    images = []
+    if use_test_images and os.path.isdir(TEST_IMAGES_DIR):
+        for name in sorted(os.listdir(TEST_IMAGES_DIR)):
+            path = os.path.join(TEST_IMAGES_DIR, name)
+            if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'):
+                images.append((name, path))
+    for megapixels in sizes:
+        path = os.path.join(work_dir, f"synthetic_{megapixels}mp.jpg")
+        make_synthetic_image(SYNTHETIC_SIZES[megapixels]).save(path, quality=90)
+        images.append((f"synthetic_{megapixels}mp", path))
+    return images
+
+
+def create_watermark(case: str, font: str, logo_path: str):
+    """按测试项创建水印，关闭水印的渲染缓存，每张图片都完整渲染一次"""
+    from modules.text_watermark import TextWatermark
+    from modules.image_watermark import ImageWatermark
+
+    if case.startswith("text_"):
+        watermark = TextWatermark()
+        watermark.LAYER_CACHE_SIZE = 0
+        watermark.set_text("Watermark 水印 2025")
+        watermark.set_font(font or watermark.font_family, 48)
+        watermark.set_position((100, 100))
+        if case == "text_shadow":
+            watermark.set_shadow(True, (0, 0, 0), (3, 3))
+        elif case == "text_stroke":
+            watermark.set_stroke(True, (0, 0, 0), 3)
+        elif case == "text_rotated":
+            watermark.set_rotation(30)
+        return watermark
+
+    watermark = ImageWatermark()
+    watermark.PREPARED_CACHE_SIZE = 0
+    watermark.load_watermark(logo_path)
+    watermark.set_position((100, 100))
+    watermark.set_scale(1.5)
+    if case == "logo_rotated":
+        watermark.set_rotation(30)
+    return watermark
+
+
+def peak_rss_mb():
+    """当前进程的内存峰值（MB），无法统计时返回 None"""
+    # Linux 上 ru_maxrss 会继承父进程的峰值，优先读取只属于本进程的 VmHWM
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(case: str, image_path: str, repeat: int, font: str, logo_path: str, work_dir: str) -> dict:
+    """在当前进程中运行一个测试项，返回耗时与内存统计（由子进程调用）"""
+    from modules.file_handler import FileHandler
+
+    file_handler = FileHandler()
+    if case == "load":
+        def func():
+            file_handler.load_image(image_path).load()
+    else:
+        image = file_handler.load_image(image_path)
+        image.load()
+        if case.startswith("encode_"):
+            output_path = os.path.join(work_dir, f"output_{os.getpid()}.{case[len('encode_'):].replace('jpeg', 'jpg')}")
+            def func():
+                file_handler.save_image(image, output_path)
+        else:
+            watermark = create_watermark(case, font, logo_path)
+            def func():
+                watermark.add_watermark(image)
+
+    with Image.open(image_path) as image_info:
+        megapixels = image_info.width * image_info.height / 1e6
+
+    func()  # 预热：加载字体、模块等
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    ms_per_image = statistics.median(timings)
+    # 四分位距反映测量噪声，与基线比较时用于排除偶然的波动
+    if len(timings) >= 2:
+        q1, _, q3 = statistics.quantiles(timings, n=4, method='inclusive')
+    else:
+        q1 = q3 = ms_per_image
+    peak = peak_rss_mb()
+    return {
+        "megapixels": round(megapixels, 2),
+        "ms_per_image": round(ms_per_image, 3),
+        "min_ms": round(min(timings), 3),
+        "iqr_ms": round(q3 - q1, 3),
+        "mp_per_s": round(megapixels / (ms_per_image / 1000), 2) if ms_per_image > 0 else None,
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "repeat": repeat,
+    }
+
+
+def run_in_subprocess(case: str, image_path: str, args, logo_path: str, work_dir: str) -> dict:
+    """每个测试项在独立的子进程中运行，内存峰值互不影响"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", case, image_path,
+               "--repeat", str(args.repeat), "--logo", logo_path, "--work-dir", work_dir]
+    if args.font:
+        command += ["--font", args.font]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise Exception(f"测试项 {case} 运行失败: {completed.stderr.strip()}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(results: list, baseline: dict, threshold: float) -> list:
+    """
+    与基线比较
+
+    只有中位数和最小值都比基线慢超过阈值，且增加的耗时超过两次测量中较大的四分位距时才视为回归，
+    避免单次测量的噪声被误判为回归。基线中没有最小值和四分位距（旧格式）时只比较中位数。
+
+    Returns:
+        [(结果, 基线耗时或None, 变化比例或None, 是否回归)]
+    """
+    baseline_results = {(item["case"], item["image"]): item for item in baseline.get("results", [])}
+    rows = []
+    for item in results:
+        base = baseline_results.get((item["case"], item["image"]))
+        if base is None:
+            rows.append((item, None, None, False))
+            continue
+        change = item["ms_per_image"] / base["ms_per_image"] - 1 if base["ms_per_image"] else 0.0
+        regressed = change > threshold
+        if regressed and "min_ms" in base and "iqr_ms" in base:
+            min_change = item["min_ms"] / base["min_ms"] - 1 if base["min_ms"] else 0.0
+            noise = max(item["iqr_ms"], base["iqr_ms"])
+            regressed = min_change > threshold and item["ms_per_image"] - base["ms_per_image"] > noise
+        rows.append((item, base["ms_per_image"], change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片读取、水印和保存的基准测试，可与保存的基线比较")
+    parser.add_argument("--sizes", default="1,12,24,50", help="合成图片大小（百万像素），可选 1,12,24,50，为空时不使用")
+    parser.add_argument("--cases", default=",".join(CASES), help="测试项，逗号分隔")
+    parser.add_argument("--no-test-images", action="store_true", help="不使用 test-images 中的图片")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数（取中位数，同时记录最小值和四分位距）")
+    parser.add_argument("--font", help="文本水印使用的字体文件，默认使用系统默认字体")
+    parser.add_argument("--output", help="结果JSON文件路径，默认输出到标准输出")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE,
+                        help="将结果保存为基线，默认保存到 benchmarks/baseline.json（覆盖已有基线）")
+    parser.add_argument("--baseline", nargs="?", const=DEFAULT_BASELINE,
+                        help="与基线比较，出现回归时返回非0，默认使用 benchmarks/baseline.json；"
+                             "基线应在同一台机器上用相同设置生成，见文件开头的说明")
+    parser.add_argument("--threshold", type=float, default=0.15, help="耗时增加超过该比例视为回归")
+    # 子进程内部使用的参数
+    parser.add_argument("--child", nargs=2, metavar=("CASE", "IMAGE"), help=argparse.SUPPRESS)
+    parser.add_argument("--logo", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        case, image_path = args.child
+        print(json.dumps(run_case(case, image_path, args.repeat, args.font, args.logo, args.work_dir)))
+        return 0
+
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"未知的测试项: {', '.join(unknown)}，可选: {', '.join(CASES)}")
+    try:
+        sizes = [int(v) for v in args.sizes.split(",") if v.strip()]
+    except ValueError:
+        parser.error(f"无效的图片大小: {args.sizes}，可选: {', '.join(map(str, SYNTHETIC_SIZES))}")
+    unknown = [str(size) for size in sizes if size not in SYNTHETIC_SIZES]
+    if unknown:
+        parser.error(f"不支持的图片大小: {', '.join(unknown)}，可选: {', '.join(map(str, SYNTHETIC_SIZES))}")
+
+    # 影响结果的测试设置，保存在结果中，与基线比较时检查是否一致
+    settings = {
+        "sizes": sizes,
+        "cases": cases,
+        "test_images": not args.no_test_images,
+        "font": os.path.basename(args.font) if args.font else None,
+        "repeat": args.repeat,
+    }
+
+    work_dir = tempfile.mkdtemp(prefix="watermark_bench_")
+    try:
+        logo_path = os.path.join(work_dir, "logo.png")
+        make_logo(logo_path)
+        images = collect_images(work_dir, sizes, not args.no_test_images)
+
+        results = []
+        for name, path in images:
+            for case in cases:
+                result = {"case": case, "image": name}
+                result.update(run_in_subprocess(case, path, args, logo_path, work_dir))
+                results.append(result)
+                print(f"{case:<14}{name:<20}{result['ms_per_image']:>10.1f} ms"
+                      f"  (最小 {result['min_ms']:.1f}, IQR {result['iqr_ms']:.1f})"
+                      f"{result['mp_per_s'] or 0:>10.1f} MP/s{result['peak_rss_mb'] or 0:>10.1f} MB", file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    import PIL
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "settings": settings,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"基线已保存到 {args.save_baseline}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        baseline_meta = baseline.get('meta', {})
+        print(f"\n与基线比较（{baseline_meta.get('date', '未知时间')}，阈值 {args.threshold:.0%}）",
+              file=sys.stderr)
+        if baseline_meta.get("platform") != report["meta"]["platform"] or \
+                baseline_meta.get("cpu_count") != report["meta"]["cpu_count"]:
+            print(f"注意: 基线来自其他机器（{baseline_meta.get('platform', '未知')}，"
+                  f"{baseline_meta.get('cpu_count', '?')} 核），结果仅供参考，"
+                  f"请先用 --save-baseline 生成本机基线", file=sys.stderr)
+        if baseline_meta.get("settings", settings) != settings:
+            print(f"注意: 基线的测试设置与本次不同（基线: {baseline_meta.get('settings')}）", file=sys.stderr)
+        regressions = 0
+        for item, base_ms, change, regressed in compare(results, baseline, args.threshold):
+            if base_ms is None:
+                status = "基线中没有该项"
+                print(f"{item['case']:<14}{item['image']:<20}{item['ms_per_image']:>10.1f} ms  {status}",
+                      file=sys.stderr)
+                continue
+            status = "回归" if regressed else ""
+            regressions += regressed
+            print(f"{item['case']:<14}{item['image']:<20}{item['ms_per_image']:>10.1f} ms{base_ms:>10.1f} ms"
+                  f"{change:>+9.1%}  {status}", file=sys.stderr)
+        if regressions:
+            print(f"发现 {regressions} 项性能回归", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
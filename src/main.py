@@ -1,11 +1,11 @@
 import sys
 import os
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel
-from PyQt5.QtWidgets import QFileDialog, QListWidget, QListWidgetItem, QGroupBox, QLineEdit, QSpinBox, QColorDialog
-from PyQt5.QtWidgets import QComboBox, QSlider, QFormLayout, QCheckBox, QTabWidget, QRadioButton, QButtonGroup
-from PyQt5.QtWidgets import QMessageBox, QInputDialog, QGridLayout, QSizePolicy, QButtonGroup
-from PyQt5.QtCore import Qt, QPoint
-from PyQt5.QtGui import QPixmap, QImage, QColor
+from PyQt5.QtWidgets import QFileDialog, QListWidget, QListView, QAbstractItemView, QGroupBox, QLineEdit, QSpinBox, QColorDialog
+from PyQt5.QtWidgets import QComboBox, QSlider, QFormLayout, QCheckBox, QTabWidget, QRadioButton
+from PyQt5.QtWidgets import QMessageBox, QInputDialog, QGridLayout, QProgressBar
+from PyQt5.QtCore import Qt, QPoint, QSize
+from PyQt5.QtGui import QPixmap
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -14,8 +14,12 @@ from modules.file_handler import FileHandler
 from modules.text_watermark import TextWatermark
 from modules.image_watermark import ImageWatermark
 from modules.config_manager import ConfigManager
-from utils.helpers import UIHelpers, ImageUtils
-from PIL import Image
+from modules.profiler import Profiler
+from utils.image_utils import ImageUtils
+from ui.preview_renderer import PreviewRenderer
+from ui.thumbnail_loader import ThumbnailLoader
+from ui.folder_scanner import FolderScanner
+from ui.image_list_model import ImageListModel
 
 class DraggableLabel(QLabel):
     """
@@ -39,15 +43,17 @@ class DraggableLabel(QLabel):
             # 计算移动距离
             delta = event.pos() - self.drag_start_position
             
-            # 更新水印位置
+            # 更新水印位置（将预览区域中的移动距离换算为原图坐标）
             if self.parent_app:
+                scale = self.parent_app.preview_display_scale or 1.0
+                dx, dy = round(delta.x() / scale), round(delta.y() / scale)
                 if self.parent_app.watermark_type == "text":
                     current_pos = self.parent_app.text_watermark.position
-                    new_pos = (current_pos[0] + delta.x(), current_pos[1] + delta.y())
+                    new_pos = (current_pos[0] + dx, current_pos[1] + dy)
                     self.parent_app.text_watermark.set_position(new_pos)
                 else:
                     current_pos = self.parent_app.image_watermark.position
-                    new_pos = (current_pos[0] + delta.x(), current_pos[1] + delta.y())
+                    new_pos = (current_pos[0] + dx, current_pos[1] + dy)
                     self.parent_app.image_watermark.set_position(new_pos)
                 
                 # 更新预览
@@ -61,16 +67,33 @@ class DraggableLabel(QLabel):
             self.parent_app.update_position_inputs()
 
 class WatermarkApp(QMainWindow):
+    # 预览代理图的最大边长，预览在代理图上渲染，导出时仍使用原图
+    PREVIEW_MAX_SIZE = 1280
+    
     def __init__(self):
         super().__init__()
         self.file_handler = FileHandler()
         self.text_watermark = TextWatermark()
         self.image_watermark = ImageWatermark()
-        self.config_manager = ConfigManager()
-        self.image_files = []  # 存储导入的图片文件路径
+        # 设置 WATERMARK_TEMPLATE_DB 环境变量时使用 SQLite 模板库保存模板
+        self.config_manager = ConfigManager(template_db=os.environ.get("WATERMARK_TEMPLATE_DB"))
         self.current_image = None  # 当前选中的图片
+        self.preview_image = None  # 当前图片的缩小代理图，用于实时预览
+        self.preview_scale = 1.0  # 代理图相对原图的缩放比例
+        self.preview_display_scale = 1.0  # 预览区域显示尺寸相对原图的缩放比例
         self.current_watermark_image_path = None  # 当前水印图片路径
         self.watermark_type = "text"  # 水印类型：text 或 image
+        self.preview_request_id = None  # 最近一次预览渲染请求的序号
+        self.preview_renderer = PreviewRenderer(self)
+        self.preview_renderer.preview_ready.connect(self.on_preview_ready)
+        self.preview_renderer.preview_failed.connect(self.on_preview_failed)
+        self.preview_renderer.start()
+        self.thumbnail_loader = ThumbnailLoader(parent=self)
+        # 导入的图片列表，只保存路径，缩略图等在显示时才加载
+        self.image_model = ImageListModel(self.thumbnail_loader, self)
+        self.folder_scanner = None  # 正在运行的文件夹扫描线程
+        self.export_worker = None  # 正在运行的导出线程
+        self.export_errors = []  # 本次导出失败的图片 [(图片路径, 错误信息)]
         self.initUI()
         self.load_last_config()
         
@@ -128,16 +151,24 @@ class WatermarkApp(QMainWindow):
         self.import_btn.clicked.connect(self.import_images)
         self.import_folder_btn = QPushButton("导入文件夹")
         self.import_folder_btn.clicked.connect(self.import_folder)
+        self.recursive_checkbox = QCheckBox("包含子文件夹")
         import_layout.addWidget(self.import_btn)
         import_layout.addWidget(self.import_folder_btn)
+        import_layout.addWidget(self.recursive_checkbox)
         import_group.setLayout(import_layout)
         
         # 图片列表
-        self.image_list = QListWidget()
-        self.image_list.setSelectionMode(QListWidget.ExtendedSelection)
-        self.image_list.itemSelectionChanged.connect(self.on_image_selected)
+        self.image_list = QListView()
+        self.image_list.setModel(self.image_model)
+        self.image_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.image_list.setIconSize(QSize(64, 64))
+        # 固定行高并分批布局，大量图片时滚动和追加不需要逐行计算尺寸
+        self.image_list.setUniformItemSizes(True)
+        self.image_list.setLayoutMode(QListView.Batched)
+        self.image_list.setBatchSize(200)
+        self.image_list.selectionModel().selectionChanged.connect(self.on_image_selected)
         self.image_list.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: white;
                 border: 1px solid #cccccc;
                 border-radius: 4px;
@@ -147,9 +178,34 @@ class WatermarkApp(QMainWindow):
         # 导出区域
         export_group = QGroupBox("导出设置")
         export_layout = QVBoxLayout()
+        self.incremental_checkbox = QCheckBox("只导出新增或修改的图片")
+        self.incremental_checkbox.setToolTip("原图和水印设置都未改变且导出文件仍存在的图片将被跳过")
         self.export_btn = QPushButton("导出图片")
         self.export_btn.clicked.connect(self.export_images)
-        export_layout.addWidget(self.export_btn)
+        self.cancel_export_btn = QPushButton("取消导出")
+        self.cancel_export_btn.clicked.connect(self.cancel_export)
+        self.cancel_export_btn.setEnabled(False)
+        self.export_progress_bar = QProgressBar()
+        self.export_progress_bar.setVisible(False)
+        self.export_status_label = QLabel("")
+        self.export_status_label.setWordWrap(True)
+        export_btn_layout = QHBoxLayout()
+        export_btn_layout.addWidget(self.export_btn)
+        export_btn_layout.addWidget(self.cancel_export_btn)
+        # 编码速度配置
+        encode_profile_layout = QHBoxLayout()
+        encode_profile_layout.addWidget(QLabel("编码:"))
+        self.encode_profile_combo = QComboBox()
+        self.encode_profile_combo.addItem("快速（文件稍大）", "fast")
+        self.encode_profile_combo.addItem("均衡", "balanced")
+        self.encode_profile_combo.addItem("最小文件（较慢）", "smallest")
+        self.encode_profile_combo.setCurrentIndex(1)
+        encode_profile_layout.addWidget(self.encode_profile_combo)
+        export_layout.addLayout(encode_profile_layout)
+        export_layout.addWidget(self.incremental_checkbox)
+        export_layout.addLayout(export_btn_layout)
+        export_layout.addWidget(self.export_progress_bar)
+        export_layout.addWidget(self.export_status_label)
         export_group.setLayout(export_layout)
         
         left_panel.addWidget(import_group)
@@ -324,6 +380,11 @@ class WatermarkApp(QMainWindow):
         rotation_layout.addWidget(self.rotation_label)
         text_layout.addRow("旋转角度:", rotation_layout)
         
+        # 平铺水印
+        (tiling_group, self.tiling_checkbox, self.tile_spacing_x_input,
+         self.tile_spacing_y_input, self.tile_stagger_checkbox) = self.create_tiling_group(self.on_tiling_changed)
+        text_layout.addRow(tiling_group)
+        
         # 高级文本设置
         advanced_group = QGroupBox("高级设置")
         advanced_layout = QVBoxLayout()
@@ -459,9 +520,55 @@ class WatermarkApp(QMainWindow):
         rotation_layout.addWidget(self.image_rotation_label)
         image_layout.addRow("旋转角度:", rotation_layout)
         
+        # 平铺水印
+        (tiling_group, self.image_tiling_checkbox, self.image_tile_spacing_x_input,
+         self.image_tile_spacing_y_input, self.image_tile_stagger_checkbox) = self.create_tiling_group(
+            self.on_image_tiling_changed)
+        image_layout.addRow(tiling_group)
+        
         image_watermark_widget.setLayout(image_layout)
         self.settings_tabs.addTab(image_watermark_widget, "图片水印")
     
+    def create_tiling_group(self, on_changed):
+        """
+        创建平铺水印设置分组
+        
+        Args:
+            on_changed: 任一设置改变时调用的函数
+            
+        Returns:
+            (分组, 平铺复选框, 水平间距输入框, 垂直间距输入框, 交错排列复选框)
+        """
+        tiling_group = QGroupBox("平铺水印")
+        tiling_layout = QFormLayout()
+        
+        tiling_checkbox = QCheckBox("平铺覆盖整张图片（以位置坐标为起点，按旋转角度旋转每个水印）")
+        tiling_checkbox.stateChanged.connect(on_changed)
+        tiling_layout.addRow(tiling_checkbox)
+        
+        spacing_layout = QHBoxLayout()
+        spacing_x_input = QSpinBox()
+        spacing_x_input.setRange(-500, 2000)
+        spacing_x_input.setValue(100)
+        spacing_x_input.valueChanged.connect(on_changed)
+        spacing_y_input = QSpinBox()
+        spacing_y_input.setRange(-500, 2000)
+        spacing_y_input.setValue(100)
+        spacing_y_input.valueChanged.connect(on_changed)
+        spacing_layout.addWidget(QLabel("水平:"))
+        spacing_layout.addWidget(spacing_x_input)
+        spacing_layout.addWidget(QLabel("垂直:"))
+        spacing_layout.addWidget(spacing_y_input)
+        tiling_layout.addRow("间距:", spacing_layout)
+        
+        stagger_checkbox = QCheckBox("交错排列")
+        stagger_checkbox.setChecked(True)
+        stagger_checkbox.stateChanged.connect(on_changed)
+        tiling_layout.addRow(stagger_checkbox)
+        
+        tiling_group.setLayout(tiling_layout)
+        return tiling_group, tiling_checkbox, spacing_x_input, spacing_y_input, stagger_checkbox
+    
     def create_template_tab(self):
         """创建模板管理标签页"""
         template_widget = QWidget()
@@ -471,6 +578,12 @@ class WatermarkApp(QMainWindow):
         text_template_group = QGroupBox("文本水印模板")
         text_template_layout = QVBoxLayout()
         
+        # 按名称前缀搜索模板
+        self.text_template_search = QLineEdit()
+        self.text_template_search.setPlaceholderText("搜索模板名称")
+        self.text_template_search.textChanged.connect(self.refresh_template_lists)
+        text_template_layout.addWidget(self.text_template_search)
+        
         # 模板列表
         self.text_template_list = QListWidget()
         self.text_template_list.itemClicked.connect(self.load_text_template)
@@ -492,6 +605,12 @@ class WatermarkApp(QMainWindow):
         image_template_group = QGroupBox("图片水印模板")
         image_template_layout = QVBoxLayout()
         
+        # 按名称前缀搜索模板
+        self.image_template_search = QLineEdit()
+        self.image_template_search.setPlaceholderText("搜索模板名称")
+        self.image_template_search.textChanged.connect(self.refresh_template_lists)
+        image_template_layout.addWidget(self.image_template_search)
+        
         # 模板列表
         self.image_template_list = QListWidget()
         self.image_template_list.itemClicked.connect(self.load_image_template)
@@ -524,38 +643,20 @@ class WatermarkApp(QMainWindow):
         self.text_template_list.clear()
         self.image_template_list.clear()
         
-        # 加载文本模板
-        text_templates = self.config_manager.get_text_templates()
-        for name in text_templates.keys():
-            self.text_template_list.addItem(name)
-        
-        # 加载图片模板
-        image_templates = self.config_manager.get_image_templates()
-        for name in image_templates.keys():
-            self.image_template_list.addItem(name)
+        # 只读取模板名称，模板内容在点击时才加载
+        self.text_template_list.addItems(
+            self.config_manager.get_text_template_names(self.text_template_search.text())
+        )
+        self.image_template_list.addItems(
+            self.config_manager.get_image_template_names(self.image_template_search.text())
+        )
     
     def save_text_template(self):
         """保存文本水印模板"""
         name, ok = QInputDialog.getText(self, "保存文本模板", "请输入模板名称:")
         if ok and name:
             # 获取当前文本水印设置
-            settings = {
-                "text": self.text_watermark.text,
-                "font_family": self.text_watermark.font_family,
-                "font_size": self.text_watermark.font_size,
-                "color": self.text_watermark.color,
-                "opacity": self.text_watermark.opacity,
-                "position": self.text_watermark.position,
-                "rotation": self.text_watermark.rotation,
-                "bold": self.text_watermark.bold,
-                "italic": self.text_watermark.italic,
-                "shadow": self.text_watermark.shadow,
-                "shadow_color": self.text_watermark.shadow_color,
-                "shadow_offset": self.text_watermark.shadow_offset,
-                "stroke": self.text_watermark.stroke,
-                "stroke_color": self.text_watermark.stroke_color,
-                "stroke_width": self.text_watermark.stroke_width
-            }
+            settings = self.text_watermark.get_settings()
             
             if self.config_manager.save_text_watermark_template(name, settings):
                 QMessageBox.information(self, "成功", f"文本水印模板 '{name}' 保存成功!")
@@ -568,12 +669,7 @@ class WatermarkApp(QMainWindow):
         name, ok = QInputDialog.getText(self, "保存图片模板", "请输入模板名称:")
         if ok and name:
             # 获取当前图片水印设置
-            settings = {
-                "position": self.image_watermark.position,
-                "opacity": self.image_watermark.opacity,
-                "scale": self.image_watermark.scale,
-                "rotation": self.image_watermark.rotation
-            }
+            settings = self.image_watermark.get_settings()
             
             if self.config_manager.save_image_watermark_template(name, settings):
                 QMessageBox.information(self, "成功", f"图片水印模板 '{name}' 保存成功!")
@@ -588,27 +684,7 @@ class WatermarkApp(QMainWindow):
         
         if settings:
             # 应用模板设置
-            self.text_watermark.set_text(settings.get("text", "水印文本"))
-            self.text_watermark.set_font(
-                settings.get("font_family", self.text_watermark._get_default_font()),
-                settings.get("font_size", 36)
-            )
-            self.text_watermark.set_color(settings.get("color", (255, 255, 255)))
-            self.text_watermark.set_opacity(settings.get("opacity", 128))
-            self.text_watermark.set_position(settings.get("position", (50, 50)))
-            self.text_watermark.set_rotation(settings.get("rotation", 0))
-            self.text_watermark.set_bold(settings.get("bold", False))
-            self.text_watermark.set_italic(settings.get("italic", False))
-            self.text_watermark.set_shadow(
-                settings.get("shadow", False),
-                settings.get("shadow_color", (0, 0, 0)),
-                settings.get("shadow_offset", (2, 2))
-            )
-            self.text_watermark.set_stroke(
-                settings.get("stroke", False),
-                settings.get("stroke_color", (0, 0, 0)),
-                settings.get("stroke_width", 1)
-            )
+            self.text_watermark.apply_settings(settings)
             
             # 更新UI控件
             self.text_input.setText(settings.get("text", "水印文本"))
@@ -620,6 +696,8 @@ class WatermarkApp(QMainWindow):
             self.stroke_checkbox.setChecked(settings.get("stroke", False))
             self.rotation_slider.setValue(settings.get("rotation", 0))
             self.rotation_label.setText(f"{settings.get('rotation', 0)}°")
+            self.update_tiling_inputs(settings, self.tiling_checkbox, self.tile_spacing_x_input,
+                                      self.tile_spacing_y_input, self.tile_stagger_checkbox)
             
             # 更新字体选择
             font_family = settings.get("font_family", self.text_watermark._get_default_font())
@@ -649,16 +727,15 @@ class WatermarkApp(QMainWindow):
         
         if settings:
             # 应用模板设置
-            self.image_watermark.set_position(settings.get("position", (0, 0)))
-            self.image_watermark.set_opacity(settings.get("opacity", 128))
-            self.image_watermark.set_scale(settings.get("scale", 1.0))
-            self.image_watermark.set_rotation(settings.get("rotation", 0))
+            self.image_watermark.apply_settings(settings)
             
             # 更新UI控件
             self.image_opacity_slider.setValue(settings.get("opacity", 128))
             self.scale_slider.setValue(int(settings.get("scale", 1.0) * 100))
             self.image_rotation_slider.setValue(settings.get("rotation", 0))
             self.image_rotation_label.setText(f"{settings.get('rotation', 0)}°")
+            self.update_tiling_inputs(settings, self.image_tiling_checkbox, self.image_tile_spacing_x_input,
+                                      self.image_tile_spacing_y_input, self.image_tile_stagger_checkbox)
             
             position = settings.get("position", (0, 0))
             self.image_x_position_input.setValue(position[0])
@@ -669,6 +746,14 @@ class WatermarkApp(QMainWindow):
         else:
             QMessageBox.warning(self, "错误", f"加载图片水印模板 '{name}' 失败!")
     
+    def update_tiling_inputs(self, settings, tiling_checkbox, spacing_x_input, spacing_y_input, stagger_checkbox):
+        """按模板设置更新平铺水印控件"""
+        spacing = settings.get("tile_spacing", (100, 100))
+        tiling_checkbox.setChecked(settings.get("tiled", False))
+        spacing_x_input.setValue(spacing[0])
+        spacing_y_input.setValue(spacing[1])
+        stagger_checkbox.setChecked(settings.get("tile_stagger", True))
+    
     def delete_text_template(self):
         """删除选中的文本水印模板"""
         current_item = self.text_template_list.currentItem()
@@ -725,6 +810,24 @@ class WatermarkApp(QMainWindow):
             self.text_watermark.set_stroke(False)
         self.update_preview()
     
+    def on_tiling_changed(self):
+        """当文本水印平铺设置改变时"""
+        self.text_watermark.set_tiling(
+            self.tiling_checkbox.isChecked(),
+            (self.tile_spacing_x_input.value(), self.tile_spacing_y_input.value()),
+            self.tile_stagger_checkbox.isChecked()
+        )
+        self.update_preview()
+    
+    def on_image_tiling_changed(self):
+        """当图片水印平铺设置改变时"""
+        self.image_watermark.set_tiling(
+            self.image_tiling_checkbox.isChecked(),
+            (self.image_tile_spacing_x_input.value(), self.image_tile_spacing_y_input.value()),
+            self.image_tile_stagger_checkbox.isChecked()
+        )
+        self.update_preview()
+    
     def on_position_changed(self):
         """当文本水印位置改变时"""
         x = self.x_position_input.value()
@@ -780,26 +883,34 @@ class WatermarkApp(QMainWindow):
             self, 
             "选择图片文件", 
             "", 
-            "Images (*.png *.jpg *.jpeg *.bmp *.tiff)"
+            "Images (*.png *.jpg *.jpeg *.bmp *.tiff *.webp)"
         )
         
         if file_paths:
             # 筛选出支持的格式
             supported_files = self.file_handler.get_supported_files(file_paths)
-            self.image_files.extend(supported_files)
-            self.update_image_list()
+            self.append_image_files(supported_files)
     
     def import_folder(self):
         """导入整个文件夹的图片"""
         folder_path = QFileDialog.getExistingDirectory(self, "选择图片文件夹")
         
         if folder_path:
-            try:
-                image_files = self.file_handler.load_images_from_folder(folder_path)
-                self.image_files.extend(image_files)
-                self.update_image_list()
-            except Exception as e:
-                QMessageBox.warning(self, "错误", f"导入文件夹失败: {str(e)}")
+            self.stop_folder_scan()
+            # 在后台扫描文件夹，找到的图片分批加入列表
+            self.folder_scanner = FolderScanner(folder_path, self.recursive_checkbox.isChecked(), self)
+            self.folder_scanner.batch_found.connect(self.append_image_files)
+            self.folder_scanner.scan_failed.connect(
+                lambda error: QMessageBox.warning(self, "错误", f"导入文件夹失败: {error}")
+            )
+            self.folder_scanner.start()
+    
+    def stop_folder_scan(self):
+        """停止正在进行的文件夹扫描"""
+        if self.folder_scanner is not None:
+            self.folder_scanner.cancel()
+            self.folder_scanner.wait()
+            self.folder_scanner = None
     
     def import_watermark_image(self):
         """导入水印图片"""
@@ -824,45 +935,55 @@ class WatermarkApp(QMainWindow):
             except Exception as e:
                 QMessageBox.warning(self, "错误", f"导入水印图片失败: {str(e)}")
     
-    def update_image_list(self):
-        """更新图片列表显示"""
-        self.image_list.clear()
-        for file_path in self.image_files:
-            item = QListWidgetItem(os.path.basename(file_path))
-            item.setData(Qt.UserRole, file_path)  # 保存完整路径
-            self.image_list.addItem(item)
+    def append_image_files(self, file_paths):
+        """追加图片到列表末尾，只插入新增的行，重复导入的图片会被忽略"""
+        self.image_model.append_paths(file_paths)
     
     def on_image_selected(self):
         """当图片被选中时"""
-        selected_items = self.image_list.selectedItems()
-        if selected_items:
-            file_path = selected_items[0].data(Qt.UserRole)
+        selected_indexes = self.image_list.selectionModel().selectedIndexes()
+        if selected_indexes:
+            file_path = selected_indexes[0].data(Qt.UserRole)
             try:
+                # 原图只读取文件头获取尺寸，导出时才完整解码
                 self.current_image = self.file_handler.load_image(file_path)
+                # 以缩小的分辨率解码代理图，拖动和调整参数时只在代理图上渲染
+                preview_size = (self.PREVIEW_MAX_SIZE, self.PREVIEW_MAX_SIZE)
+                self.preview_image = ImageUtils.resize_image_proportionally(
+                    self.file_handler.load_image(file_path, preview_size), *preview_size
+                )
+                self.preview_scale = self.preview_image.width / self.current_image.width
                 self.update_preview()
             except Exception as e:
                 QMessageBox.warning(self, "错误", f"加载图片失败: {str(e)}")
     
     def update_preview(self):
-        """更新预览"""
-        if self.current_image:
-            # 根据水印类型添加水印
-            if self.watermark_type == "text":
-                watermarked_image = self.text_watermark.add_watermark(self.current_image.copy())
-            else:
-                if self.image_watermark.watermark_image is None:
-                    self.preview_label.setText("请先选择水印图片")
-                    return
-                watermarked_image = self.image_watermark.add_watermark(self.current_image.copy())
+        """更新预览（在后台线程中渲染，只显示最新一次请求的结果）"""
+        if self.preview_image:
+            if self.watermark_type == "image" and self.image_watermark.watermark_image is None:
+                self.preview_request_id = None
+                self.preview_label.setText("请先选择水印图片")
+                return
             
-            # 显示预览图片
-            self.display_image(watermarked_image)
+            # 根据水印类型在代理图上按比例添加水印
+            self.preview_request_id = self.preview_renderer.request(
+                self.get_active_watermark(), self.preview_image, self.preview_scale
+            )
+    
+    def on_preview_ready(self, request_id, qimage):
+        """后台渲染完成时显示预览"""
+        if request_id == self.preview_request_id:
+            self.display_image(qimage)
+    
+    def on_preview_failed(self, request_id, error):
+        """后台渲染失败时显示错误信息"""
+        if request_id == self.preview_request_id:
+            self.preview_label.setText(f"预览错误: {error}")
     
     def display_image(self, image):
-        """在预览区域显示图片"""
+        """在预览区域显示图片（QImage）"""
         try:
-            # 转换PIL图像为QPixmap并显示
-            pixmap = UIHelpers.create_pixmap_from_pil_image(image)
+            pixmap = QPixmap.fromImage(image)
             
             # 缩放图片以适应预览区域
             scaled_pixmap = pixmap.scaled(
@@ -874,6 +995,8 @@ class WatermarkApp(QMainWindow):
             
             self.preview_label.setPixmap(scaled_pixmap)
             self.preview_label.setText("")
+            if self.current_image:
+                self.preview_display_scale = scaled_pixmap.width() / self.current_image.width
         except Exception as e:
             self.preview_label.setText(f"预览错误: {str(e)}")
     
@@ -886,9 +1009,18 @@ class WatermarkApp(QMainWindow):
             self.color_label.setStyleSheet(f"background-color: rgb({rgb[0]}, {rgb[1]}, {rgb[2]}); border: 1px solid black; border-radius: 4px;")
             self.update_preview()
     
+    def get_active_watermark(self):
+        """获取当前水印类型对应的水印对象"""
+        if self.watermark_type == "text":
+            return self.text_watermark
+        return self.image_watermark
+    
     def export_images(self):
         """导出添加水印后的图片"""
-        if not self.image_files:
+        if self.export_worker is not None:
+            return
+        image_files = self.image_model.paths()
+        if not image_files:
             QMessageBox.warning(self, "警告", "请先导入图片!")
             return
             
@@ -897,39 +1029,95 @@ class WatermarkApp(QMainWindow):
         if not output_dir:
             return
         
-        success_count = 0
-        fail_count = 0
-            
-        # 处理并导出每张图片
-        for file_path in self.image_files:
-            try:
-                # 加载图片
-                image = self.file_handler.load_image(file_path)
-                
-                # 添加水印
-                if self.watermark_type == "text":
-                    watermarked_image = self.text_watermark.add_watermark(image)
-                else:
-                    if self.image_watermark.watermark_image is not None:
-                        watermarked_image = self.image_watermark.add_watermark(image)
-                    else:
-                        watermarked_image = image  # 没有水印图片时导出原图
-                
-                # 生成输出文件名
-                filename = os.path.basename(file_path)
-                name, ext = os.path.splitext(filename)
-                output_filename = f"{name}_watermarked{ext}"
-                output_path = os.path.join(output_dir, output_filename)
-                
-                # 保存图片
-                self.file_handler.save_image(watermarked_image, output_path)
-                success_count += 1
-            except Exception as e:
-                print(f"导出图片失败 {file_path}: {str(e)}")
-                fail_count += 1
+        # 在后台线程中分阶段并行导出，导出期间界面保持响应
+        # 导出模块（多进程、大图处理等）只在第一次导出时导入，加快启动
+        from ui.export_worker import ExportWorker
+        self.export_errors = []
+        self.export_worker = ExportWorker(
+            self.get_active_watermark(), image_files, output_dir,
+            incremental=self.incremental_checkbox.isChecked(),
+            encode_profile=self.encode_profile_combo.currentData(), parent=self
+        )
+        self.export_worker.progress.connect(self.on_export_progress)
+        self.export_worker.file_failed.connect(self.on_export_file_failed)
+        self.export_worker.export_finished.connect(self.on_export_finished)
+        self.export_worker.export_failed.connect(self.on_export_failed)
+        
+        self.export_btn.setEnabled(False)
+        self.cancel_export_btn.setEnabled(True)
+        self.export_progress_bar.setRange(0, 0)  # 统计出需要导出的数量前显示忙碌状态
+        self.export_progress_bar.setVisible(True)
+        self.export_status_label.setText("正在导出...")
+        self.export_worker.start()
+    
+    def cancel_export(self):
+        """取消正在进行的导出"""
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+            self.cancel_export_btn.setEnabled(False)
+            self.export_status_label.setText("正在取消，等待当前图片写入完成...")
+    
+    def on_export_progress(self, done, total, speed, remaining):
+        """更新导出进度、速度和预计剩余时间"""
+        if total > 0:
+            self.export_progress_bar.setRange(0, total)
+            self.export_progress_bar.setValue(done)
+        status = f"已处理 {done}/{total} 张，{speed:.1f} 张/秒"
+        if remaining >= 0:
+            minutes, seconds = divmod(int(remaining + 0.5), 60)
+            status += f"，预计剩余 {minutes:02d}:{seconds:02d}"
+        if self.export_errors:
+            status += f"，失败 {len(self.export_errors)} 张"
+        self.export_status_label.setText(status)
+    
+    def on_export_file_failed(self, file_path, error):
+        """记录导出失败的图片"""
+        self.export_errors.append((file_path, error))
+        print(f"导出图片失败 {file_path}: {error}")
+    
+    def on_export_finished(self, result):
+        """导出结束（完成或取消）时显示结果"""
+        from modules.export_pipeline import format_stage_stats
+        self.finish_export()
+        for line in format_stage_stats(result.stage_stats):
+            print(line)
+        # 开启耗时统计（环境变量 WATERMARK_PROFILE / WATERMARK_TRACE）时输出各步骤的耗时分布
+        if result.profile:
+            for line in Profiler.format_stats(result.profile):
+                print(line)
+        if result.trace_path:
+            print(f"性能时间线已写入 {result.trace_path}")
         
         # 显示导出结果
-        QMessageBox.information(self, "导出完成", f"成功导出 {success_count} 张图片\n失败 {fail_count} 张图片")
+        title = "导出已取消" if result.cancelled else "导出完成"
+        message = f"成功导出 {result.success_count} 张图片\n失败 {result.fail_count} 张图片"
+        if result.skipped_count:
+            message += f"\n跳过 {result.skipped_count} 张未改变的图片"
+        message += f"\n耗时 {result.elapsed:.1f} 秒，平均 {result.images_per_second:.1f} 张/秒"
+        if result.errors:
+            # 只显示前几条错误，完整列表输出到控制台
+            message += "\n\n失败的图片:\n" + "\n".join(
+                f"{os.path.basename(file_path)}: {error}" for file_path, error in result.errors[:10]
+            )
+            if len(result.errors) > 10:
+                message += f"\n... 共 {len(result.errors)} 张"
+        self.export_status_label.setText(title)
+        QMessageBox.information(self, title, message)
+    
+    def on_export_failed(self, error):
+        """导出过程出错时显示错误信息"""
+        self.finish_export()
+        self.export_status_label.setText("导出失败")
+        QMessageBox.warning(self, "错误", f"导出失败: {error}")
+    
+    def finish_export(self):
+        """导出结束后恢复界面状态"""
+        if self.export_worker is not None:
+            self.export_worker.wait()
+            self.export_worker = None
+        self.export_btn.setEnabled(True)
+        self.cancel_export_btn.setEnabled(False)
+        self.export_progress_bar.setVisible(False)
     
     def load_last_config(self):
         """加载上次使用的配置"""
@@ -962,6 +1150,13 @@ class WatermarkApp(QMainWindow):
     def closeEvent(self, event):
         """窗口关闭事件"""
         self.save_current_config()
+        self.config_manager.flush()
+        self.stop_folder_scan()
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+            self.export_worker.wait()
+        self.preview_renderer.stop()
+        self.thumbnail_loader.shutdown()
         event.accept()
 
 def main():
@@ -0,0 +1,31 @@
+import os
+import stat
+import uuid
+
+
+def write_atomic(output_path: str, write_func):
+    """
+    先写入同目录下的临时文件，完成后再重命名为目标文件，
+    写入中断或取消时不会留下不完整的文件，也不会损坏原文件
+
+    新文件的权限由 umask 决定，覆盖已有文件时保留原文件的权限，与直接写入时相同。
+
+    Args:
+        output_path: 目标文件路径
+        write_func: 写入函数，参数为已打开的二进制文件对象
+    """
+    output_dir, name = os.path.split(os.path.abspath(output_path))
+    temp_path = os.path.join(output_dir, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write_func(f)
+        try:
+            os.chmod(temp_path, stat.S_IMODE(os.stat(output_path).st_mode))
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
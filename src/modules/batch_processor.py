@@ -0,0 +1,513 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+# 添加src目录到Python路径，支持直接运行本文件
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.file_handler import FileHandler
+from modules.text_watermark import TextWatermark
+from modules.image_watermark import ImageWatermark
+from modules.config_manager import ConfigManager
+from modules.export_manifest import ExportManifest
+from modules.large_image import LargeImageProcessor
+from modules.profiler import Profiler
+
+# 工作进程中的处理器实例，由进程池初始化函数设置
+_worker_processor = None
+
+
+def _init_worker(processor, profile_enabled: bool = False, trace_path: str = None):
+    """进程池初始化函数：每个工作进程只接收一次水印配置，并与主进程保持相同的耗时统计设置"""
+    global _worker_processor
+    _worker_processor = processor
+    if profile_enabled:
+        Profiler.enable(trace_path)
+
+
+def _process_in_worker(file_path: str) -> Optional[Tuple[str, Optional[str], Optional[dict]]]:
+    """
+    在工作进程中处理单张图片，批处理已取消时不再处理并返回None
+
+    Returns:
+        (文件路径, 错误信息, 耗时统计)，未开启耗时统计时统计为None
+    """
+    if _worker_processor.is_cancelled():
+        return None
+    file_path, error = _worker_processor.process_file_safe(file_path)
+    return file_path, error, Profiler.take_data() if Profiler.is_enabled() else None
+
+
+class BatchResult:
+    """
+    批处理结果统计
+    """
+
+    def __init__(self):
+        self.success_count = 0
+        self.fail_count = 0
+        self.skipped_count = 0  # 增量导出时未改变而跳过的图片数量
+        self.cancelled = False  # 是否被取消
+        self.errors = []  # [(文件路径, 错误信息)]
+        self.elapsed = 0.0  # 总耗时（秒）
+        self.stage_stats = []  # 流水线各阶段的统计信息，仅流水线导出时提供
+        self.profile = {}  # 各处理步骤的耗时分布 {名称: StageHistogram}，仅开启耗时统计时提供
+        self.trace_path = None  # 写入的性能时间线文件路径
+
+    @property
+    def total(self) -> int:
+        return self.success_count + self.fail_count
+
+    @property
+    def images_per_second(self) -> float:
+        return self.total / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class BatchProcessor:
+    """
+    批量水印处理类，不依赖GUI，可使用多进程并行处理大量图片
+    """
+
+    # 超过该像素数的图片使用大图模式处理（见 LargeImageProcessor）
+    LARGE_IMAGE_PIXELS = 64 * 1000 * 1000
+
+    def __init__(self, watermark, output_dir: str, workers: int = None, suffix: str = "_watermarked",
+                 input_root: str = None, incremental: bool = False, encode_profile: str = None,
+                 large_image_pixels: int = None, memory_budget: int = None):
+        """
+        Args:
+            watermark: TextWatermark 或 ImageWatermark 实例
+            output_dir: 导出目录
+            workers: 进程数，默认使用全部CPU核心；为1时在当前进程中顺序处理
+            suffix: 导出文件名后缀
+            input_root: 导入的根文件夹，提供时在导出目录中保留子文件夹结构
+            incremental: 是否增量导出，跳过原图和水印设置都未改变的图片
+            encode_profile: 编码速度配置（fast/balanced/smallest），见 FileHandler.ENCODE_PROFILES
+            large_image_pixels: 使用大图模式的像素数阈值，为 0 时不使用大图模式
+            memory_budget: 大图模式下单张图片的内存预算（字节）
+        """
+        self.watermark = watermark
+        self.output_dir = output_dir
+        self.workers = workers if workers else (os.cpu_count() or 1)
+        self.suffix = suffix
+        self.input_root = input_root
+        self.incremental = incremental
+        self.file_handler = FileHandler()
+        self.encode_profile = encode_profile or FileHandler.DEFAULT_ENCODE_PROFILE
+        if self.encode_profile not in FileHandler.ENCODE_PROFILES:
+            raise ValueError(f"未知的编码配置: {self.encode_profile}")
+        self.large_image_pixels = self.LARGE_IMAGE_PIXELS if large_image_pixels is None else large_image_pixels
+        self.large_image = LargeImageProcessor(memory_budget)
+        # 取消标记，进程池的工作进程通过继承共享
+        self._cancel_event = multiprocessing.Event()
+
+    def process_file(self, file_path: str) -> str:
+        """
+        处理单张图片：加载、添加水印、保存
+
+        Args:
+            file_path: 图片路径
+
+        Returns:
+            导出文件路径
+        """
+        if self.is_large_image(file_path):
+            return self.process_large_file(file_path)
+        watermarked_image = self.render_file(file_path)
+        output_path = self.prepare_output_path(file_path)
+        self.file_handler.save_image(watermarked_image, output_path, profile=self.encode_profile)
+        return output_path
+
+    def is_large_image(self, file_path: str) -> bool:
+        """只读取文件头，判断图片是否需要使用大图模式处理"""
+        if not self.large_image_pixels:
+            return False
+        try:
+            # 超过Pillow像素限制的图片也需要能读取尺寸，由大图模式打开
+            with self.large_image.open_image(file_path) as image:
+                return image.width * image.height >= self.large_image_pixels
+        except Exception:
+            # 无法识别的文件交给常规流程报告错误
+            return False
+
+    def process_large_file(self, file_path: str) -> str:
+        """
+        使用大图模式处理单张图片，内存占用受 memory_budget 限制
+
+        Returns:
+            导出文件路径
+        """
+        output_path = self.prepare_output_path(file_path)
+        return self.large_image.process(self.watermark, file_path, output_path, self.file_handler,
+                                        self.encode_profile)
+
+    def render_file(self, file_path: str, data: bytes = None):
+        """
+        解码图片并添加水印
+
+        Args:
+            file_path: 图片路径
+            data: 已读入内存的文件内容，提供时不再读取文件
+
+        Returns:
+            添加水印后的图片
+        """
+        image = self.file_handler.load_image(file_path, data=data)
+        with Profiler.stage("decode", file=file_path):
+            image.load()
+        return self.watermark.add_watermark(image)
+
+    def prepare_output_path(self, file_path: str) -> str:
+        """生成导出路径，保留子文件夹结构时创建对应的子文件夹"""
+        output_path = self.file_handler.get_output_path(file_path, self.output_dir, self.suffix, self.input_root)
+        if self.input_root:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        return output_path
+
+    def process_file_safe(self, file_path: str) -> Tuple[str, Optional[str]]:
+        """
+        处理单张图片并捕获异常
+
+        Returns:
+            (文件路径, 错误信息)，成功时错误信息为None
+        """
+        try:
+            self.process_file(file_path)
+            return file_path, None
+        except Exception as e:
+            return file_path, str(e)
+
+    def cancel(self):
+        """
+        请求取消批处理（可在其他线程中调用）
+
+        正在处理的图片会完成并完整写入，尚未开始的图片不再处理。
+        """
+        self._cancel_event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def _until_cancelled(self, file_paths: Iterable[str]) -> Iterator[str]:
+        """逐个返回图片路径，取消后停止（流式输入时也不再继续扫描）"""
+        for file_path in file_paths:
+            if self.is_cancelled():
+                return
+            yield file_path
+
+    def get_settings_hash(self) -> str:
+        """返回影响导出结果的全部设置的哈希值，用于增量导出"""
+        return ExportManifest.compute_settings_hash(self.watermark, {"encode_profile": self.encode_profile})
+
+    def _open_manifest(self) -> Optional[ExportManifest]:
+        """增量导出时读取导出目录中的清单"""
+        if not self.incremental:
+            return None
+        return ExportManifest(self.output_dir, self.get_settings_hash())
+
+    def _skip_unchanged(self, file_paths: Iterable[str], manifest: ExportManifest, pending: dict,
+                        result: BatchResult) -> Iterator[str]:
+        """
+        过滤掉已导出且未改变的图片
+
+        Args:
+            pending: 需要导出的图片 {图片路径: (导出路径, 原图大小和修改时间)}，导出成功后写入清单
+        """
+        for file_path in file_paths:
+            output_path = self.file_handler.get_output_path(file_path, self.output_dir, self.suffix, self.input_root)
+            unchanged, signature = manifest.check(file_path, output_path)
+            if unchanged:
+                result.skipped_count += 1
+                continue
+            if signature is not None:
+                pending[file_path] = (output_path, signature)
+            yield file_path
+
+    def _prepare_run(self, file_paths: Iterable[str], result: BatchResult):
+        """
+        准备批处理：打开增量导出清单并过滤未改变的图片
+
+        Returns:
+            (需要处理的图片路径, 总数量或None, 清单或None, 待记录的图片)
+        """
+        manifest = self._open_manifest()
+        pending = {}
+        if manifest is not None:
+            if hasattr(file_paths, "__len__"):
+                # 列表输入时预先过滤，进度中的总数量只包含需要导出的图片
+                file_paths = list(self._skip_unchanged(file_paths, manifest, pending, result))
+            else:
+                file_paths = self._skip_unchanged(file_paths, manifest, pending, result)
+        total = len(file_paths) if hasattr(file_paths, "__len__") else None
+        return file_paths, total, manifest, pending
+
+    def _record_result(self, result: BatchResult, file_path: str, error: Optional[str],
+                       manifest: Optional[ExportManifest], pending: dict):
+        """统计单张图片的处理结果，增量导出时把成功导出的图片写入清单"""
+        if error is None:
+            result.success_count += 1
+            if manifest is not None and file_path in pending:
+                manifest.record(file_path, *pending.pop(file_path))
+        else:
+            result.fail_count += 1
+            result.errors.append((file_path, error))
+            pending.pop(file_path, None)
+
+    def run(self, file_paths: Iterable[str],
+            progress_callback: Callable[[int, Optional[int], str, Optional[str]], None] = None) -> BatchResult:
+        """
+        批量处理图片
+
+        Args:
+            file_paths: 图片路径列表或可迭代对象
+            progress_callback: 进度回调 (已处理数量, 总数量或None, 文件路径, 错误信息或None)
+
+        Returns:
+            批处理结果统计
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        result = BatchResult()
+        start_time = time.perf_counter()
+        Profiler.reset()
+        file_paths, total, manifest, pending = self._prepare_run(file_paths, result)
+        file_paths = self._until_cancelled(file_paths)
+
+        pool = None
+        if self.workers <= 1:
+            results = map(self.process_file_safe, file_paths)
+        else:
+            # 图片处理耗时较长，小分块即可均衡负载；数量已知时适当增大分块以减少进程间通信
+            chunksize = max(1, min(16, total // (self.workers * 4))) if total else 4
+            pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                        initargs=(self, Profiler.is_enabled(), Profiler.get_trace_path()))
+            results = pool.imap_unordered(_process_in_worker, file_paths, chunksize=chunksize)
+
+        try:
+            for item in results:
+                if item is None:
+                    # 取消后工作进程跳过的图片
+                    continue
+                if pool:
+                    file_path, error, profile_data = item
+                    if profile_data:
+                        Profiler.merge_data(profile_data)
+                else:
+                    file_path, error = item
+                self._record_result(result, file_path, error, manifest, pending)
+                if progress_callback:
+                    progress_callback(result.total, total, file_path, error)
+        except BaseException:
+            if pool:
+                pool.terminate()
+            raise
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            if manifest is not None:
+                manifest.save()
+            result.elapsed = time.perf_counter() - start_time
+            result.cancelled = self.is_cancelled()
+            self._collect_profile(result)
+
+        return result
+
+    @staticmethod
+    def _collect_profile(result: BatchResult):
+        """开启耗时统计时将本批的统计放入结果，并写入性能时间线"""
+        if not Profiler.is_enabled():
+            return
+        result.profile = Profiler.get_stats()
+        result.trace_path = Profiler.write_trace()
+
+
+def _parse_int_pair(value: str) -> tuple:
+    """解析 "x,y" 形式的参数"""
+    parts = value.split(",")
+    if len(parts) != 2:
+        raise argparse.ArgumentTypeError(f"格式应为 x,y: {value}")
+    return int(parts[0]), int(parts[1])
+
+
+def _parse_color(value: str) -> tuple:
+    """解析 "r,g,b" 形式的颜色参数"""
+    parts = value.split(",")
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError(f"格式应为 r,g,b: {value}")
+    return tuple(int(p) for p in parts)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="水印工具命令行批处理（无需图形界面）")
+    parser.add_argument("inputs", nargs="+", help="图片文件或文件夹")
+    parser.add_argument("-o", "--output", required=True, help="导出目录")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="并行进程数（流水线模式下为线程数），默认使用全部CPU核心")
+    parser.add_argument("--engine", choices=("process", "pipeline"), default="process",
+                        help="process: 多进程逐张处理；pipeline: 读取、解码合成、编码、写入分阶段并行")
+    parser.add_argument("--io-threads", type=int, default=None, help="流水线模式下读取和写入阶段的线程数")
+    parser.add_argument("--type", choices=("text", "image"), default="text", help="水印类型")
+    parser.add_argument("--template", help="使用配置文件中保存的模板")
+    parser.add_argument("--config", default="watermark_config.json", help="配置文件路径")
+    parser.add_argument("--template-db", help="模板数据库路径，指定时从数据库读取模板")
+    parser.add_argument("--suffix", default="_watermarked", help="导出文件名后缀")
+    parser.add_argument("--profile", choices=tuple(FileHandler.ENCODE_PROFILES), default=FileHandler.DEFAULT_ENCODE_PROFILE,
+                        help="编码速度配置：fast 最快，balanced 默认，smallest 文件最小")
+    parser.add_argument("--large-threshold", type=float, default=BatchProcessor.LARGE_IMAGE_PIXELS / 1e6,
+                        help="超过该像素数（百万像素）的图片使用大图模式，只处理水印区域，0 表示不使用")
+    parser.add_argument("--memory-budget", type=int,
+                        default=LargeImageProcessor.DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                        help="大图模式下单张图片的内存预算（MB），0 表示不限制。设置预算时大图模式可以打开超过"
+                             "Pillow像素限制的图片；JPEG、PNG等不支持分块的格式完整解码超出预算时报错，不导出该图片")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量导出：跳过上次导出后原图和水印设置都未改变的图片")
+    parser.add_argument("--quiet", action="store_true", help="不输出处理进度")
+    parser.add_argument("--timing", action="store_true",
+                        help=f"统计读取、解码、渲染、合成、编码等步骤的耗时分布（也可设置环境变量 {Profiler.ENABLE_ENV}=1）")
+    parser.add_argument("--trace",
+                        help="将每个步骤的时间线以 Chrome Trace 格式写入该文件或文件夹（隐含 --timing），"
+                             "可在 chrome://tracing 或 Perfetto 中查看")
+
+    scan_group = parser.add_argument_group("文件夹扫描")
+    scan_group.add_argument("-r", "--recursive", action="store_true", help="包含子文件夹，导出时保留子文件夹结构")
+    scan_group.add_argument("--include", action="append", help="只处理匹配的文件名通配符，可重复指定")
+    scan_group.add_argument("--exclude", action="append", help="排除匹配的文件名或文件夹名通配符，可重复指定")
+    scan_group.add_argument("--sniff", action="store_true", help="根据文件头而不是扩展名识别图片")
+
+    text_group = parser.add_argument_group("文本水印")
+    text_group.add_argument("--text", help="水印文本")
+    text_group.add_argument("--font", help="字体文件")
+    text_group.add_argument("--font-size", type=int, help="字号")
+    text_group.add_argument("--color", type=_parse_color, help="文字颜色 r,g,b")
+
+    image_group = parser.add_argument_group("图片水印")
+    image_group.add_argument("--watermark-image", help="水印图片路径")
+    image_group.add_argument("--scale", type=float, help="缩放比例")
+
+    common_group = parser.add_argument_group("通用设置")
+    common_group.add_argument("--opacity", type=int, help="透明度 (0-255)")
+    common_group.add_argument("--position", type=_parse_int_pair, help="水印位置 x,y")
+    common_group.add_argument("--rotation", type=int, help="旋转角度")
+    return parser
+
+
+def build_watermark(args):
+    """根据命令行参数创建水印对象"""
+    if args.type == "text":
+        watermark = TextWatermark()
+        if args.template:
+            settings = ConfigManager(args.config, template_db=args.template_db).load_text_watermark_template(args.template)
+            if not settings:
+                raise Exception(f"找不到文本水印模板: {args.template}")
+            watermark.apply_settings(settings)
+        if args.text is not None:
+            watermark.set_text(args.text)
+        if args.font or args.font_size:
+            watermark.set_font(args.font or watermark.font_family, args.font_size or watermark.font_size)
+        if args.color:
+            watermark.set_color(args.color)
+    else:
+        if not args.watermark_image:
+            raise Exception("图片水印需要指定 --watermark-image")
+        watermark = ImageWatermark()
+        if args.template:
+            settings = ConfigManager(args.config, template_db=args.template_db).load_image_watermark_template(args.template)
+            if not settings:
+                raise Exception(f"找不到图片水印模板: {args.template}")
+            watermark.apply_settings(settings)
+        watermark.load_watermark(args.watermark_image)
+        if args.scale is not None:
+            watermark.set_scale(args.scale)
+
+    if args.opacity is not None:
+        watermark.set_opacity(args.opacity)
+    if args.position:
+        watermark.set_position(args.position)
+    if args.rotation is not None:
+        watermark.set_rotation(args.rotation)
+    return watermark
+
+
+def iter_input_files(args) -> Iterator[str]:
+    """
+    逐个返回命令行输入中的图片文件，文件夹边扫描边返回，不必等待扫描完成
+    """
+    file_handler = FileHandler()
+    for path in args.inputs:
+        if os.path.isdir(path):
+            for batch in file_handler.iter_images_from_folder(
+                path, recursive=args.recursive, include=args.include,
+                exclude=args.exclude, sniff=args.sniff
+            ):
+                yield from batch
+        else:
+            yield from file_handler.get_supported_files([path])
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    if args.timing or args.trace:
+        Profiler.enable(args.trace or Profiler.get_trace_path())
+
+    try:
+        watermark = build_watermark(args)
+    except Exception as e:
+        print(f"错误: {str(e)}", file=sys.stderr)
+        return 2
+
+    # 只有一个文件夹输入时，递归导出保留其子文件夹结构
+    folders = [path for path in args.inputs if os.path.isdir(path)]
+    input_root = folders[0] if args.recursive and len(args.inputs) == 1 and folders else None
+    large_image_pixels = int(args.large_threshold * 1e6)
+    memory_budget = args.memory_budget * 1024 * 1024
+    if args.engine == "pipeline":
+        # 流水线依赖 BatchProcessor，在此处导入避免循环导入
+        from modules.export_pipeline import ExportPipeline, format_stage_stats
+        processor = ExportPipeline(watermark, args.output, workers=args.workers, suffix=args.suffix,
+                                   input_root=input_root, incremental=args.incremental,
+                                   encode_profile=args.profile, large_image_pixels=large_image_pixels,
+                                   memory_budget=memory_budget, io_threads=args.io_threads)
+    else:
+        processor = BatchProcessor(watermark, args.output, workers=args.workers, suffix=args.suffix,
+                                   input_root=input_root, incremental=args.incremental,
+                                   encode_profile=args.profile, large_image_pixels=large_image_pixels,
+                                   memory_budget=memory_budget)
+    start_time = time.perf_counter()
+
+    def report_progress(done, total, file_path, error):
+        if error:
+            print(f"导出图片失败 {file_path}: {error}", file=sys.stderr)
+        if not args.quiet and done % 100 == 0:
+            elapsed = time.perf_counter() - start_time
+            speed = done / elapsed if elapsed > 0 else 0.0
+            print(f"已处理 {done} 张图片 ({speed:.1f} 张/秒)")
+
+    print(f"开始处理，{'线程数' if args.engine == 'pipeline' else '进程数'}: {processor.workers}")
+    try:
+        result = processor.run(iter_input_files(args), progress_callback=report_progress)
+    except Exception as e:
+        print(f"错误: {str(e)}", file=sys.stderr)
+        return 2
+
+    if result.total == 0 and result.skipped_count == 0:
+        print("没有找到支持的图片文件", file=sys.stderr)
+        return 2
+    print(f"成功导出 {result.success_count} 张图片，失败 {result.fail_count} 张图片")
+    if result.skipped_count:
+        print(f"跳过 {result.skipped_count} 张未改变的图片")
+    print(f"总耗时 {result.elapsed:.2f} 秒，平均 {result.images_per_second:.1f} 张/秒")
+    if result.stage_stats and not args.quiet:
+        for line in format_stage_stats(result.stage_stats):
+            print(line)
+    if result.profile and not args.quiet:
+        for line in Profiler.format_stats(result.profile):
+            print(line)
+    if result.trace_path:
+        print(f"性能时间线已写入 {result.trace_path}")
+    return 0 if result.fail_count == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
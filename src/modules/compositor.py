@@ -0,0 +1,445 @@
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageChops
+
+from modules.profiler import Profiler
+
+# NumPy 为可选依赖，未安装时全部使用 Pillow 合成；导入NumPy耗时较长，第一次需要时才导入，
+# 命令行和图形界面启动时不加载
+np = None
+_numpy_checked = False
+
+
+def _load_numpy():
+    """导入NumPy，未安装时返回 None"""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+        _numpy_checked = True
+    return np
+
+
+class _PreparedLayer:
+    """
+    预乘alpha后的水印图层数据，同一图层合成多张图片时只计算一次
+
+    只保存alpha不为0的像素（文字、平铺水印通常只覆盖图层的一小部分），
+    合成时按像素索引只处理这些像素：out = dst * (255 - a) / 255 + color * a / 255。
+    """
+
+    # 每个图层缓存的裁剪窗口数量（图层部分超出图片时按可见部分计算，平铺时交错的行和边缘的行各不相同）
+    WINDOW_CACHE_SIZE = 8
+
+    def __init__(self, layer: Image.Image):
+        self.layer = layer
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_window(self, window: tuple):
+        """
+        获取图层中 window 区域的预乘数据
+
+        Returns:
+            (像素索引或 slice(None), 255 - alpha, 预乘RGB, 预乘灰度)，后三项为 uint16 数组
+        """
+        with self._lock:
+            prepared = self._windows.get(window)
+            if prepared is not None:
+                self._windows.move_to_end(window)
+                return prepared
+
+        layer = self.layer
+        if window != (0, 0, layer.width, layer.height):
+            layer = layer.crop(window)
+        pixels = np.asarray(layer).reshape(-1, 4)
+        index = np.flatnonzero(pixels[:, 3])
+        if len(index) == len(pixels):
+            # 图层每个像素都需要合成时不使用索引，直接按切片计算
+            index = slice(None)
+        alpha = pixels[index, 3].astype(np.uint16)
+        premultiplied = pixels[index, :3] * alpha[:, None]
+        # 与 Pillow 的 RGB -> L 转换一致的灰度值
+        luma = np.asarray(layer.convert('L')).reshape(-1)[index] * alpha
+        prepared = (index, 255 - alpha, premultiplied, luma)
+
+        with self._lock:
+            self._windows[window] = prepared
+            while len(self._windows) > self.WINDOW_CACHE_SIZE:
+                self._windows.popitem(last=False)
+        return prepared
+
+
+class ImageCompositor:
+    """
+    图层合成工具类，只在水印图层覆盖的区域内进行合成
+
+    合成后端：
+        pillow: RGB和灰度图片使用以alpha为蒙版的单次粘贴，不产生RGBA副本
+        numpy: 使用预乘alpha的向量化计算，只处理水印实际覆盖的像素（需要安装NumPy）
+        auto: Pillow图片使用 pillow 后端；大图模式等直接处理原始像素缓冲区时使用 numpy 后端，
+              省去像素数据与Pillow图片之间的转换
+    """
+
+    BACKENDS = ('auto', 'numpy', 'pillow')
+    # 已预处理图层缓存的最大数量
+    PREPARED_CACHE_SIZE = 4
+    # 平铺图案条带缓存的最大数量
+    STRIP_CACHE_SIZE = 4
+    # 可以用NumPy直接合成的原始像素排列: rawmode -> (每像素字节数, 前三个字节的通道顺序，灰度为 None)
+    RAW_LAYOUTS = {
+        'RGB': (3, 'RGB'),
+        'BGR': (3, 'BGR'),
+        'RGBX': (4, 'RGB'),
+        'BGRX': (4, 'BGR'),
+        'L': (1, None),
+    }
+
+    _backend = 'auto'
+    _prepared_cache = OrderedDict()
+    _prepared_lock = threading.Lock()
+    _strip_cache = OrderedDict()
+    _achromatic_cache = OrderedDict()
+
+    @staticmethod
+    def numpy_available() -> bool:
+        """是否可以使用NumPy后端"""
+        return _load_numpy() is not None
+
+    @classmethod
+    def set_backend(cls, backend: str):
+        """
+        设置合成后端
+
+        Args:
+            backend: auto、numpy 或 pillow
+        """
+        if backend not in cls.BACKENDS:
+            raise ValueError(f"未知的合成后端: {backend}，可选: {', '.join(cls.BACKENDS)}")
+        if backend == 'numpy' and _load_numpy() is None:
+            raise Exception("无法使用numpy合成后端: 未安装NumPy")
+        cls._backend = backend
+
+    @classmethod
+    def get_backend(cls) -> str:
+        """获取当前设置的合成后端"""
+        return cls._backend
+
+    @staticmethod
+    def clip_box(image_size: tuple, layer_size: tuple, position: tuple):
+        """
+        计算图层在图片上的可见区域
+
+        Args:
+            image_size: 图片尺寸 (width, height)
+            layer_size: 图层尺寸 (width, height)
+            position: 图层左上角在图片中的位置 (x, y)，可以为负数
+
+        Returns:
+            可见区域 (left, top, right, bottom)，图层完全不可见时返回 None
+        """
+        x, y = position
+        left, top = max(0, x), max(0, y)
+        right = min(image_size[0], x + layer_size[0])
+        bottom = min(image_size[1], y + layer_size[1])
+        if left >= right or top >= bottom:
+            return None
+        return left, top, right, bottom
+
+    @staticmethod
+    def is_achromatic(layer: Image.Image) -> bool:
+        """
+        图层中可见（alpha不为0）的像素是否都是灰色（R=G=B），结果按图层对象缓存
+
+        只有无彩色的图层才能直接合成到灰度图片上而不丢失颜色。
+        """
+        key = id(layer)
+        cache = ImageCompositor._achromatic_cache
+        with ImageCompositor._prepared_lock:
+            cached = cache.get(key)
+            if cached is not None and cached[0] is layer:
+                cache.move_to_end(key)
+                return cached[1]
+
+        red, green, blue, alpha = layer.split()
+        difference = ImageChops.lighter(ImageChops.difference(red, green), ImageChops.difference(green, blue))
+        # 只检查可见像素：透明像素的颜色不影响合成结果
+        visible = alpha.point(lambda value: 255 if value else 0)
+        achromatic = ImageChops.multiply(difference, visible).getbbox() is None
+
+        with ImageCompositor._prepared_lock:
+            # 缓存中保留图层的引用，避免 id 被复用
+            cache[key] = (layer, achromatic)
+            while len(cache) > ImageCompositor.PREPARED_CACHE_SIZE:
+                cache.popitem(last=False)
+        return achromatic
+
+    @staticmethod
+    def working_mode(mode: str, layers) -> str:
+        """
+        获取合成时图片应使用的模式
+
+        RGB和RGBA保持原模式；灰度图片只有在所有图层都是无彩色时才保持灰度，否则转换为RGB，
+        避免彩色水印变成灰色；其他模式转换为RGBA。
+
+        Args:
+            mode: 原图模式
+            layers: 要合成的RGBA图层
+        """
+        if mode in ('RGB', 'RGBA'):
+            return mode
+        if mode == 'L':
+            checked = set()
+            for layer in layers:
+                # 平铺水印的每一行是同一个条带图层，只检查一次
+                if id(layer) in checked:
+                    continue
+                checked.add(id(layer))
+                if not ImageCompositor.is_achromatic(layer):
+                    return 'RGB'
+            return 'L'
+        return 'RGBA'
+
+    @staticmethod
+    def _working_copy(image: Image.Image, layers) -> Image.Image:
+        """复制原图（需要时转换为 working_mode 返回的模式）用于合成"""
+        mode = ImageCompositor.working_mode(image.mode, layers)
+        with Profiler.stage("copy"):
+            return image.copy() if mode == image.mode else image.convert(mode)
+
+    @staticmethod
+    def composite(image: Image.Image, layer: Image.Image, position: tuple) -> Image.Image:
+        """
+        将RGBA图层合成到图片的指定位置，不修改原图
+
+        RGB和RGBA图片保持原模式；灰度图片在水印无彩色时保持灰度，否则转换为RGB；
+        其他模式转换为RGBA后合成。
+
+        Args:
+            image: 原始图片
+            layer: RGBA水印图层
+            position: 图层左上角在图片中的位置 (x, y)
+
+        Returns:
+            合成后的图片
+        """
+        result = ImageCompositor._working_copy(image, (layer,))
+        ImageCompositor.composite_in_place(result, layer, position)
+        return result
+
+    @staticmethod
+    def composite_many(image: Image.Image, placements: list) -> Image.Image:
+        """
+        将多个图层依次合成到图片上，不修改原图，图片只复制一次
+
+        Args:
+            image: 原始图片
+            placements: [(RGBA图层, 左上角位置)]
+
+        Returns:
+            合成后的图片
+        """
+        result = ImageCompositor._working_copy(image, [layer for layer, _ in placements])
+        for layer, position in placements:
+            ImageCompositor.composite_in_place(result, layer, position)
+        return result
+
+    @staticmethod
+    def tile_placements(image_size: tuple, cell: Image.Image, pitch: tuple, origin: tuple,
+                        stagger: bool = False) -> list:
+        """
+        计算平铺水印覆盖整张图片所需的图层和位置
+
+        单元图层先拼成一整行的图案条带（按单元图层和水平间距缓存，批量导出时只拼一次），
+        每一行只合成一次条带，图片中的每个像素最多被处理一次（单元之间不重叠时）。
+
+        Args:
+            image_size: 图片尺寸 (width, height)
+            cell: 单元图层（已缩放、旋转的RGBA水印）
+            pitch: 相邻单元左上角之间的距离 (水平, 垂直)
+            origin: 图案中某一个单元的左上角位置，移动它可以平移整个图案
+            stagger: 是否将奇数行错开半个水平间距
+
+        Returns:
+            [(条带图层, 左上角位置)]，每行一项
+        """
+        width, height = image_size
+        pitch_x, pitch_y = max(1, pitch[0]), max(1, pitch[1])
+        # 单元比间距宽时，左侧需要多放几个单元才能盖住图片边缘
+        lead = -(-cell.width // pitch_x)
+        count = (width + lead * pitch_x) // pitch_x + 2
+        strip = ImageCompositor._get_strip(cell, pitch_x, count)
+
+        placements = []
+        row = (-cell.height - origin[1]) // pitch_y + 1
+        y = origin[1] + row * pitch_y
+        while y < height:
+            shift = pitch_x // 2 if stagger and row % 2 else 0
+            x = (origin[0] + shift) % pitch_x - lead * pitch_x
+            placements.append((strip, (x, y)))
+            row += 1
+            y += pitch_y
+        return placements
+
+    @staticmethod
+    def _get_strip(cell: Image.Image, pitch_x: int, count: int) -> Image.Image:
+        """获取由 count 个单元按水平间距排成一行的图案条带"""
+        key = (id(cell), pitch_x, count)
+        cache = ImageCompositor._strip_cache
+        with ImageCompositor._prepared_lock:
+            cached = cache.get(key)
+            if cached is not None and cached[0] is cell:
+                cache.move_to_end(key)
+                return cached[1]
+
+        with Profiler.stage("tile_strip"):
+            strip = Image.new('RGBA', ((count - 1) * pitch_x + cell.width, cell.height), (0, 0, 0, 0))
+            for index in range(count):
+                # 单元比间距宽时相邻单元会重叠，需要按alpha合成
+                strip.alpha_composite(cell, (index * pitch_x, 0))
+
+        with ImageCompositor._prepared_lock:
+            # 缓存中保留单元图层的引用，避免 id 被复用
+            cache[key] = (cell, strip)
+            while len(cache) > ImageCompositor.STRIP_CACHE_SIZE:
+                cache.popitem(last=False)
+        return strip
+
+    @staticmethod
+    def composite_in_place(image: Image.Image, layer: Image.Image, position: tuple):
+        """
+        将RGBA图层直接合成到图片上（修改原图），只处理图层覆盖的区域
+
+        图片保持原模式，用于大图等不希望复制整张图片的场景。灰度图片无法保留水印的颜色，
+        彩色水印应先按 working_mode 转换图片。
+
+        Args:
+            image: 要修改的图片
+            layer: RGBA水印图层
+            position: 图层左上角在图片中的位置 (x, y)
+        """
+        with Profiler.stage("composite"):
+            prepared = ImageCompositor._get_prepared(layer) if ImageCompositor._backend == 'numpy' else None
+            ImageCompositor._composite_image(image, layer, position, prepared)
+
+    @staticmethod
+    def _composite_image(image: Image.Image, layer: Image.Image, position: tuple, prepared):
+        """合成到Pillow图片上，prepared 不为 None 时使用NumPy后端"""
+        box = ImageCompositor.clip_box(image.size, layer.size, position)
+        if box is None:
+            return
+        x, y = position
+        window = (box[0] - x, box[1] - y, box[2] - x, box[3] - y)
+
+        if image.mode == 'RGBA':
+            # 原图可能有透明区域，需要完整的alpha合成
+            if window != (0, 0, layer.width, layer.height):
+                layer = layer.crop(window)
+            image.alpha_composite(layer, (box[0], box[1]))
+        elif image.mode in ('RGB', 'L') and prepared is not None:
+            region = np.array(image.crop(box))
+            ImageCompositor._blend_array(region.reshape(-1, len(image.getbands())),
+                                         prepared.get_window(window), 'RGB' if image.mode == 'RGB' else None)
+            image.paste(Image.fromarray(region), box)
+        elif image.mode in ('RGB', 'L'):
+            # 不透明的原图上，以alpha为蒙版粘贴即为alpha合成，且不需要转换为RGBA
+            if window != (0, 0, layer.width, layer.height):
+                layer = layer.crop(window)
+            image.paste(layer, box, layer)
+        else:
+            if window != (0, 0, layer.width, layer.height):
+                layer = layer.crop(window)
+            region = image.crop(box).convert('RGBA')
+            region.alpha_composite(layer)
+            image.paste(region.convert(image.mode), box)
+
+    @staticmethod
+    def blend_raw(buffer: bytearray, size: tuple, mode: str, rawmode: str, layer: Image.Image, position: tuple):
+        """
+        将RGBA图层直接合成到按 rawmode 排列的原始像素缓冲区中（修改 buffer）
+
+        NumPy可用且 rawmode 为 RGB/BGR/RGBX/BGRX/L 时直接在缓冲区上计算，
+        否则转换为Pillow图片合成后写回。灰度数据只能保留无彩色图层（见 is_achromatic），
+        彩色水印需要调用方先转换为RGB。
+
+        Args:
+            buffer: 可写的像素数据，每行紧密排列
+            size: 缓冲区中图片的尺寸 (width, height)
+            mode: 图片模式
+            rawmode: 像素数据的排列方式
+            layer: RGBA水印图层
+            position: 图层左上角相对缓冲区的位置 (x, y)
+        """
+        layout = ImageCompositor.RAW_LAYOUTS.get(rawmode)
+        use_numpy = (layout is not None and ImageCompositor._backend != 'pillow' and mode != 'RGBA'
+                     and _load_numpy() is not None)
+        if not use_numpy:
+            band = Image.frombytes(mode, size, bytes(buffer), 'raw', rawmode)
+            ImageCompositor._composite_image(band, layer, position, None)
+            buffer[:] = band.tobytes('raw', rawmode)
+            return
+
+        box = ImageCompositor.clip_box(size, layer.size, position)
+        if box is None:
+            return
+        x, y = position
+        window = (box[0] - x, box[1] - y, box[2] - x, box[3] - y)
+        pixel_bytes, order = layout
+        pixels = np.frombuffer(buffer, np.uint8).reshape(size[1], size[0], pixel_bytes)
+        region = pixels[box[1]:box[3], box[0]:box[2]]
+        # 水印不覆盖整行时先复制为连续数组，计算后再写回
+        contiguous = np.ascontiguousarray(region)
+        ImageCompositor._blend_array(contiguous.reshape(-1, pixel_bytes),
+                                     ImageCompositor._get_prepared(layer).get_window(window), order)
+        if contiguous is not region:
+            region[...] = contiguous
+
+    @staticmethod
+    def _blend_array(pixels, prepared: tuple, order):
+        """
+        在 (像素数, 每像素字节数) 的 uint8 数组上混合预乘后的水印像素
+
+        Args:
+            pixels: 可写的像素数组
+            prepared: _PreparedLayer.get_window 的返回值
+            order: 前三个字节的通道顺序（RGB 或 BGR），灰度图为 None
+        """
+        index, inverse_alpha, premultiplied, luma = prepared
+        if not len(inverse_alpha):
+            return
+        if order is None:
+            values = pixels[index, 0].astype(np.uint16)
+            values *= inverse_alpha
+            values += luma
+        else:
+            values = pixels[index, :3].astype(np.uint16)
+            values *= inverse_alpha[:, None]
+            values += premultiplied if order == 'RGB' else premultiplied[:, ::-1]
+        # 整数除以255并四舍五入：(v + 128 + ((v + 128) >> 8)) >> 8，结果与 Pillow 一致
+        values += 128
+        values += values >> 8
+        values >>= 8
+        if order is None:
+            pixels[index, 0] = values
+        else:
+            pixels[index, :3] = values
+
+    @staticmethod
+    def _get_prepared(layer: Image.Image) -> _PreparedLayer:
+        """获取图层的预乘数据，同一图层对象（如缓存的水印图层）在多张图片间复用"""
+        key = id(layer)
+        cache = ImageCompositor._prepared_cache
+        with ImageCompositor._prepared_lock:
+            prepared = cache.get(key)
+            if prepared is not None and prepared.layer is layer:
+                cache.move_to_end(key)
+                return prepared
+            # 缓存中保留图层的引用，图层对象存活期间 id 不会被复用
+            prepared = _PreparedLayer(layer)
+            cache[key] = prepared
+            while len(cache) > ImageCompositor.PREPARED_CACHE_SIZE:
+                cache.popitem(last=False)
+        return prepared
@@ -1,14 +1,44 @@
+import atexit
+import copy
 import json
 import os
-from typing import Dict, Any
+import threading
+import weakref
+from typing import Dict, Any, List
+
+from modules.atomic_file import write_atomic
 
 class ConfigManager:
     """
     配置管理类，负责保存和加载水印配置
+
+    配置在首次读取后保存在内存中，只有配置文件被外部修改（修改时间或大小变化）时才重新读取。
+    修改会先标记为未保存，短暂延迟后合并为一次写入，写入时先写临时文件再重命名，
+    写入中途崩溃不会损坏原配置文件。
+
+    指定 template_db 时模板保存在 SQLite 模板库中（见 TemplateStore），适合大量模板，并支持按标签筛选。
     """
     
-    def __init__(self, config_file: str = "watermark_config.json"):
+    # 修改后延迟写入磁盘的时间（秒），期间的多次修改合并为一次写入
+    FLUSH_DELAY = 0.5
+    
+    def __init__(self, config_file: str = "watermark_config.json", flush_delay: float = None,
+                 template_db: str = None):
+        """
+        Args:
+            config_file: 配置文件路径
+            flush_delay: 修改后延迟写入的时间（秒），为 0 时立即写入
+            template_db: 模板数据库路径，为空时模板保存在配置文件中
+        """
         self.config_file = config_file
+        self.flush_delay = self.FLUSH_DELAY if flush_delay is None else flush_delay
+        self._config = None  # 内存中的配置
+        self._file_signature = None  # 读取或写入时配置文件的 (修改时间, 大小)
+        self._dirty = False  # 内存中的配置是否有未写入磁盘的修改
+        self._flush_timer = None
+        self._lock = threading.RLock()
+        # 程序退出时写入尚未保存的修改（只保存弱引用，不会阻止实例被回收）
+        atexit.register(ConfigManager._flush_at_exit, weakref.ref(self))
         self.default_config = {
             "text_watermark": {
                 "text": "水印文本",
@@ -25,22 +55,40 @@ class ConfigManager:
                 "shadow_offset": [2, 2],
                 "stroke": False,
                 "stroke_color": [0, 0, 0],
-                "stroke_width": 1
+                "stroke_width": 1,
+                "tiled": False,
+                "tile_spacing": [100, 100],
+                "tile_stagger": True
             },
             "image_watermark": {
                 "position": [0, 0],
                 "opacity": 128,
                 "scale": 1.0,
-                "rotation": 0
+                "rotation": 0,
+                "tiled": False,
+                "tile_spacing": [100, 100],
+                "tile_stagger": True
             },
             "last_used": {
                 "watermark_type": "text"
             }
         }
+        
+        self.template_store = None
+        if template_db:
+            # 只有使用模板库时才需要SQLite，在此处导入以加快启动
+            from modules.template_store import TemplateStore
+            try:
+                self.template_store = TemplateStore(template_db)
+                self._migrate_templates()
+            except Exception as e:
+                # 模板库不可用时继续使用配置文件保存模板
+                print(f"打开模板数据库失败: {str(e)}")
+                self.template_store = None
     
     def save_config(self, config: Dict[str, Any]) -> bool:
         """
-        保存配置到文件
+        保存配置（先更新内存，稍后合并写入文件）
         
         Args:
             config: 配置字典
@@ -48,32 +96,126 @@ class ConfigManager:
         Returns:
             是否保存成功
         """
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=4)
-            return True
-        except Exception as e:
-            print(f"保存配置失败: {str(e)}")
-            return False
+        with self._lock:
+            # 保存副本，调用方之后修改传入的字典不会影响内存中的配置
+            self._config = copy.deepcopy(config)
+            self._mark_dirty()
+        return True
     
     def load_config(self) -> Dict[str, Any]:
         """
-        从文件加载配置
+        加载配置
         
         Returns:
-            配置字典，如果文件不存在则返回默认配置
+            配置字典的副本，如果文件不存在则返回默认配置
         """
+        with self._lock:
+            return copy.deepcopy(self._get_config())
+    
+    def flush(self) -> bool:
+        """
+        立即将未保存的修改写入配置文件
+        
+        Returns:
+            是否保存成功
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty:
+                return True
+            try:
+                self._write_file(self._config)
+                self._file_signature = self._get_file_signature()
+                self._dirty = False
+                return True
+            except Exception as e:
+                print(f"保存配置失败: {str(e)}")
+                return False
+    
+    @staticmethod
+    def _flush_at_exit(manager_ref):
+        """程序退出时调用，实例仍存在时写入尚未保存的修改"""
+        manager = manager_ref()
+        if manager is not None:
+            manager.flush()
+    
+    def _get_config(self) -> Dict[str, Any]:
+        """返回内存中的配置，配置文件被外部修改时重新读取"""
+        if self._dirty:
+            # 有未写入的修改时以内存中的配置为准
+            return self._config
+        signature = self._get_file_signature()
+        if self._config is not None and signature == self._file_signature:
+            return self._config
         try:
-            if os.path.exists(self.config_file):
+            if signature is not None:
                 with open(self.config_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    self._config = json.load(f)
+                self._file_signature = signature
             else:
                 # 如果配置文件不存在，创建默认配置文件
-                self.save_config(self.default_config)
-                return self.default_config.copy()
+                self._config = copy.deepcopy(self.default_config)
+                self._mark_dirty()
         except Exception as e:
             print(f"加载配置失败: {str(e)}")
-            return self.default_config.copy()
+            self._config = copy.deepcopy(self.default_config)
+            self._file_signature = signature
+        return self._config
+    
+    def _get_file_signature(self):
+        """返回配置文件的 (修改时间, 大小)，文件不存在时返回 None"""
+        try:
+            stat = os.stat(self.config_file)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+    
+    def _mark_dirty(self):
+        """标记配置已修改，并安排延迟写入"""
+        self._dirty = True
+        if self.flush_delay <= 0:
+            self.flush()
+            return
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+    
+    def _write_file(self, config: Dict[str, Any]):
+        """先写入同目录下的临时文件再重命名覆盖，保证配置文件始终完整"""
+        data = json.dumps(config, ensure_ascii=False, indent=4).encode('utf-8')
+        write_atomic(self.config_file, lambda f: f.write(data))
+    
+    def _migrate_templates(self):
+        """模板库为空时导入配置文件中已有的模板，配置文件中的模板保持不变"""
+        if self.template_store.count() > 0:
+            return
+        templates = self.load_config().get("templates", {})
+        if templates:
+            count = self.template_store.import_templates(templates)
+            print(f"已将 {count} 个模板导入模板数据库")
+    
+    def _get_templates(self, template_type: str, create: bool = False) -> Dict[str, Any]:
+        """
+        返回内存中指定类型的模板字典（不是副本，返回给调用方前需要复制）
+        
+        Args:
+            template_type: 模板类型，text 或 image
+            create: 不存在时是否创建
+            
+        Returns:
+            模板字典，不存在且不创建时返回空字典
+        """
+        config = self._get_config()
+        templates = config.get("templates", {}).get(template_type)
+        if templates is None:
+            if not create:
+                return {}
+            templates = config.setdefault("templates", {}).setdefault(template_type, {})
+        return templates
     
     def save_text_watermark_template(self, name: str, settings: Dict[str, Any]) -> bool:
         """
@@ -87,14 +229,12 @@ class ConfigManager:
             是否保存成功
         """
         try:
-            config = self.load_config()
-            if "templates" not in config:
-                config["templates"] = {}
-            if "text" not in config["templates"]:
-                config["templates"]["text"] = {}
-            
-            config["templates"]["text"][name] = settings
-            return self.save_config(config)
+            if self.template_store is not None:
+                return self.template_store.save_template("text", name, settings)
+            with self._lock:
+                self._get_templates("text", create=True)[name] = copy.deepcopy(settings)
+                self._mark_dirty()
+            return True
         except Exception as e:
             print(f"保存文本水印模板失败: {str(e)}")
             return False
@@ -111,14 +251,12 @@ class ConfigManager:
             是否保存成功
         """
         try:
-            config = self.load_config()
-            if "templates" not in config:
-                config["templates"] = {}
-            if "image" not in config["templates"]:
-                config["templates"]["image"] = {}
-            
-            config["templates"]["image"][name] = settings
-            return self.save_config(config)
+            if self.template_store is not None:
+                return self.template_store.save_template("image", name, settings)
+            with self._lock:
+                self._get_templates("image", create=True)[name] = copy.deepcopy(settings)
+                self._mark_dirty()
+            return True
         except Exception as e:
             print(f"保存图片水印模板失败: {str(e)}")
             return False
@@ -134,10 +272,10 @@ class ConfigManager:
             模板设置，如果不存在则返回空字典
         """
         try:
-            config = self.load_config()
-            if "templates" in config and "text" in config["templates"] and name in config["templates"]["text"]:
-                return config["templates"]["text"][name]
-            return {}
+            if self.template_store is not None:
+                return self.template_store.get_template("text", name)
+            with self._lock:
+                return copy.deepcopy(self._get_templates("text").get(name, {}))
         except Exception as e:
             print(f"加载文本水印模板失败: {str(e)}")
             return {}
@@ -153,10 +291,10 @@ class ConfigManager:
             模板设置，如果不存在则返回空字典
         """
         try:
-            config = self.load_config()
-            if "templates" in config and "image" in config["templates"] and name in config["templates"]["image"]:
-                return config["templates"]["image"][name]
-            return {}
+            if self.template_store is not None:
+                return self.template_store.get_template("image", name)
+            with self._lock:
+                return copy.deepcopy(self._get_templates("image").get(name, {}))
         except Exception as e:
             print(f"加载图片水印模板失败: {str(e)}")
             return {}
@@ -169,10 +307,10 @@ class ConfigManager:
             文本水印模板字典
         """
         try:
-            config = self.load_config()
-            if "templates" in config and "text" in config["templates"]:
-                return config["templates"]["text"]
-            return {}
+            if self.template_store is not None:
+                return self.template_store.get_templates("text")
+            with self._lock:
+                return copy.deepcopy(self._get_templates("text"))
         except Exception as e:
             print(f"获取文本水印模板列表失败: {str(e)}")
             return {}
@@ -185,14 +323,36 @@ class ConfigManager:
             图片水印模板字典
         """
         try:
-            config = self.load_config()
-            if "templates" in config and "image" in config["templates"]:
-                return config["templates"]["image"]
-            return {}
+            if self.template_store is not None:
+                return self.template_store.get_templates("image")
+            with self._lock:
+                return copy.deepcopy(self._get_templates("image"))
         except Exception as e:
             print(f"获取图片水印模板列表失败: {str(e)}")
             return {}
     
+    def get_text_template_names(self, prefix: str = "", tag: str = None) -> List[str]:
+        """
+        获取文本水印模板名称，不读取模板内容
+        
+        Args:
+            prefix: 名称前缀，为空时返回全部
+            tag: 只返回带有该标签的模板（仅模板库支持标签）
+            
+        Returns:
+            模板名称列表
+        """
+        try:
+            if self.template_store is not None:
+                return self.template_store.list_names("text", prefix, tag=tag)
+            if tag is not None:
+                return []
+            with self._lock:
+                return [name for name in self._get_templates("text") if name.startswith(prefix)]
+        except Exception as e:
+            print(f"获取文本水印模板列表失败: {str(e)}")
+            return []
+    
     def delete_text_template(self, name: str) -> bool:
         """
         删除文本水印模板
@@ -204,15 +364,41 @@ class ConfigManager:
             是否删除成功
         """
         try:
-            config = self.load_config()
-            if "templates" in config and "text" in config["templates"] and name in config["templates"]["text"]:
-                del config["templates"]["text"][name]
-                return self.save_config(config)
-            return False
+            if self.template_store is not None:
+                return self.template_store.delete_template("text", name)
+            with self._lock:
+                templates = self._get_templates("text")
+                if name not in templates:
+                    return False
+                del templates[name]
+                self._mark_dirty()
+            return True
         except Exception as e:
             print(f"删除文本水印模板失败: {str(e)}")
             return False
     
+    def get_image_template_names(self, prefix: str = "", tag: str = None) -> List[str]:
+        """
+        获取图片水印模板名称，不读取模板内容
+        
+        Args:
+            prefix: 名称前缀，为空时返回全部
+            tag: 只返回带有该标签的模板（仅模板库支持标签）
+            
+        Returns:
+            模板名称列表
+        """
+        try:
+            if self.template_store is not None:
+                return self.template_store.list_names("image", prefix, tag=tag)
+            if tag is not None:
+                return []
+            with self._lock:
+                return [name for name in self._get_templates("image") if name.startswith(prefix)]
+        except Exception as e:
+            print(f"获取图片水印模板列表失败: {str(e)}")
+            return []
+    
     def delete_image_template(self, name: str) -> bool:
         """
         删除图片水印模板
@@ -224,11 +410,98 @@ class ConfigManager:
             是否删除成功
         """
         try:
-            config = self.load_config()
-            if "templates" in config and "image" in config["templates"] and name in config["templates"]["image"]:
-                del config["templates"]["image"][name]
-                return self.save_config(config)
-            return False
+            if self.template_store is not None:
+                return self.template_store.delete_template("image", name)
+            with self._lock:
+                templates = self._get_templates("image")
+                if name not in templates:
+                    return False
+                del templates[name]
+                self._mark_dirty()
+            return True
         except Exception as e:
             print(f"删除图片水印模板失败: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    def set_template_tags(self, template_type: str, name: str, tags: List[str]) -> bool:
+        """
+        设置模板标签（替换原有标签），只有使用模板库时支持
+        
+        Args:
+            template_type: 模板类型，text 或 image
+            name: 模板名称
+            tags: 标签列表
+            
+        Returns:
+            是否设置成功，模板不存在或未使用模板库时返回 False
+        """
+        if self.template_store is None:
+            return False
+        try:
+            return self.template_store.set_tags(template_type, name, tags)
+        except Exception as e:
+            print(f"设置模板标签失败: {str(e)}")
+            return False
+    
+    def get_template_tags(self, template_type: str, name: str) -> List[str]:
+        """
+        获取模板标签
+        
+        Args:
+            template_type: 模板类型，text 或 image
+            name: 模板名称
+            
+        Returns:
+            标签列表，未使用模板库时返回空列表
+        """
+        if self.template_store is None:
+            return []
+        try:
+            return self.template_store.get_tags(template_type, name)
+        except Exception as e:
+            print(f"获取模板标签失败: {str(e)}")
+            return []
+    
+    def export_templates(self) -> Dict[str, Any]:
+        """
+        导出全部模板，格式与配置文件中的 templates 相同
+        
+        Returns:
+            {"text": {名称: 设置}, "image": {名称: 设置}}
+        """
+        try:
+            if self.template_store is not None:
+                return self.template_store.export_templates()
+            with self._lock:
+                return {template_type: copy.deepcopy(self._get_templates(template_type))
+                        for template_type in ("text", "image")}
+        except Exception as e:
+            print(f"导出模板失败: {str(e)}")
+            return {"text": {}, "image": {}}
+    
+    def import_templates(self, templates: Dict[str, Any]) -> int:
+        """
+        导入 export_templates 格式的模板，同名模板会被覆盖
+        
+        Args:
+            templates: {"text": {名称: 设置}, "image": {名称: 设置}}
+            
+        Returns:
+            导入的模板数量，失败时返回 0
+        """
+        try:
+            if self.template_store is not None:
+                return self.template_store.import_templates(templates)
+            count = 0
+            with self._lock:
+                for template_type in ("text", "image"):
+                    items = templates.get(template_type, {})
+                    if items:
+                        self._get_templates(template_type, create=True).update(copy.deepcopy(items))
+                        count += len(items)
+                if count:
+                    self._mark_dirty()
+            return count
+        except Exception as e:
+            print(f"导入模板失败: {str(e)}")
+            return 0
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Any
+
+from modules.atomic_file import write_atomic
+
+class ExportManifest:
+    """
+    增量导出清单，保存在导出目录中
+
+    记录每张原图导出时的文件大小、修改时间和导出路径，以及导出时全部水印设置的哈希值。
+    再次导出到同一目录时，原图和设置都没有改变且导出文件仍然存在的图片可以直接跳过；
+    水印设置改变时清单失效，全部图片重新导出。
+    """
+
+    # 清单文件名
+    MANIFEST_NAME = ".watermark_manifest.json"
+    # 清单格式版本
+    VERSION = 1
+    # 每记录多少张图片写入一次清单，导出中途中断时已完成的图片不需要重新导出
+    SAVE_INTERVAL = 200
+
+    def __init__(self, output_dir: str, settings_hash: str):
+        """
+        Args:
+            output_dir: 导出目录
+            settings_hash: 当前水印设置的哈希值，见 compute_settings_hash
+        """
+        self.manifest_path = os.path.join(output_dir, self.MANIFEST_NAME)
+        self.settings_hash = settings_hash
+        self._files = {}  # {原图绝对路径: {"size", "mtime_ns", "output"}}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        # 保存清单的锁：复制记录和写入文件在同一把锁内完成，较早的快照不会覆盖较新的清单
+        self._save_lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def compute_settings_hash(watermark, extra: Dict[str, Any] = None) -> str:
+        """
+        计算水印设置的哈希值
+
+        Args:
+            watermark: TextWatermark 或 ImageWatermark 实例，包含其全部参数和水印图片内容
+            extra: 其他影响导出结果的参数（如编码参数）
+
+        Returns:
+            十六进制哈希值
+        """
+        digest = hashlib.sha1()
+        settings = {
+            "type": type(watermark).__name__,
+            "settings": watermark.get_settings(),
+            "extra": extra or {}
+        }
+        digest.update(json.dumps(settings, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        watermark_image = getattr(watermark, "watermark_image", None)
+        if watermark_image is not None:
+            # 图片水印按像素内容计算，替换同名水印图片文件也能识别
+            digest.update(f"{watermark_image.mode}{watermark_image.size}".encode("utf-8"))
+            digest.update(watermark_image.tobytes())
+        return digest.hexdigest()
+
+    def _load(self):
+        """读取已有清单，水印设置不同或清单损坏时从空清单开始"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"读取导出清单失败: {str(e)}")
+            return
+        if manifest.get("version") == self.VERSION and manifest.get("settings_hash") == self.settings_hash:
+            self._files = manifest.get("files", {})
+
+    def check(self, file_path: str, output_path: str):
+        """
+        检查图片是否需要导出
+
+        Args:
+            file_path: 原图路径
+            output_path: 导出路径
+
+        Returns:
+            (是否可以跳过, 原图当前的 (大小, 修改时间))，原图无法读取时后者为 None
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False, None
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._files.get(os.path.abspath(file_path))
+        unchanged = (
+            entry is not None
+            and (entry.get("size"), entry.get("mtime_ns")) == signature
+            and entry.get("output") == os.path.abspath(output_path)
+            and os.path.exists(output_path)
+        )
+        return unchanged, signature
+
+    def record(self, file_path: str, output_path: str, signature: tuple):
+        """
+        记录已成功导出的图片
+
+        Args:
+            file_path: 原图路径
+            output_path: 导出路径
+            signature: 检查时原图的 (大小, 修改时间)，导出期间原图被修改时下次仍会重新导出
+        """
+        with self._lock:
+            self._files[os.path.abspath(file_path)] = {
+                "size": signature[0],
+                "mtime_ns": signature[1],
+                "output": os.path.abspath(output_path)
+            }
+            self._unsaved += 1
+            should_save = self._unsaved >= self.SAVE_INTERVAL
+        if should_save:
+            self.save()
+
+    def save(self) -> bool:
+        """
+        写入清单文件（先写临时文件再重命名）
+
+        Returns:
+            是否保存成功
+        """
+        with self._save_lock:
+            # 写入期间只持有保存锁，其他线程仍可以继续记录
+            with self._lock:
+                manifest = {
+                    "version": self.VERSION,
+                    "settings_hash": self.settings_hash,
+                    "files": dict(self._files)
+                }
+                self._unsaved = 0
+            try:
+                data = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+                write_atomic(self.manifest_path, lambda f: f.write(data))
+                return True
+            except Exception as e:
+                print(f"保存导出清单失败: {str(e)}")
+                return False
@@ -0,0 +1,298 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+from modules.batch_processor import BatchProcessor, BatchResult
+from modules.profiler import Profiler
+
+# 队列结束标记
+_END = object()
+
+
+class StageStats:
+    """
+    流水线单个阶段的统计信息
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0  # 处理耗时总和（秒）
+        self.wait_input = 0.0  # 等待上游数据的时间总和（秒）
+        self.wait_output = 0.0  # 下游队列已满、等待放入的时间总和（秒）
+        self.elapsed = 0.0  # 流水线总耗时（秒）
+        self._lock = threading.Lock()
+
+    def add(self, busy: float, wait_input: float, wait_output: float):
+        with self._lock:
+            self.items += 1
+            self.busy += busy
+            self.wait_input += wait_input
+            self.wait_output += wait_output
+
+    @property
+    def utilization(self) -> float:
+        """阶段内线程处于处理状态的时间占比（0-1）"""
+        capacity = self.workers * self.elapsed
+        return self.busy / capacity if capacity > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "busy": self.busy,
+            "wait_input": self.wait_input,
+            "wait_output": self.wait_output,
+            "utilization": self.utilization
+        }
+
+
+def format_stage_stats(stage_stats: List[StageStats]) -> List[str]:
+    """
+    将各阶段统计格式化为可读的文本行，并指出利用率最高（最可能是瓶颈）的阶段
+    """
+    lines = [f"{'阶段':<8}{'线程':>6}{'数量':>8}{'处理(s)':>10}{'等待输入(s)':>12}{'等待输出(s)':>12}{'利用率':>8}"]
+    for stats in stage_stats:
+        lines.append(
+            f"{stats.name:<8}{stats.workers:>6}{stats.items:>8}{stats.busy:>10.2f}"
+            f"{stats.wait_input:>12.2f}{stats.wait_output:>12.2f}{stats.utilization:>8.0%}"
+        )
+    if stage_stats:
+        bottleneck = max(stage_stats, key=lambda stats: stats.utilization)
+        lines.append(f"瓶颈阶段: {bottleneck.name}")
+    return lines
+
+
+class _Stage:
+    """流水线中的一个阶段：若干线程从输入队列取数据，处理后放入输出队列"""
+
+    def __init__(self, name: str, workers: int, func: Callable, input_queue: queue.Queue):
+        self.name = name
+        self.workers = workers
+        self.func = func
+        self.input_queue = input_queue
+        self.output_queue = None
+        self.next_stage = None
+        self.stats = StageStats(name, workers)
+        self._remaining = workers
+        self._lock = threading.Lock()
+
+    def worker_finished(self) -> bool:
+        """线程退出时调用，返回是否为本阶段最后一个退出的线程"""
+        with self._lock:
+            self._remaining -= 1
+            return self._remaining == 0
+
+
+class ExportPipeline(BatchProcessor):
+    """
+    流水线导出：读取 -> 解码/合成 -> 编码 -> 写入
+
+    各阶段使用独立的线程，阶段之间通过有界队列连接。磁盘读写与解码、合成、编码同时进行，
+    下游处理不过来时上游会被阻塞，内存中同时存在的图片数量有上限。
+    Pillow 在解码、编码和大部分图像运算时会释放GIL，多个线程可以同时使用多个CPU核心。
+    """
+
+    # 读取和写入阶段的默认线程数
+    DEFAULT_IO_THREADS = 2
+
+    def __init__(self, watermark, output_dir: str, workers: int = None, suffix: str = "_watermarked",
+                 input_root: str = None, incremental: bool = False, encode_profile: str = None,
+                 large_image_pixels: int = None, memory_budget: int = None, io_threads: int = None,
+                 queue_size: int = None):
+        """
+        Args:
+            watermark: TextWatermark 或 ImageWatermark 实例
+            output_dir: 导出目录
+            workers: 解码/合成和编码阶段的线程数，默认使用全部CPU核心
+            suffix: 导出文件名后缀
+            input_root: 导入的根文件夹，提供时在导出目录中保留子文件夹结构
+            incremental: 是否增量导出，跳过原图和水印设置都未改变的图片
+            encode_profile: 编码速度配置（fast/balanced/smallest）
+            large_image_pixels: 使用大图模式的像素数阈值，大图不读入内存，在解码合成阶段直接处理并写入
+            memory_budget: 大图模式下单张图片的内存预算（字节）
+            io_threads: 读取和写入阶段的线程数
+            queue_size: 阶段之间队列的容量，决定内存中最多缓存的图片数量
+        """
+        super().__init__(watermark, output_dir, workers, suffix, input_root, incremental, encode_profile,
+                         large_image_pixels, memory_budget)
+        self.io_threads = io_threads or self.DEFAULT_IO_THREADS
+        self.queue_size = queue_size or max(2, self.workers)
+        self._stop_event = None  # 正在运行的流水线的停止标记
+
+    def cancel(self):
+        """
+        请求取消导出（可在其他线程中调用）
+
+        各阶段线程在取下一项数据前停止，正在写入的图片会完整写入，不会留下不完整的文件。
+        """
+        super().cancel()
+        stop_event = self._stop_event
+        if stop_event is not None:
+            stop_event.set()
+
+    # 以下各阶段中，大图以 None 表示：不读入内存，在解码合成阶段按大图模式直接处理并写入
+
+    def _read(self, file_path: str, _):
+        if self.is_large_image(file_path):
+            return None
+        return self.file_handler.read_file(file_path)
+
+    def _render(self, file_path: str, data: bytes):
+        if data is None:
+            self.process_large_file(file_path)
+            return None
+        return self.render_file(file_path, data)
+
+    def _encode(self, file_path: str, image):
+        if image is None:
+            return None
+        output_path = self.prepare_output_path(file_path)
+        return output_path, self.file_handler.encode_image(image, output_path, profile=self.encode_profile)
+
+    def _write(self, file_path: str, encoded):
+        if encoded is not None:
+            output_path, data = encoded
+            self.file_handler.write_file(data, output_path)
+        return None
+
+    def run(self, file_paths: Iterable[str],
+            progress_callback: Callable[[int, Optional[int], str, Optional[str]], None] = None) -> BatchResult:
+        """
+        批量处理图片
+
+        Args:
+            file_paths: 图片路径列表或可迭代对象
+            progress_callback: 进度回调 (已处理数量, 总数量或None, 文件路径, 错误信息或None)
+
+        Returns:
+            批处理结果统计，stage_stats 中包含各阶段的统计信息
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        result = BatchResult()
+        start_time = time.perf_counter()
+        Profiler.reset()
+        file_paths, total, manifest, pending = self._prepare_run(file_paths, result)
+
+        stop_event = threading.Event()
+        self._stop_event = stop_event
+        if self.is_cancelled():
+            stop_event.set()
+        result_queue = queue.Queue()
+        input_queue = queue.Queue(self.queue_size)
+        stages = [
+            _Stage("读取", self.io_threads, self._read, input_queue),
+            _Stage("解码合成", self.workers, self._render, queue.Queue(self.queue_size)),
+            _Stage("编码", self.workers, self._encode, queue.Queue(self.queue_size)),
+            _Stage("写入", self.io_threads, self._write, queue.Queue(self.queue_size)),
+        ]
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+            stage.output_queue = next_stage.input_queue
+        stages[-1].output_queue = result_queue
+
+        feeder_errors = []
+        # 线程按阶段命名，便于在性能时间线中区分
+        threads = [threading.Thread(
+            target=self._feed, args=(file_paths, stages[0], stop_event, feeder_errors), daemon=True,
+            name="扫描"
+        )]
+        for stage in stages:
+            for index in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._stage_worker, args=(stage, result_queue, stop_event), daemon=True,
+                    name=f"{stage.name}-{index + 1}"
+                ))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = result_queue.get()
+                if item is _END:
+                    break
+                file_path, error = item
+                self._record_result(result, file_path, error, manifest, pending)
+                if progress_callback:
+                    progress_callback(result.total, total, file_path, error)
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+            if manifest is not None:
+                manifest.save()
+            result.elapsed = time.perf_counter() - start_time
+            for stage in stages:
+                stage.stats.elapsed = result.elapsed
+            result.stage_stats = [stage.stats for stage in stages]
+            result.cancelled = self.is_cancelled()
+            self._stop_event = None
+            self._collect_profile(result)
+
+        if feeder_errors:
+            raise feeder_errors[0]
+        return result
+
+    def _feed(self, file_paths: Iterable[str], first_stage: _Stage, stop_event: threading.Event, errors: list):
+        """将图片路径逐个放入第一阶段的输入队列（支持边扫描边导出）"""
+        try:
+            for file_path in file_paths:
+                if not self._put(first_stage.input_queue, (file_path, None), stop_event):
+                    return
+        except Exception as e:
+            errors.append(e)
+        for _ in range(first_stage.workers):
+            self._put(first_stage.input_queue, _END, stop_event)
+
+    def _stage_worker(self, stage: _Stage, result_queue: queue.Queue, stop_event: threading.Event):
+        """阶段线程：循环取数据处理，处理失败的图片直接记录到结果队列"""
+        while True:
+            wait_start = time.perf_counter()
+            item = self._get(stage.input_queue, stop_event)
+            busy_start = time.perf_counter()
+            if item is _END or stop_event.is_set():
+                # 取消后队列中剩余的数据不再处理
+                break
+            file_path, payload = item
+            try:
+                output = (file_path, stage.func(file_path, payload))
+            except Exception as e:
+                output = None
+                result_queue.put((file_path, str(e)))
+            busy_end = time.perf_counter()
+            if output is not None and not self._put(stage.output_queue, output, stop_event):
+                break
+            stage.stats.add(busy_end - busy_start, busy_start - wait_start, time.perf_counter() - busy_end)
+
+        if stage.worker_finished():
+            # 本阶段全部结束后通知下游阶段
+            if stage.next_stage is None:
+                result_queue.put(_END)
+            else:
+                for _ in range(stage.next_stage.workers):
+                    self._put(stage.output_queue, _END, stop_event)
+
+    @staticmethod
+    def _get(item_queue: queue.Queue, stop_event: threading.Event):
+        """从队列取数据，流水线被停止时返回结束标记"""
+        while True:
+            try:
+                return item_queue.get(timeout=0.1)
+            except queue.Empty:
+                if stop_event.is_set():
+                    return _END
+
+    @staticmethod
+    def _put(item_queue: queue.Queue, item, stop_event: threading.Event) -> bool:
+        """向有界队列放入数据，队列已满时等待，流水线被停止时返回 False"""
+        while True:
+            try:
+                item_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if stop_event.is_set():
+                    return False
@@ -1,6 +1,11 @@
+import fnmatch
+import io
 import os
 from PIL import Image
-from typing import List
+from typing import Iterator, List
+
+from modules.atomic_file import write_atomic
+from modules.profiler import Profiler
 
 class FileHandler:
     """
@@ -8,71 +13,331 @@ class FileHandler:
     """
     
     # 支持的图片格式
-    SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+    SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
+    
+    # 支持格式的文件头特征，用于不依赖扩展名识别图片
+    MAGIC_SIGNATURES = (
+        b'\xff\xd8\xff',           # JPEG
+        b'\x89PNG\r\n\x1a\n',      # PNG
+        b'BM',                     # BMP
+        b'II*\x00', b'MM\x00*',    # TIFF
+    )
+    
+    # 编码速度配置：在导出速度和文件大小之间取舍
+    # fast: 不做额外的霍夫曼优化，PNG使用最低压缩级别，适合赶时间的批量导出
+    # balanced: 与以前的默认设置相同
+    # smallest: 渐进式JPEG，PNG最高压缩级别，WebP最慢的压缩方法，文件最小
+    ENCODE_PROFILES = {
+        "fast": {
+            "JPEG": {"optimize": False, "progressive": False, "subsampling": "4:2:0"},
+            "PNG": {"compress_level": 1},
+            "WEBP": {"method": 0},
+        },
+        "balanced": {
+            "JPEG": {"optimize": True},
+            "PNG": {"compress_level": 6},
+            "WEBP": {"method": 4},
+        },
+        "smallest": {
+            "JPEG": {"optimize": True, "progressive": True, "subsampling": "4:2:0"},
+            "PNG": {"compress_level": 9},
+            "WEBP": {"method": 6},
+        },
+    }
+    DEFAULT_ENCODE_PROFILE = "balanced"
     
     def __init__(self):
         pass
     
-    def load_image(self, file_path: str) -> Image.Image:
+    def load_image(self, file_path: str, target_size: tuple = None, data: bytes = None) -> Image.Image:
         """
         加载单个图片文件
         
         Args:
             file_path: 图片文件路径
+            target_size: 目标显示范围 (width, height)，提供时以缩小的分辨率解码（用于预览和缩略图），
+                         解码结果不小于按比例缩放到该范围内的尺寸
+            data: 已读入内存的文件内容，提供时直接从内存解码，不再读取文件
             
         Returns:
             PIL Image对象
         """
         try:
-            image = Image.open(file_path)
+            with Profiler.stage("open"):
+                image = Image.open(io.BytesIO(data) if data is not None else file_path)
             # 保持原格式信息
             image.format = image.format if image.format else 'JPEG'
+            if target_size:
+                image = self._reduce_on_load(image, target_size)
             return image
         except Exception as e:
             raise Exception(f"无法加载图片 {file_path}: {str(e)}")
     
-    def load_images_from_folder(self, folder_path: str) -> List[str]:
+    def _reduce_on_load(self, image: Image.Image, target_size: tuple) -> Image.Image:
+        """
+        以缩小的分辨率解码图片
+        
+        JPEG通过DCT缩放（draft）直接按 1/2、1/4、1/8 解码，不需要完整解码原图；
+        其他格式解码后用 reduce() 按整数倍缩小。
+        """
+        ratio = min(target_size[0] / image.width, target_size[1] / image.height)
+        if ratio >= 1:
+            return image
+        needed_size = (max(1, int(image.width * ratio)), max(1, int(image.height * ratio)))
+        
+        if image.format == 'JPEG':
+            image.draft(image.mode, needed_size)
+            return image
+        
+        factor = min(image.width // needed_size[0], image.height // needed_size[1])
+        if factor < 2:
+            return image
+        try:
+            reduced = image.reduce(factor)
+        except ValueError:
+            # 部分图像模式（如调色板模式）不支持 reduce
+            return image
+        reduced.format = image.format
+        return reduced
+    
+    def read_file(self, file_path: str) -> bytes:
+        """
+        读取文件的全部内容
+        
+        Args:
+            file_path: 文件路径
+            
+        Returns:
+            文件内容
+        """
+        try:
+            with Profiler.stage("read"), open(file_path, 'rb') as f:
+                return f.read()
+        except Exception as e:
+            raise Exception(f"无法读取文件 {file_path}: {str(e)}")
+    
+    def load_images_from_folder(self, folder_path: str, recursive: bool = False) -> List[str]:
         """
         从文件夹加载所有支持的图片文件路径
         
         Args:
             folder_path: 文件夹路径
+            recursive: 是否包含子文件夹
             
         Returns:
             图片文件路径列表
         """
         image_files = []
         try:
-            for filename in os.listdir(folder_path):
-                if filename.lower().endswith(self.SUPPORTED_FORMATS):
-                    image_files.append(os.path.join(folder_path, filename))
+            for batch in self.iter_images_from_folder(folder_path, recursive=recursive):
+                image_files.extend(batch)
             return image_files
         except Exception as e:
             raise Exception(f"无法读取文件夹 {folder_path}: {str(e)}")
     
-    def save_image(self, image: Image.Image, output_path: str, quality: int = 95):
+    def iter_images_from_folder(self, folder_path: str, recursive: bool = False,
+                                include: List[str] = None, exclude: List[str] = None,
+                                sniff: bool = False, batch_size: int = 256) -> Iterator[List[str]]:
+        """
+        逐批枚举文件夹中的图片文件路径，无需等待整个文件夹列举完成即可开始处理
+        
+        Args:
+            folder_path: 文件夹路径
+            recursive: 是否递归进入子文件夹
+            include: 文件名通配符列表（如 ["IMG_*"]），提供时只返回匹配的文件
+            exclude: 要排除的文件名或文件夹名通配符列表（如 ["*_watermarked.*", "@eaDir"]）
+            sniff: 为True时根据文件头识别图片格式，而不是根据扩展名
+            batch_size: 每批返回的路径数量
+            
+        Returns:
+            图片文件路径列表的迭代器
+        """
+        batch = []
+        pending_dirs = [folder_path]
+        while pending_dirs:
+            current_dir = pending_dirs.pop()
+            sub_dirs = []
+            try:
+                with os.scandir(current_dir) as entries:
+                    for entry in entries:
+                        if exclude and self._match_patterns(entry.name, exclude):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if recursive:
+                                    sub_dirs.append(entry.path)
+                                continue
+                            if not entry.is_file():
+                                continue
+                        except OSError:
+                            continue
+                        
+                        if include and not self._match_patterns(entry.name, include):
+                            continue
+                        if sniff:
+                            if not self._sniff_image(entry.path):
+                                continue
+                        elif not entry.name.lower().endswith(self.SUPPORTED_FORMATS):
+                            continue
+                        
+                        batch.append(entry.path)
+                        if len(batch) >= batch_size:
+                            yield batch
+                            batch = []
+            except OSError:
+                if current_dir == folder_path:
+                    raise
+                # 无法访问的子文件夹直接跳过
+                continue
+            # 按名称顺序处理子文件夹
+            pending_dirs.extend(sorted(sub_dirs, reverse=True))
+        
+        if batch:
+            yield batch
+    
+    def _match_patterns(self, name: str, patterns: List[str]) -> bool:
+        """文件名是否匹配任一通配符（不区分大小写）"""
+        name = name.lower()
+        return any(fnmatch.fnmatch(name, pattern.lower()) for pattern in patterns)
+    
+    def _sniff_image(self, file_path: str) -> bool:
+        """根据文件头判断是否为支持的图片格式"""
+        try:
+            with open(file_path, 'rb') as f:
+                header = f.read(12)
+        except OSError:
+            return False
+        if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+            return True
+        return header.startswith(self.MAGIC_SIGNATURES)
+    
+    def save_image(self, image: Image.Image, output_path: str, quality: int = 95, profile: str = None):
         """
         保存图片到指定路径
         
         Args:
             image: PIL Image对象
             output_path: 输出路径
-            quality: JPEG质量 (1-100)
+            quality: JPEG/WebP质量 (1-100)
+            profile: 编码速度配置名称，见 ENCODE_PROFILES，默认 balanced
         """
         try:
-            if image.mode in ('RGBA', 'LA') and output_path.lower().endswith(('.jpg', '.jpeg')):
-                # 如果是带透明通道的图片但要保存为JPEG，需要转换
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
+            image, image_format, params = self._prepare_for_save(image, output_path, quality, profile)
+            with Profiler.stage("save"):
+                self._write_atomic(output_path, lambda f: image.save(f, image_format, **params))
+        except Exception as e:
+            raise Exception(f"无法保存图片到 {output_path}: {str(e)}")
+    
+    def encode_image(self, image: Image.Image, output_path: str, quality: int = 95, profile: str = None) -> bytes:
+        """
+        按导出路径对应的格式将图片编码到内存，编码参数与 save_image 相同
+        
+        Args:
+            image: PIL Image对象
+            output_path: 输出路径（用于确定格式）
+            quality: JPEG/WebP质量 (1-100)
+            profile: 编码速度配置名称，见 ENCODE_PROFILES，默认 balanced
             
-            if output_path.lower().endswith(('.jpg', '.jpeg')):
-                image.save(output_path, 'JPEG', quality=quality, optimize=True)
-            else:
-                image.save(output_path, image.format if image.format else 'PNG')
+        Returns:
+            编码后的文件内容
+        """
+        try:
+            image, image_format, params = self._prepare_for_save(image, output_path, quality, profile)
+            buffer = io.BytesIO()
+            with Profiler.stage("encode"):
+                image.save(buffer, image_format, **params)
+            return buffer.getvalue()
+        except Exception as e:
+            raise Exception(f"无法编码图片 {output_path}: {str(e)}")
+    
+    def write_file(self, data: bytes, output_path: str):
+        """
+        将编码后的内容写入文件
+        
+        Args:
+            data: 文件内容
+            output_path: 输出路径
+        """
+        try:
+            with Profiler.stage("write"):
+                self._write_atomic(output_path, lambda f: f.write(data))
         except Exception as e:
             raise Exception(f"无法保存图片到 {output_path}: {str(e)}")
     
+    def _write_atomic(self, output_path: str, write_func):
+        """
+        先写入同目录下的临时文件，完成后再重命名为目标文件，
+        导出中断或取消时不会留下不完整的图片（见 atomic_file.write_atomic）
+        
+        Args:
+            output_path: 目标文件路径
+            write_func: 写入函数，参数为已打开的二进制文件对象
+        """
+        write_atomic(output_path, write_func)
+    
+    def get_encode_params(self, image_format: str, quality: int = 95, profile: str = None) -> dict:
+        """
+        获取指定格式和编码速度配置对应的保存参数
+        
+        Args:
+            image_format: PIL格式名称，如 JPEG、PNG、WEBP
+            quality: JPEG/WebP质量 (1-100)
+            profile: 编码速度配置名称，默认 balanced
+            
+        Returns:
+            传给 Image.save 的参数
+        """
+        profile = profile or self.DEFAULT_ENCODE_PROFILE
+        if profile not in self.ENCODE_PROFILES:
+            raise ValueError(f"未知的编码配置: {profile}")
+        params = dict(self.ENCODE_PROFILES[profile].get(image_format, {}))
+        if image_format in ('JPEG', 'WEBP'):
+            params["quality"] = quality
+        return params
+    
+    def _prepare_for_save(self, image: Image.Image, output_path: str, quality: int, profile: str = None):
+        """
+        根据输出路径确定保存格式和参数
+        
+        Returns:
+            (转换后的图片, 格式, 保存参数)
+        """
+        lower_path = output_path.lower()
+        if lower_path.endswith(('.jpg', '.jpeg')):
+            if image.mode in ('RGBA', 'LA'):
+                # 如果是带透明通道的图片但要保存为JPEG，需要转换
+                with Profiler.stage("convert"):
+                    background = Image.new('RGB', image.size, (255, 255, 255))
+                    background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+                image = background
+            image_format = 'JPEG'
+        elif lower_path.endswith('.webp'):
+            image_format = 'WEBP'
+        else:
+            image_format = image.format if image.format else 'PNG'
+        return image, image_format, self.get_encode_params(image_format, quality, profile)
+    
+    def get_output_path(self, file_path: str, output_dir: str, suffix: str = "_watermarked",
+                        input_root: str = None) -> str:
+        """
+        根据原文件名生成导出文件路径
+        
+        Args:
+            file_path: 原图片路径
+            output_dir: 导出目录
+            suffix: 添加在文件名后的后缀
+            input_root: 导入的根文件夹，提供时在导出目录中保留子文件夹结构，避免同名文件互相覆盖
+            
+        Returns:
+            导出文件路径
+        """
+        name, ext = os.path.splitext(os.path.basename(file_path))
+        if input_root:
+            relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(file_path)), os.path.abspath(input_root))
+            if relative_dir != os.curdir and not relative_dir.startswith(os.pardir):
+                output_dir = os.path.join(output_dir, relative_dir)
+        return os.path.join(output_dir, f"{name}{suffix}{ext}")
+    
     def get_supported_files(self, file_paths: List[str]) -> List[str]:
         """
         从文件列表中筛选出支持的图片格式
@@ -1,17 +1,31 @@
 from PIL import Image, ImageEnhance
-import os
+from collections import OrderedDict
+import threading
+
+from modules.compositor import ImageCompositor
+from modules.profiler import Profiler
 
 class ImageWatermark:
     """
     图片水印类，负责在图片上添加图片水印
     """
     
+    # 已处理水印图片缓存的最大数量
+    PREPARED_CACHE_SIZE = 4
+    # 已处理水印缓存的锁，导出流水线的多个合成线程会同时读写同一个缓存（类属性，实例仍可序列化给工作进程）
+    _cache_lock = threading.Lock()
+    
     def __init__(self):
         self.watermark_image = None
         self.position = (0, 0)  # 默认位置 (x, y)
         self.opacity = 128  # 透明度 0-255
         self.scale = 1.0  # 缩放比例
         self.rotation = 0  # 旋转角度
+        self.tiled = False  # 平铺覆盖整张图片
+        self.tile_spacing = (100, 100)  # 平铺时单元之间的间距 (水平, 垂直)
+        self.tile_stagger = True  # 平铺时奇数行错开半个单元
+        # 已处理好（缩放、透明度、旋转）的水印图片缓存，键为 (水印图片, 缩放, 透明度, 旋转)
+        self._prepared_cache = OrderedDict()
     
     def load_watermark(self, file_path: str):
         """
@@ -22,10 +36,13 @@ class ImageWatermark:
         """
         try:
             self.watermark_image = Image.open(file_path)
+            # 立即读入像素数据并释放文件句柄，避免多进程共享同一文件描述符
+            self.watermark_image.load()
             if self.watermark_image.mode != 'RGBA':
                 self.watermark_image = self.watermark_image.convert('RGBA')
         except Exception as e:
             raise Exception(f"无法加载水印图片 {file_path}: {str(e)}")
+        self._invalidate_prepared()
     
     def set_position(self, position: tuple):
         """设置水印位置 (x, y)"""
@@ -34,55 +51,186 @@ class ImageWatermark:
     def set_opacity(self, opacity: int):
         """设置透明度 (0-255)"""
         self.opacity = max(0, min(255, opacity))
+        self._invalidate_prepared()
     
     def set_scale(self, scale: float):
         """设置缩放比例"""
         self.scale = max(0.01, scale)  # 限制最小缩放为1%
+        self._invalidate_prepared()
     
     def set_rotation(self, rotation: int):
         """设置旋转角度"""
         self.rotation = rotation % 360
+        self._invalidate_prepared()
     
-    def add_watermark(self, image: Image.Image) -> Image.Image:
+    def set_tiling(self, tiled: bool, spacing: tuple = (100, 100), stagger: bool = True):
         """
-        在图片上添加图片水印
+        设置平铺模式：以 position 为起点按间距重复水印，旋转角度作用于每个单元
         
         Args:
-            image: 原始图片
+            tiled: 是否平铺
+            spacing: 单元之间的间距 (水平, 垂直)，可以为负数使单元重叠
+            stagger: 奇数行是否错开半个单元
+        """
+        self.tiled = tiled
+        self.tile_spacing = tuple(spacing)
+        self.tile_stagger = stagger
+    
+    def _invalidate_prepared(self):
+        """水印图片或设置改变时清空已处理水印缓存"""
+        self._prepared_cache = OrderedDict()
+    
+    def _get_prepared_watermark(self, render_scale: float = 1.0) -> Image.Image:
+        """
+        获取缩放、调整透明度并旋转后的水印图片，结果按设置缓存
+        
+        Args:
+            render_scale: 目标图片相对原图的缩放比例，与水印缩放比例相乘
             
         Returns:
-            添加水印后的图片
+            处理后的RGBA水印图片（调用方不应修改）
         """
-        if self.watermark_image is None:
-            return image
-            
-        # 复制原始图片避免修改原图
-        img = image.copy()
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
+        scale = self.scale * render_scale
+        key = (id(self.watermark_image), scale, self.opacity, self.rotation)
+        cache = self._prepared_cache
+        with self._cache_lock:
+            watermark = cache.get(key)
+            if watermark is not None:
+                cache.move_to_end(key)
+                return watermark
         
-        # 调整水印大小
-        watermark = self.watermark_image.copy()
-        if self.scale != 1.0:
-            new_width = int(watermark.width * self.scale)
-            new_height = int(watermark.height * self.scale)
-            watermark = watermark.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # 调整水印透明度
-        if self.opacity < 255:
-            alpha = watermark.split()[-1]  # 获取alpha通道
-            alpha = ImageEnhance.Brightness(alpha).enhance(self.opacity / 255.0)
-            watermark.putalpha(alpha)
+        # 在锁外处理，其他线程可以同时读取缓存
+        with Profiler.stage("logo_prepare"):
+            # 调整水印大小
+            watermark = self.watermark_image.copy()
+            if scale != 1.0:
+                new_width = max(1, int(watermark.width * scale))
+                new_height = max(1, int(watermark.height * scale))
+                watermark = watermark.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            
+            # 调整水印透明度
+            if self.opacity < 255:
+                alpha = watermark.split()[-1]  # 获取alpha通道
+                alpha = ImageEnhance.Brightness(alpha).enhance(self.opacity / 255.0)
+                watermark.putalpha(alpha)
         
         # 旋转水印
         if self.rotation != 0:
-            watermark = watermark.rotate(self.rotation, expand=True)
+            with Profiler.stage("rotate"):
+                watermark = watermark.rotate(self.rotation, expand=True)
+        
+        with self._cache_lock:
+            cache[key] = watermark
+            while len(cache) > self.PREPARED_CACHE_SIZE:
+                cache.popitem(last=False)
+        return watermark
+    
+    def get_settings(self) -> dict:
+        """
+        获取当前水印设置（不包含水印图片本身）
+        
+        Returns:
+            水印设置字典
+        """
+        return {
+            "position": self.position,
+            "opacity": self.opacity,
+            "scale": self.scale,
+            "rotation": self.rotation,
+            "tiled": self.tiled,
+            "tile_spacing": self.tile_spacing,
+            "tile_stagger": self.tile_stagger
+        }
+    
+    def snapshot(self) -> 'ImageWatermark':
+        """
+        复制当前设置到新的水印实例，供其他线程使用
+
+        只复制设置，之后对原实例的修改不会影响副本。水印图片不会被原地修改（重新加载时替换为新对象），
+        副本直接引用同一张图片；已处理水印缓存按设置区分并由锁保护，副本与原实例共用同一个缓存，
+        拖动水印时每次预览都能复用已处理好的水印。
+
+        Returns:
+            新的 ImageWatermark 实例
+        """
+        watermark = ImageWatermark()
+        watermark.apply_settings(self.get_settings())
+        watermark.watermark_image = self.watermark_image
+        watermark._prepared_cache = self._prepared_cache
+        return watermark
+    
+    def apply_settings(self, settings: dict):
+        """
+        应用水印设置，缺失的项使用默认值
+        
+        Args:
+            settings: 水印设置字典（如模板内容）
+        """
+        self.set_position(tuple(settings.get("position", (0, 0))))
+        self.set_opacity(settings.get("opacity", 128))
+        self.set_scale(settings.get("scale", 1.0))
+        self.set_rotation(settings.get("rotation", 0))
+        self.set_tiling(
+            settings.get("tiled", False),
+            tuple(settings.get("tile_spacing", (100, 100))),
+            settings.get("tile_stagger", True)
+        )
+    
+    def render_tile(self, image_size: tuple, render_scale: float = 1.0):
+        """
+        获取处理好的水印图片及其在图片中的位置，用于大图等只处理水印区域的场景
+        
+        Args:
+            image_size: 目标图片尺寸 (width, height)
+            render_scale: 图片相对原图的缩放比例
+            
+        Returns:
+            (RGBA水印图片, 左上角在图片中的位置)，未加载水印图片时返回 (None, (0, 0))
+        """
+        if self.watermark_image is None:
+            return None, (0, 0)
+        watermark = self._get_prepared_watermark(render_scale)
         
         # 确保水印位置在图片范围内
-        x = max(0, min(self.position[0], img.width - watermark.width))
-        y = max(0, min(self.position[1], img.height - watermark.height))
+        x = max(0, min(round(self.position[0] * render_scale), image_size[0] - watermark.width))
+        y = max(0, min(round(self.position[1] * render_scale), image_size[1] - watermark.height))
+        return watermark, (x, y)
+    
+    def render_placements(self, image_size: tuple, render_scale: float = 1.0) -> list:
+        """
+        获取需要合成到图片上的全部水印图层及其位置
+        
+        Args:
+            image_size: 目标图片尺寸 (width, height)
+            render_scale: 图片相对原图的缩放比例
+            
+        Returns:
+            [(RGBA水印图片, 左上角在图片中的位置)]，平铺模式下每行一项，未加载水印图片时为空列表
+        """
+        if self.watermark_image is None:
+            return []
+        if not self.tiled:
+            return [self.render_tile(image_size, render_scale)]
+        
+        cell = self._get_prepared_watermark(render_scale)
+        pitch = (cell.width + round(self.tile_spacing[0] * render_scale),
+                 cell.height + round(self.tile_spacing[1] * render_scale))
+        origin = (round(self.position[0] * render_scale), round(self.position[1] * render_scale))
+        return ImageCompositor.tile_placements(image_size, cell, pitch, origin, self.tile_stagger)
+    
+    def add_watermark(self, image: Image.Image, render_scale: float = 1.0) -> Image.Image:
+        """
+        在图片上添加图片水印
         
-        # 将水印粘贴到图片上
-        img.paste(watermark, (x, y), watermark)
+        Args:
+            image: 原始图片
+            render_scale: 图片相对原图的缩放比例，用于在缩小的预览图上按比例渲染水印
+            
+        Returns:
+            添加水印后的图片
+        """
+        if self.watermark_image is None:
+            return image
         
-        return img
\ No newline at end of file
+        # 获取缩放、调整透明度和旋转后的水印图片（同一设置只处理一次），只在水印覆盖的区域内合成
+        return ImageCompositor.composite_many(image, self.render_placements(image.size, render_scale))
\ No newline at end of file
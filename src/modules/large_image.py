@@ -0,0 +1,217 @@
+import os
+import shutil
+import threading
+import uuid
+from PIL import Image
+
+from modules.compositor import ImageCompositor
+from modules.profiler import Profiler
+
+# 临时放宽Pillow像素限制时使用的锁（见 LargeImageProcessor.open_image）
+_pixel_limit_lock = threading.Lock()
+
+
+class LargeImageProcessor:
+    """
+    大图水印处理类，内存占用由预算决定而不是由图片尺寸决定
+
+    未压缩的BMP/TIFF（按行或按块存储原始像素）：先把原文件按流复制到导出位置，
+    再只读取、合成并写回与水印区域相交的像素行，其余部分不解码。
+    其他格式（JPEG、PNG、压缩的TIFF等）Pillow 只能整张解码，无法按行分段读取和写回，
+    解码所需内存在预算内时按原模式解码一份后只在水印区域内合成，不再产生RGBA副本和整图大小的图层；
+    超出预算时拒绝处理并报错（与其他失败的图片一样记录在导出结果中），不会超出预算完整解码。
+    """
+
+    # 默认内存预算（字节）
+    DEFAULT_MEMORY_BUDGET = 1024 * 1024 * 1024
+    # 可以直接修改原始像素的图片模式
+    PATCHABLE_MODES = ('RGB', 'RGBA', 'L')
+
+    def __init__(self, memory_budget: int = None):
+        """
+        Args:
+            memory_budget: 内存预算（字节），为 0 时不限制
+        """
+        self.memory_budget = self.DEFAULT_MEMORY_BUDGET if memory_budget is None else memory_budget
+
+    @staticmethod
+    def estimate_decoded_size(image: Image.Image) -> int:
+        """估算完整解码图片需要的内存（字节）"""
+        return image.width * image.height * len(image.getbands())
+
+    def open_image(self, file_path: str) -> Image.Image:
+        """
+        打开大图（只读取文件头）
+
+        Pillow 默认拒绝打开超过约 1.8 亿像素的图片（解压炸弹保护），扫描件和全景图常常超过该限制。
+        设置了内存预算时，大图模式的内存占用由预算控制（完整解码前会检查预算），
+        因此只在这里打开文件时临时取消该限制，打开后立即恢复；未设置预算时保留Pillow的限制。
+        Pillow 只在打开文件时检查像素数，常规导出和预览不受影响。
+
+        Args:
+            file_path: 图片路径
+
+        Returns:
+            PIL Image对象（尚未解码）
+        """
+        if not self.memory_budget:
+            return Image.open(file_path)
+        with _pixel_limit_lock:
+            limit = Image.MAX_IMAGE_PIXELS
+            Image.MAX_IMAGE_PIXELS = None
+            try:
+                return Image.open(file_path)
+            finally:
+                Image.MAX_IMAGE_PIXELS = limit
+
+    def process(self, watermark, file_path: str, output_path: str, file_handler, profile: str = None) -> str:
+        """
+        为大图添加水印并保存
+
+        Args:
+            watermark: TextWatermark 或 ImageWatermark 实例
+            file_path: 原图路径
+            output_path: 导出路径
+            file_handler: FileHandler 实例，用于保存无法直接修改像素的图片
+            profile: 编码速度配置
+
+        Returns:
+            导出文件路径
+        """
+        try:
+            with self.open_image(file_path) as image:
+                placements = watermark.render_placements(image.size)
+                # 灰度图片上的彩色水印需要转换为RGB，无法直接改写原始像素
+                working_mode = ImageCompositor.working_mode(image.mode, [tile for tile, _ in placements])
+                layout = None
+                if working_mode == image.mode:
+                    layout = self._get_raw_layout(image, file_path, output_path)
+                if layout is not None:
+                    self._patch_copy(file_path, output_path, image, layout, placements)
+                else:
+                    self._process_decoded(image, output_path, placements, file_handler, profile)
+        except Exception as e:
+            raise Exception(f"无法处理大图 {file_path}: {str(e)}")
+        return output_path
+
+    def _get_raw_layout(self, image: Image.Image, file_path: str, output_path: str):
+        """
+        获取未压缩图片的像素布局，无法直接修改像素时返回 None
+
+        Returns:
+            [(块区域, 文件偏移, rawmode, 行跨度, 方向, 每行字节数)]
+        """
+        if os.path.splitext(file_path)[1].lower() != os.path.splitext(output_path)[1].lower():
+            return None
+        if image.mode not in self.PATCHABLE_MODES or not image.tile:
+            return None
+
+        layout = []
+        for tile in image.tile:
+            codec, extents, offset, args = tile[0], tile[1], tile[2], tile[3]
+            if codec != 'raw':
+                return None
+            if isinstance(args, str):
+                args = (args,)
+            rawmode = args[0]
+            stride = args[1] if len(args) > 1 else 0
+            orientation = args[2] if len(args) > 2 else 1
+            tile_width = extents[2] - extents[0]
+            try:
+                # 确认该排列方式可以打包回原始格式，并计算每行的字节数
+                row_bytes = len(Image.new(image.mode, (tile_width, 1)).tobytes('raw', rawmode))
+            except Exception:
+                return None
+            layout.append((extents, offset, rawmode, stride or row_bytes, orientation, row_bytes))
+        return layout
+
+    def _patch_copy(self, file_path: str, output_path: str, image: Image.Image, layout, placements):
+        """复制原文件后只改写与水印区域相交的像素，写入完成后再重命名为目标文件"""
+        output_dir, name = os.path.split(os.path.abspath(output_path))
+        temp_path = os.path.join(output_dir, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with Profiler.stage("copy_file"):
+                shutil.copyfile(file_path, temp_path)
+            with open(temp_path, 'r+b') as f:
+                # 平铺水印有多行，按顺序逐个改写（重叠的部分读取的是已合成的像素）
+                for tile, position in placements:
+                    box = ImageCompositor.clip_box(image.size, tile.size, position)
+                    if box is None:
+                        continue
+                    for tile_layout in layout:
+                        self._patch_tile(f, image.mode, tile_layout, box, tile, position)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _patch_tile(self, f, mode: str, tile_layout, box: tuple, tile: Image.Image, position: tuple):
+        """按内存预算分段改写一个像素块中与水印区域相交的行"""
+        extents, offset, rawmode, stride, orientation, row_bytes = tile_layout
+        left, top = max(box[0], extents[0]), max(box[1], extents[1])
+        right, bottom = min(box[2], extents[2]), min(box[3], extents[3])
+        if left >= right or top >= bottom:
+            return
+
+        tile_width = extents[2] - extents[0]
+        tile_height = extents[3] - extents[1]
+        if row_bytes % tile_width == 0:
+            # 每个像素占整数个字节时只读写水印覆盖的列
+            pixel_bytes = row_bytes // tile_width
+            column_offset = (left - extents[0]) * pixel_bytes
+            band_width = right - left
+        else:
+            column_offset = 0
+            left, right = extents[0], extents[2]
+            band_width = tile_width
+        band_row_bytes = len(Image.new(mode, (band_width, 1)).tobytes('raw', rawmode))
+
+        # 每行需要：原始数据 + 解码后的图片 + 合成时转换的RGBA区域
+        cost_per_row = band_width * (len(Image.new(mode, (1, 1)).getbands()) + 8) + band_row_bytes
+        rows_per_band = max(1, self.memory_budget // cost_per_row) if self.memory_budget else bottom - top
+
+        for band_top in range(top, bottom, rows_per_band):
+            band_bottom = min(bottom, band_top + rows_per_band)
+            row_offsets = []
+            for y in range(band_top, band_bottom):
+                row = y - extents[1]
+                file_row = row if orientation >= 0 else tile_height - 1 - row
+                row_offsets.append(offset + file_row * stride + column_offset)
+
+            data = bytearray()
+            with Profiler.stage("read"):
+                for row_offset in row_offsets:
+                    f.seek(row_offset)
+                    data += f.read(band_row_bytes)
+            # 直接在原始像素数据上合成，不需要时不转换为Pillow图片
+            with Profiler.stage("composite"):
+                ImageCompositor.blend_raw(data, (band_width, band_bottom - band_top), mode, rawmode,
+                                          tile, (position[0] - left, position[1] - band_top))
+
+            with Profiler.stage("write"):
+                for index, row_offset in enumerate(row_offsets):
+                    f.seek(row_offset)
+                    f.write(data[index * band_row_bytes:(index + 1) * band_row_bytes])
+
+    def _process_decoded(self, image: Image.Image, output_path: str, placements, file_handler, profile):
+        """无法分块的格式：解码所需内存在预算内时按原模式解码，只在水印区域内合成，超出预算时报错"""
+        working_mode = ImageCompositor.working_mode(image.mode, [tile for tile, _ in placements])
+        required = self.estimate_decoded_size(image)
+        if image.mode != working_mode:
+            # 转换模式时同时存在原图和转换后的副本
+            required += image.width * image.height * Image.getmodebands(working_mode)
+        if self.memory_budget and required > self.memory_budget:
+            raise Exception(f"{image.format or '该'}格式不支持分块处理，图片 {image.width}x{image.height} "
+                            f"完整解码约需 {required // (1024 * 1024)} MB，超出内存预算 "
+                            f"{self.memory_budget // (1024 * 1024)} MB（可增大 --memory-budget，"
+                            f"或转换为未压缩的BMP/TIFF后分块处理）")
+        image_format = image.format
+        with Profiler.stage("decode"):
+            image.load()
+        if image.mode != working_mode:
+            image = image.convert(working_mode)
+        for tile, position in placements:
+            ImageCompositor.composite_in_place(image, tile, position)
+        image.format = image_format
+        file_handler.save_image(image, output_path, profile=profile)
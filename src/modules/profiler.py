@@ -0,0 +1,321 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class StageHistogram:
+    """
+    单个阶段的耗时分布
+    """
+
+    # 直方图各区间的上限（毫秒），最后一个区间为超过最大上限的耗时
+    BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0  # 耗时总和（毫秒）
+        self.top_level_total = 0.0  # 不在其他阶段内时的耗时总和（毫秒），用于计算占比，避免嵌套阶段重复计算
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * (len(self.BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms: float, top_level: bool = True):
+        self.count += 1
+        self.total += elapsed_ms
+        if top_level:
+            self.top_level_total += elapsed_ms
+        self.min = elapsed_ms if self.min is None else min(self.min, elapsed_ms)
+        self.max = max(self.max, elapsed_ms)
+        for index, bound in enumerate(self.BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def merge(self, other: dict):
+        """合并 to_dict 格式的统计（来自工作进程）"""
+        if not other.get("count"):
+            return
+        self.count += other["count"]
+        self.total += other["total"]
+        self.top_level_total += other.get("top_level_total", other["total"])
+        self.min = other["min"] if self.min is None else min(self.min, other["min"])
+        self.max = max(self.max, other["max"])
+        for index, value in enumerate(other["buckets"]):
+            self.buckets[index] += value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """按直方图估算百分位耗时（毫秒），返回所在区间的上限（不超过实际最大值）"""
+        if not self.count:
+            return 0.0
+        target = self.count * percent / 100
+        seen = 0
+        for index, value in enumerate(self.buckets):
+            seen += value
+            if seen >= target:
+                bound = self.BUCKETS_MS[index] if index < len(self.BUCKETS_MS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "top_level_total": self.top_level_total,
+            "min": self.min,
+            "max": self.max,
+            "buckets": list(self.buckets)
+        }
+
+
+class _NullStage:
+    """统计关闭时使用的空上下文管理器，所有阶段共用同一个实例"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+# 每个线程当前所在阶段的嵌套层数
+_stage_depth = threading.local()
+
+
+class _Stage:
+    """记录一次阶段耗时的上下文管理器"""
+
+    __slots__ = ("name", "args", "start", "top_level")
+
+    def __init__(self, name: str, args: Optional[dict]):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        depth = getattr(_stage_depth, "value", 0)
+        self.top_level = depth == 0
+        _stage_depth.value = depth + 1
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter_ns() - self.start
+        _stage_depth.value -= 1
+        Profiler.record(self.name, self.start, duration, self.args, self.top_level)
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    """
+    按阶段统计耗时（默认关闭）
+
+    设置环境变量 WATERMARK_PROFILE=1 或调用 enable() 后开启，统计每个阶段的耗时分布；
+    设置 WATERMARK_TRACE=<文件或文件夹> 时同时记录每次调用的时间线，每批导出结束后写入
+    Chrome Trace 格式的 JSON（可在 chrome://tracing 或 Perfetto 中查看）。
+    关闭时 stage() 直接返回共用的空上下文管理器，几乎没有额外开销。
+
+    用法:
+        with Profiler.stage("encode"):
+            ...
+    """
+
+    ENABLE_ENV = "WATERMARK_PROFILE"
+    TRACE_ENV = "WATERMARK_TRACE"
+    # 时间线中最多保存的事件数量，超出后只统计不再记录
+    MAX_TRACE_EVENTS = 500000
+
+    _enabled = False
+    _trace_path = None
+    _stats = {}  # {阶段名称: StageHistogram}
+    _events = []  # Chrome Trace 事件
+    _thread_names = {}  # {(pid, tid): 线程名称}
+    _trace_count = 0  # 已写入的时间线文件数量，用于生成不重复的文件名
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure_from_env(cls):
+        """根据环境变量开启统计（模块导入时调用，使用 spawn 的工作进程也会读取）"""
+        trace_path = os.environ.get(cls.TRACE_ENV)
+        if trace_path or os.environ.get(cls.ENABLE_ENV, "").lower() in ("1", "true", "yes", "on"):
+            cls.enable(trace_path or None)
+
+    @classmethod
+    def enable(cls, trace_path: str = None):
+        """
+        开启统计
+
+        Args:
+            trace_path: 时间线输出路径，为文件夹时每批导出写入一个新文件，None 表示不记录时间线
+        """
+        cls._trace_path = trace_path
+        cls._enabled = True
+
+    @classmethod
+    def disable(cls):
+        """关闭统计并清空已有数据"""
+        cls._enabled = False
+        cls._trace_path = None
+        cls.reset()
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls._enabled
+
+    @classmethod
+    def get_trace_path(cls) -> Optional[str]:
+        return cls._trace_path
+
+    @classmethod
+    def reset(cls):
+        """清空统计和时间线"""
+        with cls._lock:
+            cls._stats = {}
+            cls._events = []
+            cls._thread_names = {}
+
+    @staticmethod
+    def stage(name: str, **args):
+        """
+        返回记录一个阶段耗时的上下文管理器
+
+        Args:
+            name: 阶段名称
+            args: 写入时间线的附加信息（如文件名）
+        """
+        if not Profiler._enabled:
+            return _NULL_STAGE
+        return _Stage(name, args or None)
+
+    @classmethod
+    def record(cls, name: str, start_ns: int, duration_ns: int, args: dict = None, top_level: bool = True):
+        """
+        记录一次阶段耗时
+
+        Args:
+            top_level: 是否不在其他阶段内，嵌套阶段的耗时已包含在外层阶段中，不计入占比
+        """
+        with cls._lock:
+            stats = cls._stats.get(name)
+            if stats is None:
+                stats = cls._stats[name] = StageHistogram()
+            stats.add(duration_ns / 1e6, top_level)
+            if cls._trace_path and len(cls._events) < cls.MAX_TRACE_EVENTS:
+                pid, thread = os.getpid(), threading.current_thread()
+                event = {
+                    "name": name, "cat": "watermark", "ph": "X",
+                    "ts": start_ns / 1000, "dur": duration_ns / 1000,
+                    "pid": pid, "tid": thread.ident
+                }
+                if args:
+                    event["args"] = args
+                cls._events.append(event)
+                cls._thread_names.setdefault((pid, thread.ident), thread.name)
+
+    @classmethod
+    def take_data(cls) -> dict:
+        """
+        取出并清空当前进程的统计数据，用于工作进程把数据传回主进程
+
+        Returns:
+            {"stats": {阶段: to_dict()}, "events": [...], "threads": [[pid, tid, 名称]]}
+        """
+        with cls._lock:
+            data = {
+                "stats": {name: stats.to_dict() for name, stats in cls._stats.items()},
+                "events": cls._events,
+                "threads": [[pid, tid, name] for (pid, tid), name in cls._thread_names.items()]
+            }
+            cls._stats = {}
+            cls._events = []
+            cls._thread_names = {}
+        return data
+
+    @classmethod
+    def merge_data(cls, data: dict):
+        """合并工作进程通过 take_data 传回的统计数据"""
+        with cls._lock:
+            for name, other in data.get("stats", {}).items():
+                stats = cls._stats.get(name)
+                if stats is None:
+                    stats = cls._stats[name] = StageHistogram()
+                stats.merge(other)
+            room = cls.MAX_TRACE_EVENTS - len(cls._events)
+            if room > 0:
+                cls._events.extend(data.get("events", [])[:room])
+            for pid, tid, name in data.get("threads", []):
+                cls._thread_names.setdefault((pid, tid), name)
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, StageHistogram]:
+        """获取各阶段的耗时分布"""
+        with cls._lock:
+            return dict(cls._stats)
+
+    @classmethod
+    def write_trace(cls, path: str = None) -> Optional[str]:
+        """
+        写入 Chrome Trace 格式的时间线
+
+        Args:
+            path: 输出路径，默认使用开启统计时指定的路径；为文件夹时在其中生成带时间的文件名
+
+        Returns:
+            实际写入的文件路径，没有时间线时返回 None
+        """
+        path = path or cls._trace_path
+        if not path:
+            return None
+        with cls._lock:
+            events = list(cls._events)
+            thread_names = dict(cls._thread_names)
+            cls._trace_count += 1
+            count = cls._trace_count
+        if os.path.isdir(path):
+            path = os.path.join(path, f"trace_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{count}.json")
+
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for (pid, tid), name in thread_names.items()
+        ]
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"写入性能时间线失败: {str(e)}")
+            return None
+        return path
+
+    @staticmethod
+    def format_stats(stats: Dict[str, StageHistogram]) -> List[str]:
+        """
+        将各阶段的耗时分布格式化为可读的文本行，按总耗时从高到低排列
+
+        占比只按不在其他阶段内的耗时计算（如 render 中的 rotate 不重复计入），各行占比之和为100%；
+        只出现在其他阶段内的阶段占比显示为 -
+        """
+        lines = [f"{'阶段':<14}{'次数':>8}{'总计(ms)':>12}{'平均':>10}{'P50':>10}{'P95':>10}{'最大':>10}{'占比':>8}"]
+        grand_total = sum(item.top_level_total for item in stats.values())
+        for name, item in sorted(stats.items(), key=lambda pair: pair[1].total, reverse=True):
+            if item.top_level_total and grand_total:
+                share = f"{item.top_level_total / grand_total:>8.0%}"
+            else:
+                share = f"{'-':>8}"
+            lines.append(
+                f"{name:<14}{item.count:>8}{item.total:>12.1f}{item.mean:>10.2f}"
+                f"{item.percentile(50):>10.2f}{item.percentile(95):>10.2f}{item.max:>10.2f}{share}"
+            )
+        return lines
+
+
+Profiler.configure_from_env()
@@ -0,0 +1,229 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List
+
+class TemplateStore:
+    """
+    基于 SQLite 的水印模板库，适合保存大量模板
+
+    每个模板单独一行，按 (类型, 名称) 建立主键索引，标签单独建表索引。
+    保存或删除单个模板只修改对应的行，列出模板名称时不需要解析模板内容。
+    """
+
+    # 模板类型
+    TEMPLATE_TYPES = ("text", "image")
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: 数据库文件路径，不存在时自动创建
+        """
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        try:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._create_tables()
+        except Exception as e:
+            raise Exception(f"无法打开模板数据库 {db_path}: {str(e)}")
+
+    def _create_tables(self):
+        """创建模板表和标签表"""
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS templates (
+                    type TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    settings TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (type, name)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS template_tags (
+                    type TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    tag TEXT NOT NULL,
+                    PRIMARY KEY (type, name, tag),
+                    FOREIGN KEY (type, name) REFERENCES templates (type, name) ON DELETE CASCADE
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_template_tags_tag ON template_tags (type, tag)")
+
+    def save_template(self, template_type: str, name: str, settings: Dict[str, Any], tags: List[str] = None) -> bool:
+        """
+        保存模板，同名模板会被覆盖
+
+        Args:
+            template_type: 模板类型，text 或 image
+            name: 模板名称
+            settings: 水印设置
+            tags: 标签列表，为 None 时保留原有标签
+
+        Returns:
+            是否保存成功
+        """
+        self._check_type(template_type)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO templates (type, name, settings, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (type, name) DO UPDATE SET settings = excluded.settings, updated_at = excluded.updated_at",
+                (template_type, name, json.dumps(settings, ensure_ascii=False), time.time())
+            )
+            if tags is not None:
+                self._replace_tags(template_type, name, tags)
+        return True
+
+    def get_template(self, template_type: str, name: str) -> Dict[str, Any]:
+        """
+        读取模板
+
+        Returns:
+            模板设置，如果不存在则返回空字典
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT settings FROM templates WHERE type = ? AND name = ?", (template_type, name)
+            ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def delete_template(self, template_type: str, name: str) -> bool:
+        """
+        删除模板及其标签
+
+        Returns:
+            是否删除成功，模板不存在时返回 False
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM templates WHERE type = ? AND name = ?", (template_type, name)
+            )
+        return cursor.rowcount > 0
+
+    def list_names(self, template_type: str, prefix: str = "", tag: str = None, limit: int = None) -> List[str]:
+        """
+        按名称排序列出模板名称，不读取模板内容
+
+        Args:
+            template_type: 模板类型
+            prefix: 名称前缀，为空时列出全部
+            tag: 只列出带有该标签的模板
+            limit: 最多返回的数量
+
+        Returns:
+            模板名称列表
+        """
+        sql = "SELECT t.name FROM templates t"
+        params = []
+        if tag is not None:
+            sql += " JOIN template_tags g ON g.type = t.type AND g.name = t.name AND g.tag = ?"
+            params.append(tag)
+        sql += " WHERE t.type = ?"
+        params.append(template_type)
+        if prefix:
+            # 使用范围条件代替 LIKE，可以直接利用主键索引
+            sql += " AND t.name >= ? AND t.name < ?"
+            params.extend([prefix, prefix + "\U0010ffff"])
+        sql += " ORDER BY t.name"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, params)]
+
+    def get_templates(self, template_type: str) -> Dict[str, Any]:
+        """
+        读取某类型的全部模板
+
+        Returns:
+            模板字典 {模板名称: 设置}
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, settings FROM templates WHERE type = ? ORDER BY name", (template_type,)
+            ).fetchall()
+        return {name: json.loads(settings) for name, settings in rows}
+
+    def count(self, template_type: str = None) -> int:
+        """返回模板数量，未指定类型时统计全部模板"""
+        with self._lock:
+            if template_type is None:
+                return self._conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM templates WHERE type = ?", (template_type,)
+            ).fetchone()[0]
+
+    def set_tags(self, template_type: str, name: str, tags: List[str]) -> bool:
+        """
+        设置模板标签（替换原有标签）
+
+        Returns:
+            是否设置成功，模板不存在时返回 False
+        """
+        with self._lock, self._conn:
+            exists = self._conn.execute(
+                "SELECT 1 FROM templates WHERE type = ? AND name = ?", (template_type, name)
+            ).fetchone()
+            if not exists:
+                return False
+            self._replace_tags(template_type, name, tags)
+        return True
+
+    def get_tags(self, template_type: str, name: str) -> List[str]:
+        """返回模板的标签列表"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT tag FROM template_tags WHERE type = ? AND name = ? ORDER BY tag", (template_type, name)
+            )]
+
+    def _replace_tags(self, template_type: str, name: str, tags: List[str]):
+        """替换模板标签，需在事务中调用"""
+        self._conn.execute("DELETE FROM template_tags WHERE type = ? AND name = ?", (template_type, name))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO template_tags (type, name, tag) VALUES (?, ?, ?)",
+            [(template_type, name, tag) for tag in tags]
+        )
+
+    def import_templates(self, templates: Dict[str, Any]) -> int:
+        """
+        导入 watermark_config.json 中 templates 格式的模板，同名模板会被覆盖
+
+        Args:
+            templates: {"text": {名称: 设置}, "image": {名称: 设置}}
+
+        Returns:
+            导入的模板数量
+        """
+        now = time.time()
+        rows = []
+        for template_type in self.TEMPLATE_TYPES:
+            for name, settings in templates.get(template_type, {}).items():
+                rows.append((template_type, name, json.dumps(settings, ensure_ascii=False), now))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO templates (type, name, settings, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (type, name) DO UPDATE SET settings = excluded.settings, updated_at = excluded.updated_at",
+                rows
+            )
+        return len(rows)
+
+    def export_templates(self) -> Dict[str, Any]:
+        """
+        导出为 watermark_config.json 中 templates 的格式
+
+        Returns:
+            {"text": {名称: 设置}, "image": {名称: 设置}}
+        """
+        return {template_type: self.get_templates(template_type) for template_type in self.TEMPLATE_TYPES}
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def _check_type(self, template_type: str):
+        if template_type not in self.TEMPLATE_TYPES:
+            raise ValueError(f"不支持的模板类型: {template_type}")
@@ -1,12 +1,161 @@
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
+from PIL import Image, ImageDraw, ImageFont
+from collections import OrderedDict
 import os
 import platform
+import threading
+
+from modules.compositor import ImageCompositor
+from modules.profiler import Profiler
+
+# 进程内共享的字体缓存，键为 (字体名称, 字号, 粗体, 斜体)，按最近最少使用淘汰
+FONT_CACHE_SIZE = 64
+_font_cache = OrderedDict()
+# 字体名称（含粗体/斜体变体）到实际字体文件路径的映射，None 表示找不到该字体
+_font_path_cache = {}
+_font_cache_lock = threading.Lock()
+
+# 粗体/斜体字体文件的常见命名后缀，如 arialbd.ttf、msyhbd.ttc、DejaVuSans-Bold.ttf
+_FONT_VARIANT_SUFFIXES = {
+    (True, False): ("bd", "b", "-Bold"),
+    (False, True): ("i", "-Italic", "-Oblique"),
+    (True, True): ("bi", "z", "-BoldItalic", "-BoldOblique"),
+}
+
+
+def _find_font_file(font_family: str):
+    """
+    查找字体文件的实际路径（不使用缓存）
+    
+    Returns:
+        字体文件路径，找不到时返回 None
+    """
+    try:
+        # 首先尝试直接加载字体文件，Pillow会在系统字体目录中查找
+        return ImageFont.truetype(font_family, 12).path
+    except Exception:
+        pass
+    
+    # 如果失败，尝试在系统字体目录中查找
+    if platform.system() == "Windows":
+        candidates = [os.path.join("C:", "Windows", "Fonts", font_family)]
+    else:
+        # 对于其他系统，尝试一些常见的字体路径
+        common_paths = [
+            "/usr/share/fonts/",
+            "/usr/local/share/fonts/",
+            "~/.fonts/"
+        ]
+        candidates = [os.path.join(os.path.expanduser(path), font_family) for path in common_paths]
+    
+    for full_path in candidates:
+        try:
+            if os.path.exists(full_path):
+                return ImageFont.truetype(full_path, 12).path
+        except Exception:
+            continue
+    return None
+
+
+def resolve_font_path(font_family: str, bold: bool = False, italic: bool = False):
+    """
+    解析字体名称对应的字体文件路径，结果会被缓存，同一字体只查找一次
+    
+    Args:
+        font_family: 字体名称或字体文件路径
+        bold: 是否优先查找粗体变体
+        italic: 是否优先查找斜体变体
+        
+    Returns:
+        字体文件路径，找不到时返回 None
+    """
+    key = (font_family, bold, italic)
+    with _font_cache_lock:
+        if key in _font_path_cache:
+            return _font_path_cache[key]
+    
+    path = None
+    if bold or italic:
+        # 优先查找粗体/斜体字体文件，找不到时使用常规字体
+        stem, ext = os.path.splitext(font_family)
+        if stem.endswith("-Regular"):
+            stem = stem[:-len("-Regular")]
+        for suffix in _FONT_VARIANT_SUFFIXES[(bold, italic)]:
+            path = resolve_font_path(f"{stem}{suffix}{ext}")
+            if path:
+                break
+        if path is None:
+            path = resolve_font_path(font_family)
+    else:
+        path = _find_font_file(font_family)
+    
+    with _font_cache_lock:
+        _font_path_cache[key] = path
+    return path
+
+
+def get_cached_font(font_family: str, font_size: int, bold: bool = False, italic: bool = False):
+    """
+    从进程内缓存获取字体对象，缓存未命中时加载字体
+    
+    Args:
+        font_family: 字体名称或字体文件路径
+        font_size: 字号
+        bold: 粗体
+        italic: 斜体
+        
+    Returns:
+        Pillow字体对象
+    """
+    key = (font_family, font_size, bold, italic)
+    with _font_cache_lock:
+        font = _font_cache.get(key)
+        if font is not None:
+            _font_cache.move_to_end(key)
+            return font
+    
+    with Profiler.stage("font_load"):
+        font = None
+        font_path = resolve_font_path(font_family, bold, italic)
+        if font_path:
+            try:
+                font = ImageFont.truetype(font_path, font_size)
+            except Exception:
+                font = None
+        if font is None:
+            try:
+                # Pillow 10.1 及以上版本的默认字体支持指定字号
+                font = ImageFont.load_default(font_size)
+            except TypeError:
+                font = ImageFont.load_default()
+    
+    with _font_cache_lock:
+        _font_cache[key] = font
+        _font_cache.move_to_end(key)
+        while len(_font_cache) > FONT_CACHE_SIZE:
+            _font_cache.popitem(last=False)
+    return font
+
+
+def clear_font_cache():
+    """清空字体缓存和字体路径缓存（如安装了新字体后）"""
+    with _font_cache_lock:
+        _font_cache.clear()
+        _font_path_cache.clear()
+
 
 class TextWatermark:
     """
     文本水印类，负责在图片上添加文本水印
     """
     
+    # 已渲染水印图层缓存的最大数量
+    LAYER_CACHE_SIZE = 4
+    # 影响水印单元渲染结果的设置，位置和平铺方式只影响合成位置，修改后不需要重新渲染
+    RENDER_SETTINGS = ("text", "font_family", "font_size", "color", "opacity", "rotation", "bold", "italic",
+                       "shadow", "shadow_color", "shadow_offset", "stroke", "stroke_color", "stroke_width")
+    # 图层缓存的锁，导出流水线的多个合成线程会同时读写同一个缓存（类属性，实例仍可序列化给工作进程）
+    _cache_lock = threading.Lock()
+    
     def __init__(self):
         self.text = "水印文本"
         self.font_family = self._get_default_font()  # 根据系统选择默认字体
@@ -23,6 +172,12 @@ class TextWatermark:
         self.stroke = False  # 描边效果
         self.stroke_color = (0, 0, 0)  # 描边颜色
         self.stroke_width = 1  # 描边宽度
+        self.tiled = False  # 平铺覆盖整张图片
+        self.tile_spacing = (100, 100)  # 平铺时单元之间的间距 (水平, 垂直)
+        self.tile_stagger = True  # 平铺时奇数行错开半个单元
+        # 已渲染的水印单元缓存，键为 (渲染设置, 渲染比例)，批量导出时只渲染一次
+        self._layer_cache = OrderedDict()
+        self._render_key = None  # 渲染设置组成的缓存键，设置改变时重新计算
     
     def _get_default_font(self):
         """根据操作系统选择合适的默认字体以支持中文显示"""
@@ -40,19 +195,23 @@ class TextWatermark:
     def set_text(self, text: str):
         """设置水印文本"""
         self.text = text
+        self._render_key = None
     
     def set_font(self, font_family: str, font_size: int):
         """设置字体"""
         self.font_family = font_family
         self.font_size = font_size
+        self._render_key = None
     
     def set_color(self, color: tuple):
         """设置文字颜色 (R, G, B)"""
         self.color = color
+        self._render_key = None
     
     def set_opacity(self, opacity: int):
         """设置透明度 (0-255)"""
         self.opacity = max(0, min(255, opacity))
+        self._render_key = None
     
     def set_position(self, position: tuple):
         """设置水印位置 (x, y)"""
@@ -61,122 +220,336 @@ class TextWatermark:
     def set_rotation(self, rotation: int):
         """设置旋转角度"""
         self.rotation = rotation
+        self._render_key = None
     
     def set_bold(self, bold: bool):
         """设置粗体"""
         self.bold = bold
+        self._render_key = None
     
     def set_italic(self, italic: bool):
         """设置斜体"""
         self.italic = italic
+        self._render_key = None
     
     def set_shadow(self, shadow: bool, color: tuple = (0, 0, 0), offset: tuple = (2, 2)):
         """设置阴影效果"""
         self.shadow = shadow
         self.shadow_color = color
         self.shadow_offset = offset
+        self._render_key = None
     
     def set_stroke(self, stroke: bool, color: tuple = (0, 0, 0), width: int = 1):
         """设置描边效果"""
         self.stroke = stroke
         self.stroke_color = color
         self.stroke_width = width
+        self._render_key = None
+    
+    def set_tiling(self, tiled: bool, spacing: tuple = (100, 100), stagger: bool = True):
+        """
+        设置平铺模式：以 position 为起点按间距重复水印，旋转角度作用于每个单元
+        
+        Args:
+            tiled: 是否平铺
+            spacing: 单元之间的间距 (水平, 垂直)，可以为负数使单元重叠
+            stagger: 奇数行是否错开半个单元
+        """
+        self.tiled = tiled
+        self.tile_spacing = tuple(spacing)
+        self.tile_stagger = stagger
+    
+    def get_settings(self) -> dict:
+        """
+        获取当前水印设置（可用于保存模板或传递给批处理进程）
+        
+        Returns:
+            水印设置字典
+        """
+        return {
+            "text": self.text,
+            "font_family": self.font_family,
+            "font_size": self.font_size,
+            "color": self.color,
+            "opacity": self.opacity,
+            "position": self.position,
+            "rotation": self.rotation,
+            "bold": self.bold,
+            "italic": self.italic,
+            "shadow": self.shadow,
+            "shadow_color": self.shadow_color,
+            "shadow_offset": self.shadow_offset,
+            "stroke": self.stroke,
+            "stroke_color": self.stroke_color,
+            "stroke_width": self.stroke_width,
+            "tiled": self.tiled,
+            "tile_spacing": self.tile_spacing,
+            "tile_stagger": self.tile_stagger
+        }
+    
+    def snapshot(self) -> 'TextWatermark':
+        """
+        复制当前设置到新的水印实例，供其他线程使用
+
+        只复制设置，之后对原实例的修改不会影响副本。图层缓存按渲染设置区分并由锁保护，
+        副本与原实例共用同一个缓存，拖动水印时每次预览都能复用已渲染的单元。
+
+        Returns:
+            新的 TextWatermark 实例
+        """
+        watermark = TextWatermark()
+        watermark.apply_settings(self.get_settings())
+        watermark._layer_cache = self._layer_cache
+        return watermark
+    
+    def apply_settings(self, settings: dict):
+        """
+        应用水印设置，缺失的项使用默认值
+        
+        Args:
+            settings: 水印设置字典（如模板内容）
+        """
+        self.set_text(settings.get("text", "水印文本"))
+        self.set_font(settings.get("font_family", self._get_default_font()), settings.get("font_size", 36))
+        self.set_color(tuple(settings.get("color", (255, 255, 255))))
+        self.set_opacity(settings.get("opacity", 128))
+        self.set_position(tuple(settings.get("position", (50, 50))))
+        self.set_rotation(settings.get("rotation", 0))
+        self.set_bold(settings.get("bold", False))
+        self.set_italic(settings.get("italic", False))
+        self.set_shadow(
+            settings.get("shadow", False),
+            tuple(settings.get("shadow_color", (0, 0, 0))),
+            tuple(settings.get("shadow_offset", (2, 2)))
+        )
+        self.set_stroke(
+            settings.get("stroke", False),
+            tuple(settings.get("stroke_color", (0, 0, 0))),
+            settings.get("stroke_width", 1)
+        )
+        self.set_tiling(
+            settings.get("tiled", False),
+            tuple(settings.get("tile_spacing", (100, 100))),
+            settings.get("tile_stagger", True)
+        )
     
     def _load_font(self):
-        """加载字体文件"""
-        try:
-            # 首先尝试直接加载字体文件
-            font = ImageFont.truetype(self.font_family, self.font_size)
-        except:
-            try:
-                # 如果失败，尝试在系统字体目录中查找
-                system = platform.system()
-                if system == "Windows":
-                    font_path = os.path.join("C:", "Windows", "Fonts", self.font_family)
-                    font = ImageFont.truetype(font_path, self.font_size)
-                else:
-                    # 对于其他系统，尝试一些常见的字体路径
-                    common_paths = [
-                        "/usr/share/fonts/",
-                        "/usr/local/share/fonts/",
-                        "~/.fonts/"
-                    ]
-                    font = None
-                    for path in common_paths:
-                        try:
-                            full_path = os.path.join(path, self.font_family)
-                            if os.path.exists(full_path):
-                                font = ImageFont.truetype(full_path, self.font_size)
-                                break
-                        except:
-                            continue
-                    
-                    if font is None:
-                        # 如果都失败了，使用默认字体
-                        font = ImageFont.load_default()
-            except:
-                # 最后的备选方案
-                font = ImageFont.load_default()
+        """加载字体（使用进程内字体缓存，同一字体和字号只加载一次）"""
+        return get_cached_font(self.font_family, self.font_size, self.bold, self.italic)
+    
+    def _get_render_key(self) -> str:
+        """返回渲染设置组成的缓存键，设置未改变时直接使用上次计算的结果"""
+        key = self._render_key
+        if key is None:
+            key = repr(tuple(getattr(self, name) for name in self.RENDER_SETTINGS))
+            self._render_key = key
+        return key
+    
+    def _get_cell(self, render_scale: float = 1.0):
+        """
+        获取旋转后的水印单元，结果按渲染设置和渲染比例缓存，与图片尺寸和水印位置无关，
+        拖动水印或批量导出不同尺寸的图片时只渲染一次
         
-        return font
+        Returns:
+            (旋转后的单元图层, 文本绘制起点在未旋转图层中的位置, 文本尺寸, 未旋转图层尺寸)，调用方不应修改图层
+        """
+        key = (self._get_render_key(), render_scale)
+        with self._cache_lock:
+            cached = self._layer_cache.get(key)
+            if cached is not None:
+                self._layer_cache.move_to_end(key)
+                return cached
+        
+        # 在锁外渲染，其他线程可以同时读取缓存
+        layer, text_origin, text_size = self._render_cell(render_scale)
+        cached = (self._rotate_cell(layer), text_origin, text_size, layer.size)
+        with self._cache_lock:
+            self._layer_cache[key] = cached
+            while len(self._layer_cache) > self.LAYER_CACHE_SIZE:
+                self._layer_cache.popitem(last=False)
+        return cached
     
-    def add_watermark(self, image: Image.Image) -> Image.Image:
+    def _get_layer(self, image_size: tuple, render_scale: float = 1.0):
         """
-        在图片上添加文本水印
+        获取渲染好的水印图层，单元图层按设置和渲染比例缓存，只需按图片尺寸重新计算位置
+        
+        Returns:
+            (水印图层, 图层左上角在图片中的位置)
+        """
+        return self._render_layer(image_size, render_scale)
+    
+    def _get_tile_cell(self, render_scale: float = 1.0) -> Image.Image:
+        """获取平铺用的单元图层（按自身中心旋转），与图片尺寸无关，结果按设置和渲染比例缓存"""
+        return self._get_cell(render_scale)[0]
+    
+    def _rotate_cell(self, layer: Image.Image) -> Image.Image:
+        """以图层自身中心旋转文本图层，图层扩大到能容纳旋转后的全部内容"""
+        if self.rotation % 360 == 0:
+            return layer
+        with Profiler.stage("rotate"):
+            return layer.rotate(self.rotation, resample=Image.Resampling.BICUBIC, expand=True)
+    
+    def _render_cell(self, render_scale: float = 1.0):
+        """
+        渲染未旋转的文本水印单元，图层只覆盖文本、阴影和描边所在的区域
         
         Args:
-            image: 原始图片
+            render_scale: 目标图片相对原图的缩放比例（如预览代理图），字号、阴影偏移和描边宽度按比例换算
             
         Returns:
-            添加水印后的图片
+            (水印图层, 文本绘制起点在图层中的位置, 文本尺寸 (width, height))
         """
-        # 创建水印图层
-        watermark_layer = Image.new('RGBA', image.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(watermark_layer)
+        # 按渲染比例换算字号、阴影偏移和描边宽度
+        if render_scale != 1.0:
+            font_size = max(1, round(self.font_size * render_scale))
+            shadow_offset = (round(self.shadow_offset[0] * render_scale), round(self.shadow_offset[1] * render_scale))
+            stroke_width = max(1, round(self.stroke_width * render_scale)) if self.stroke_width > 0 else 0
+        else:
+            font_size = self.font_size
+            shadow_offset = self.shadow_offset
+            stroke_width = self.stroke_width
         
         # 加载字体
-        font = self._load_font()
+        font = get_cached_font(self.font_family, font_size, self.bold, self.italic)
         
         # 获取文本尺寸
-        bbox = draw.textbbox((0, 0), self.text, font=font)
+        bbox = ImageDraw.Draw(Image.new('L', (1, 1))).textbbox((0, 0), self.text, font=font)
         text_width = bbox[2] - bbox[0]
         text_height = bbox[3] - bbox[1]
         
+        # 计算文本、描边和阴影覆盖的区域（相对文本绘制起点）
+        left, top, right, bottom = bbox
+        if self.stroke:
+            left -= stroke_width
+            top -= stroke_width
+            right += stroke_width
+            bottom += stroke_width
+        if self.shadow:
+            left = min(left, bbox[0] + shadow_offset[0])
+            top = min(top, bbox[1] + shadow_offset[1])
+            right = max(right, bbox[2] + shadow_offset[0])
+            bottom = max(bottom, bbox[3] + shadow_offset[1])
+        
+        with Profiler.stage("text_render"):
+            # 创建只包含文本区域的水印图层，文本坐标相对于图层左上角
+            layer_size = (max(1, right - left), max(1, bottom - top))
+            watermark_layer = Image.new('RGBA', layer_size, (0, 0, 0, 0))
+            x, y = -left, -top
+            
+            # 文字只光栅化一次，阴影复用同一个字形蒙版
+            text_mask = Image.new('L', layer_size, 0)
+            ImageDraw.Draw(text_mask).text((x, y), self.text, font=font, fill=255)
+            
+            # 绘制阴影
+            if self.shadow:
+                shadow_x, shadow_y = shadow_offset
+                shadow_color = (*self.shadow_color, int(self.opacity * 0.7))
+                shadow_box = (shadow_x, shadow_y, shadow_x + layer_size[0], shadow_y + layer_size[1])
+                watermark_layer.paste(shadow_color, shadow_box, text_mask)
+            
+            # 绘制描边：使用FreeType原生描边一次生成轮廓蒙版，耗时与描边宽度基本无关
+            if self.stroke and stroke_width > 0:
+                stroke_mask = Image.new('L', layer_size, 0)
+                ImageDraw.Draw(stroke_mask).text((x, y), self.text, font=font, fill=255,
+                                                 stroke_width=stroke_width, stroke_fill=255)
+                stroke_color = (*self.stroke_color, int(self.opacity * 0.8))
+                watermark_layer.paste(stroke_color, (0, 0), stroke_mask)
+            
+            # 绘制文本水印
+            text_color = (*self.color, self.opacity)
+            watermark_layer.paste(text_color, (0, 0), text_mask)
+        
+        return watermark_layer, (x, y), (text_width, text_height)
+    
+    def _render_layer(self, image_size: tuple, render_scale: float = 1.0):
+        """
+        渲染文本水印图层，图层只覆盖文本、阴影和描边所在的区域
+        
+        旋转时只旋转文本图层本身（以其中心为轴），旋转后的中心与未旋转时相同，
+        耗时只与文本大小有关，文本也不会因为绕图片中心旋转而偏离设置的位置。
+        单元图层来自缓存，这里只计算位置。
+        
+        Args:
+            image_size: 目标图片尺寸 (width, height)
+            render_scale: 目标图片相对原图的缩放比例（如预览代理图），字号、位置、偏移按比例换算
+            
+        Returns:
+            (水印图层, 图层左上角在图片中的位置)
+        """
+        watermark_layer, (text_x, text_y), (text_width, text_height), cell_size = self._get_cell(render_scale)
+        
+        # 按渲染比例换算位置
+        if render_scale != 1.0:
+            position = (round(self.position[0] * render_scale), round(self.position[1] * render_scale))
+        else:
+            position = self.position
+        
         # 调整位置以确保文本在图片内
-        x = max(0, min(self.position[0], image.width - text_width))
-        y = max(0, min(self.position[1], image.height - text_height))
+        x = max(0, min(position[0], image_size[0] - text_width))
+        y = max(0, min(position[1], image_size[1] - text_height))
+        left, top = x - text_x, y - text_y
         
-        # 绘制阴影
-        if self.shadow:
-            shadow_x, shadow_y = x + self.shadow_offset[0], y + self.shadow_offset[1]
-            shadow_color = (*self.shadow_color, int(self.opacity * 0.7))
-            draw.text((shadow_x, shadow_y), self.text, font=font, fill=shadow_color)
+        if self.rotation % 360:
+            # 单元图层已按自身中心旋转，保持旋转前后中心不变
+            center_x = left + cell_size[0] / 2
+            center_y = top + cell_size[1] / 2
+            left = round(center_x - watermark_layer.width / 2)
+            top = round(center_y - watermark_layer.height / 2)
         
-        # 绘制描边
-        if self.stroke:
-            # 绘制多个偏移的文本来模拟描边效果
-            for dx in range(-self.stroke_width, self.stroke_width + 1):
-                for dy in range(-self.stroke_width, self.stroke_width + 1):
-                    if dx != 0 or dy != 0:
-                        stroke_x, stroke_y = x + dx, y + dy
-                        stroke_color = (*self.stroke_color, int(self.opacity * 0.8))
-                        draw.text((stroke_x, stroke_y), self.text, font=font, fill=stroke_color)
-        
-        # 绘制文本水印
-        text_color = (*self.color, self.opacity)
-        draw.text((x, y), self.text, font=font, fill=text_color)
-        
-        # 如果需要旋转，则旋转水印
-        if self.rotation != 0:
-            watermark_layer = watermark_layer.rotate(self.rotation, expand=0)
-        
-        # 将水印图层合并到原始图片
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
+        return watermark_layer, (left, top)
+    
+    def render_tile(self, image_size: tuple, render_scale: float = 1.0):
+        """
+        获取只覆盖水印区域的图层，用于大图等只处理水印区域的场景
+        
+        Args:
+            image_size: 目标图片尺寸 (width, height)
+            render_scale: 图片相对原图的缩放比例
+            
+        Returns:
+            (RGBA图层, 图层左上角在图片中的位置，旋转后可能部分超出图片)
+        """
+        return self._get_layer(image_size, render_scale)
+    
+    def render_placements(self, image_size: tuple, render_scale: float = 1.0) -> list:
+        """
+        获取需要合成到图片上的全部水印图层及其位置
+        
+        Args:
+            image_size: 目标图片尺寸 (width, height)
+            render_scale: 图片相对原图的缩放比例
             
-        watermarked_image = Image.alpha_composite(image, watermark_layer)
+        Returns:
+            [(RGBA图层, 图层左上角在图片中的位置)]，平铺模式下每行一项
+        """
+        if not self.tiled:
+            return [self.render_tile(image_size, render_scale)]
         
-        return watermarked_image
+        cell = self._get_tile_cell(render_scale)
+        pitch = (cell.width + round(self.tile_spacing[0] * render_scale),
+                 cell.height + round(self.tile_spacing[1] * render_scale))
+        origin = (round(self.position[0] * render_scale), round(self.position[1] * render_scale))
+        return ImageCompositor.tile_placements(image_size, cell, pitch, origin, self.tile_stagger)
+    
+    def add_watermark(self, image: Image.Image, render_scale: float = 1.0) -> Image.Image:
+        """
+        在图片上添加文本水印
+        
+        Args:
+            image: 原始图片
+            render_scale: 图片相对原图的缩放比例，用于在缩小的预览图上按比例渲染水印
+            
+        Returns:
+            添加水印后的图片
+        """
+        if self.tiled:
+            # 平铺：单元只渲染一次，按行合成预先拼好的图案条带
+            return ImageCompositor.composite_many(image, self.render_placements(image.size, render_scale))
+        
+        watermark_layer, position = self._get_layer(image.size, render_scale)
+        
+        # 只在水印图层覆盖的区域内合成
+        return ImageCompositor.composite(image, watermark_layer, position)
     
     def get_font_families(self):
         """
@@ -193,12 +566,6 @@ class TextWatermark:
             "times.ttf"
         ]
         
-        available_fonts = []
-        for font in common_fonts:
-            try:
-                ImageFont.truetype(font, 12)
-                available_fonts.append(font)
-            except:
-                continue
+        available_fonts = [font for font in common_fonts if resolve_font_path(font)]
                 
         return available_fonts if available_fonts else ["default"]
\ No newline at end of file
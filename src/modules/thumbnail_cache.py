@@ -0,0 +1,109 @@
+import hashlib
+import os
+import platform
+import tempfile
+from PIL import Image
+
+from modules.file_handler import FileHandler
+
+
+class ThumbnailCache:
+    """
+    缩略图磁盘缓存，按 文件路径 + 修改时间 + 文件大小 建立索引
+
+    原图未改变时直接读取缓存中的小图，不需要重新解码原图。
+    """
+
+    # 默认缩略图尺寸
+    THUMBNAIL_SIZE = (96, 96)
+
+    def __init__(self, cache_dir: str = None, size: tuple = None):
+        """
+        Args:
+            cache_dir: 缓存目录，默认使用系统的用户缓存目录
+            size: 缩略图最大尺寸 (width, height)
+        """
+        self.cache_dir = cache_dir or self.get_default_cache_dir()
+        self.size = tuple(size) if size else self.THUMBNAIL_SIZE
+        self.file_handler = FileHandler()
+
+    @staticmethod
+    def get_default_cache_dir() -> str:
+        """获取系统默认的缩略图缓存目录"""
+        system = platform.system()
+        if system == "Windows":
+            base_dir = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+            return os.path.join(base_dir, "WatermarkTool", "thumbnails")
+        elif system == "Darwin":  # macOS
+            return os.path.join(os.path.expanduser("~/Library/Caches"), "WatermarkTool", "thumbnails")
+        else:
+            base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+            return os.path.join(base_dir, "watermark_tool", "thumbnails")
+
+    def _get_cache_path(self, file_path: str) -> str:
+        """根据原图路径、修改时间、文件大小和缩略图尺寸计算缓存文件路径"""
+        stat = os.stat(file_path)
+        raw_key = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size[0]}x{self.size[1]}"
+        key = hashlib.sha1(raw_key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+    def get(self, file_path: str):
+        """
+        从缓存读取缩略图
+
+        Args:
+            file_path: 原图路径
+
+        Returns:
+            缩略图，缓存未命中时返回 None
+        """
+        try:
+            cache_path = self._get_cache_path(file_path)
+            if not os.path.exists(cache_path):
+                return None
+            with Image.open(cache_path) as thumbnail:
+                thumbnail.load()
+                return thumbnail
+        except Exception:
+            return None
+
+    def get_or_create(self, file_path: str) -> Image.Image:
+        """
+        获取缩略图，缓存未命中时以缩小分辨率解码原图生成并写入缓存
+
+        Args:
+            file_path: 原图路径
+
+        Returns:
+            缩略图
+        """
+        thumbnail = self.get(file_path)
+        if thumbnail is not None:
+            return thumbnail
+
+        thumbnail = self.file_handler.load_image(file_path, self.size)
+        thumbnail.thumbnail(self.size)
+        if thumbnail.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in thumbnail.getbands() or 'transparency' in thumbnail.info
+            thumbnail = thumbnail.convert('RGBA' if has_alpha else 'RGB')
+
+        try:
+            self._save(thumbnail, self._get_cache_path(file_path))
+        except Exception as e:
+            # 缓存写入失败不影响缩略图显示
+            print(f"写入缩略图缓存失败 {file_path}: {str(e)}")
+        return thumbnail
+
+    def _save(self, thumbnail: Image.Image, cache_path: str):
+        """先写入临时文件再重命名，避免其他线程或进程读到不完整的缓存文件"""
+        cache_dir = os.path.dirname(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                thumbnail.save(f, "PNG", compress_level=1)
+            os.replace(temp_path, cache_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
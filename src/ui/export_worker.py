@@ -0,0 +1,70 @@
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from modules.export_pipeline import ExportPipeline
+
+
+class ExportWorker(QThread):
+    """
+    后台导出线程，导出期间界面保持响应
+
+    导出使用开始时的水印参数快照，导出过程中修改水印设置不会影响本次导出。
+    """
+
+    # 导出进度 (已处理数量, 总数量, 每秒处理张数, 预计剩余秒数或-1)
+    progress = pyqtSignal(int, int, float, float)
+    # 单张图片导出失败 (图片路径, 错误信息)
+    file_failed = pyqtSignal(str, str)
+    # 导出结束 (BatchResult)，取消时也会发出
+    export_finished = pyqtSignal(object)
+    # 导出出错 (错误信息)
+    export_failed = pyqtSignal(str)
+
+    # 进度信号的最小间隔（秒），避免大量图片时信号过多
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, watermark, file_paths, output_dir: str, incremental: bool = False,
+                 encode_profile: str = None, parent=None):
+        """
+        Args:
+            watermark: TextWatermark 或 ImageWatermark 实例，开始时复制参数快照
+            file_paths: 要导出的图片路径列表
+            output_dir: 导出目录
+            incremental: 是否只导出新增或修改的图片
+            encode_profile: 编码速度配置（fast/balanced/smallest）
+        """
+        super().__init__(parent)
+        self.file_paths = list(file_paths)
+        self.processor = ExportPipeline(watermark.snapshot(), output_dir, incremental=incremental,
+                                        encode_profile=encode_profile)
+        self._last_progress_time = 0.0
+        self._start_time = 0.0
+
+    def cancel(self):
+        """请求取消导出，正在写入的图片会完整写入后停止"""
+        self.processor.cancel()
+
+    def run(self):
+        self._start_time = time.perf_counter()
+        try:
+            result = self.processor.run(self.file_paths, progress_callback=self._on_progress)
+        except Exception as e:
+            self.export_failed.emit(str(e))
+            return
+        self.export_finished.emit(result)
+
+    def _on_progress(self, done: int, total: int, file_path: str, error: str):
+        """在导出线程中调用，按时间间隔合并后发出进度信号"""
+        if error is not None:
+            self.file_failed.emit(file_path, error)
+
+        now = time.perf_counter()
+        if now - self._last_progress_time < self.PROGRESS_INTERVAL and done != total:
+            return
+        self._last_progress_time = now
+
+        elapsed = now - self._start_time
+        speed = done / elapsed if elapsed > 0 else 0.0
+        remaining = (total - done) / speed if total and speed > 0 else -1.0
+        self.progress.emit(done, total or 0, speed, remaining)
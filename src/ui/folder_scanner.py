@@ -0,0 +1,40 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from modules.file_handler import FileHandler
+
+
+class FolderScanner(QThread):
+    """
+    后台文件夹扫描线程，边扫描边分批返回图片路径，大文件夹导入时界面不会被阻塞
+    """
+
+    # 找到一批图片 (图片路径列表)
+    batch_found = pyqtSignal(object)
+    # 扫描完成 (图片总数)
+    scan_finished = pyqtSignal(int)
+    # 扫描失败 (错误信息)
+    scan_failed = pyqtSignal(str)
+
+    def __init__(self, folder_path: str, recursive: bool = False, parent=None):
+        super().__init__(parent)
+        self.folder_path = folder_path
+        self.recursive = recursive
+        self._cancelled = False
+
+    def cancel(self):
+        """请求停止扫描"""
+        self._cancelled = True
+
+    def run(self):
+        file_handler = FileHandler()
+        count = 0
+        try:
+            for batch in file_handler.iter_images_from_folder(self.folder_path, recursive=self.recursive):
+                if self._cancelled:
+                    return
+                count += len(batch)
+                self.batch_found.emit(batch)
+        except Exception as e:
+            self.scan_failed.emit(f"无法读取文件夹 {self.folder_path}: {str(e)}")
+            return
+        self.scan_finished.emit(count)
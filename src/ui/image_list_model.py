@@ -0,0 +1,151 @@
+import os
+import time
+from collections import OrderedDict
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+from PyQt5.QtGui import QIcon, QPixmap
+from PIL import Image
+
+
+class ImageListModel(QAbstractListModel):
+    """
+    导入图片列表的数据模型
+
+    只保存图片路径，文件名、尺寸和缩略图在视图需要显示某一行时才生成，
+    追加导入时只插入新增的行，已存在的路径会被自动去重。
+    """
+
+    # 内存中最多保留的缩略图图标数量，超出后淘汰最久未显示的图标（磁盘缓存仍然保留）
+    ICON_CACHE_SIZE = 2000
+    # 缩略图生成失败后，再次显示该行时重新请求前等待的时间（秒）
+    THUMBNAIL_RETRY_DELAY = 5.0
+
+    def __init__(self, thumbnail_loader=None, parent=None):
+        """
+        Args:
+            thumbnail_loader: ThumbnailLoader 实例，为空时不显示缩略图
+        """
+        super().__init__(parent)
+        self._paths = []  # 按导入顺序保存的图片路径
+        self._rows = {}  # 图片路径所在行，用于去重和缩略图返回时定位
+        self._sizes = {}  # 已读取的图片尺寸 {图片路径: (宽, 高)}
+        self._icons = OrderedDict()  # 已加载的缩略图 {图片路径: QIcon}
+        self._pending_thumbnails = set()  # 已请求但尚未返回的缩略图
+        self._failed_thumbnails = {}  # 生成失败的缩略图 {图片路径: 失败时间}，等待一段时间后重试
+        self.thumbnail_loader = thumbnail_loader
+        if thumbnail_loader is not None:
+            thumbnail_loader.thumbnail_ready.connect(self.on_thumbnail_ready)
+            thumbnail_loader.thumbnail_failed.connect(self.on_thumbnail_failed)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._paths):
+            return None
+        file_path = self._paths[index.row()]
+
+        if role == Qt.DisplayRole:
+            return os.path.basename(file_path)
+        if role == Qt.UserRole:
+            return file_path
+        if role == Qt.ToolTipRole:
+            size = self.get_image_size(file_path)
+            if size is None:
+                return file_path
+            return f"{file_path}\n{size[0]} x {size[1]}"
+        if role == Qt.DecorationRole:
+            return self._get_icon(file_path)
+        return None
+
+    def append_paths(self, file_paths) -> int:
+        """
+        追加图片路径，已存在的路径会被忽略
+
+        Args:
+            file_paths: 图片路径列表
+
+        Returns:
+            实际新增的图片数量
+        """
+        first = len(self._paths)
+        new_paths = []
+        for file_path in file_paths:
+            if file_path not in self._rows:
+                self._rows[file_path] = first + len(new_paths)
+                new_paths.append(file_path)
+        if not new_paths:
+            return 0
+
+        self.beginInsertRows(QModelIndex(), first, first + len(new_paths) - 1)
+        self._paths.extend(new_paths)
+        self.endInsertRows()
+        return len(new_paths)
+
+    def clear(self):
+        """清空图片列表"""
+        if self.thumbnail_loader is not None:
+            self.thumbnail_loader.cancel_all()
+        self.beginResetModel()
+        self._paths = []
+        self._rows = {}
+        self._sizes = {}
+        self._icons = OrderedDict()
+        self._pending_thumbnails = set()
+        self._failed_thumbnails = {}
+        self.endResetModel()
+
+    def paths(self):
+        """返回所有图片路径（按导入顺序）"""
+        return list(self._paths)
+
+    def path_at(self, row: int) -> str:
+        """返回指定行的图片路径"""
+        return self._paths[row]
+
+    def get_image_size(self, file_path: str):
+        """读取文件头获取图片尺寸并缓存，读取失败时返回 None"""
+        if file_path not in self._sizes:
+            try:
+                with Image.open(file_path) as image:
+                    self._sizes[file_path] = image.size
+            except Exception:
+                self._sizes[file_path] = None
+        return self._sizes[file_path]
+
+    def _get_icon(self, file_path: str):
+        """返回已加载的缩略图，未加载时在后台请求"""
+        icon = self._icons.get(file_path)
+        if icon is not None:
+            self._icons.move_to_end(file_path)
+            return icon
+        if self.thumbnail_loader is None or file_path in self._pending_thumbnails:
+            return None
+        failed_at = self._failed_thumbnails.get(file_path)
+        if failed_at is not None:
+            if time.monotonic() - failed_at < self.THUMBNAIL_RETRY_DELAY:
+                return None
+            del self._failed_thumbnails[file_path]
+        self._pending_thumbnails.add(file_path)
+        self.thumbnail_loader.request([file_path])
+        return None
+
+    def on_thumbnail_ready(self, file_path, qimage):
+        """缩略图加载完成时更新对应行"""
+        self._pending_thumbnails.discard(file_path)
+        row = self._rows.get(file_path)
+        if row is None:
+            return
+        self._icons[file_path] = QIcon(QPixmap.fromImage(qimage))
+        while len(self._icons) > self.ICON_CACHE_SIZE:
+            self._icons.popitem(last=False)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def on_thumbnail_failed(self, file_path):
+        """缩略图生成失败时取消等待标记，该行之后再次显示时会重新请求"""
+        self._pending_thumbnails.discard(file_path)
+        if file_path in self._rows:
+            self._failed_thumbnails[file_path] = time.monotonic()
@@ -0,0 +1,82 @@
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from utils.helpers import UIHelpers
+
+
+class PreviewRenderer(QThread):
+    """
+    后台预览渲染线程
+
+    渲染请求会被合并：线程空闲时只渲染最新一次请求，渲染期间到达的新请求会覆盖旧请求，
+    已过期的渲染结果直接丢弃，拖动水印或拖动滑块时界面不会被阻塞。
+    """
+
+    # 渲染完成信号 (请求序号, 预览QImage)
+    # 以Python对象传递，QImage引用的像素数据随对象一起保留，不会在跨线程传递时失效
+    preview_ready = pyqtSignal(int, object)
+    # 渲染失败信号 (请求序号, 错误信息)
+    preview_failed = pyqtSignal(int, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._condition = threading.Condition()
+        self._pending = None  # 等待渲染的最新请求
+        self._generation = 0  # 最新请求序号
+        self._stopped = False
+
+    def request(self, watermark, image, render_scale: float = 1.0) -> int:
+        """
+        提交渲染请求，会覆盖尚未开始渲染的旧请求
+
+        Args:
+            watermark: TextWatermark 或 ImageWatermark 实例，提交时复制参数快照
+            image: 要渲染的（代理）图片，渲染期间不应被修改
+            render_scale: 图片相对原图的缩放比例
+
+        Returns:
+            请求序号，用于判断收到的结果是否为最新
+        """
+        # 复制水印设置到新实例（与原实例共用渲染缓存），界面线程之后的修改不会影响正在进行的渲染
+        snapshot = watermark.snapshot()
+        with self._condition:
+            self._generation += 1
+            self._pending = (self._generation, snapshot, image, render_scale)
+            self._condition.notify()
+            return self._generation
+
+    def stop(self):
+        """停止渲染线程并等待其退出"""
+        with self._condition:
+            self._stopped = True
+            self._pending = None
+            self._condition.notify()
+        self.wait()
+
+    def _is_stale(self, generation: int) -> bool:
+        """渲染结果是否已被更新的请求取代"""
+        with self._condition:
+            return self._stopped or generation != self._generation
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                generation, watermark, image, render_scale = self._pending
+                self._pending = None
+
+            try:
+                watermarked_image = watermark.add_watermark(image, render_scale)
+                if self._is_stale(generation):
+                    continue
+                qimage = UIHelpers.create_qimage_from_pil_image(watermarked_image)
+            except Exception as e:
+                self.preview_failed.emit(generation, str(e))
+                continue
+
+            if not self._is_stale(generation):
+                self.preview_ready.emit(generation, qimage)
@@ -0,0 +1,77 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from modules.thumbnail_cache import ThumbnailCache
+from utils.helpers import UIHelpers
+
+
+class _ThumbnailTask(QRunnable):
+    """在线程池中生成单个缩略图的任务"""
+
+    def __init__(self, loader, file_path: str, generation: int):
+        super().__init__()
+        self.loader = loader
+        self.file_path = file_path
+        self.generation = generation
+
+    def run(self):
+        if self.loader.is_cancelled(self.generation):
+            return
+        try:
+            thumbnail = self.loader.cache.get_or_create(self.file_path)
+            qimage = UIHelpers.create_qimage_from_pil_image(thumbnail)
+        except Exception as e:
+            print(f"生成缩略图失败 {self.file_path}: {str(e)}")
+            if not self.loader.is_cancelled(self.generation):
+                self.loader.thumbnail_failed.emit(self.file_path)
+            return
+        if not self.loader.is_cancelled(self.generation):
+            self.loader.thumbnail_ready.emit(self.file_path, qimage)
+
+
+class ThumbnailLoader(QObject):
+    """
+    后台缩略图加载器，使用线程池读取缓存或生成缩略图，逐个通知界面更新
+    """
+
+    # 缩略图就绪信号 (原图路径, QImage)
+    thumbnail_ready = pyqtSignal(str, object)
+    # 缩略图生成失败信号 (原图路径)
+    thumbnail_failed = pyqtSignal(str)
+
+    def __init__(self, cache: ThumbnailCache = None, parent=None):
+        super().__init__(parent)
+        self.cache = cache or ThumbnailCache()
+        self.pool = QThreadPool(self)
+        # 保留部分CPU给界面和预览渲染
+        self.pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() // 2))
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def request(self, file_paths):
+        """
+        请求加载一批缩略图，结果通过 thumbnail_ready 信号返回
+
+        Args:
+            file_paths: 原图路径列表
+        """
+        with self._lock:
+            generation = self._generation
+        for file_path in file_paths:
+            self.pool.start(_ThumbnailTask(self, file_path, generation))
+
+    def is_cancelled(self, generation: int) -> bool:
+        with self._lock:
+            return generation != self._generation
+
+    def cancel_all(self):
+        """取消所有尚未完成的缩略图请求"""
+        with self._lock:
+            self._generation += 1
+        self.pool.clear()
+
+    def shutdown(self):
+        """取消请求并等待正在运行的任务结束"""
+        self.cancel_all()
+        self.pool.waitForDone()
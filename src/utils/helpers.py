@@ -1,14 +1,56 @@
 import os
 import sys
 from PIL import Image
-from PyQt5.QtGui import QPixmap, QIcon, QImage
-from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPixmap, QImage
+
+# 不依赖Qt的图像工具在 utils.image_utils 中，命令行批处理等无界面场景应直接从那里导入；
+# 这里保留导入，兼容原有的 from utils.helpers import ImageUtils
+from utils.image_utils import ImageUtils
 
 class UIHelpers:
     """
     UI辅助类，提供界面美化和辅助功能
     """
     
+    # 可直接交给QImage的PIL模式：(Qt格式, PIL原始数据格式, 每像素字节数)
+    # PIL内部以每像素4字节存储RGB图像，按RGBX导出只需逐行拷贝，无需重新打包像素
+    QIMAGE_FORMATS = {
+        'RGB': (QImage.Format_RGBX8888, 'RGBX', 4),
+        'RGBA': (QImage.Format_RGBA8888, 'RGBA', 4),
+        'L': (QImage.Format_Grayscale8, 'L', 1),
+    }
+    
+    @staticmethod
+    def create_qimage_from_pil_image(pil_image: Image.Image, max_size: tuple = None) -> QImage:
+        """
+        将PIL图像转换为QImage
+        
+        RGB、RGBA和灰度图像不做模式转换，像素数据只拷贝一次，QImage直接引用该数据并指定
+        每行字节数，奇数宽度的图像不会出现行错位。QImage不依赖GUI线程，可以在后台线程中创建。
+        
+        Args:
+            pil_image: PIL图像对象
+            max_size: 最大尺寸 (width, height)，如果提供则先在PIL中缩小再转换
+            
+        Returns:
+            QImage对象（通过Python对象传递给其他线程，不要通过Qt信号的QImage参数复制）
+        """
+        if max_size:
+            pil_image = ImageUtils.resize_image_proportionally(pil_image, max_size[0], max_size[1])
+        
+        # 其他模式转换为RGB或RGBA（保留透明通道）
+        if pil_image.mode not in UIHelpers.QIMAGE_FORMATS:
+            has_alpha = 'A' in pil_image.getbands() or 'transparency' in pil_image.info
+            pil_image = pil_image.convert('RGBA' if has_alpha else 'RGB')
+        
+        qt_format, raw_mode, bytes_per_pixel = UIHelpers.QIMAGE_FORMATS[pil_image.mode]
+        data = pil_image.tobytes("raw", raw_mode)
+        qimage = QImage(data, pil_image.width, pil_image.height,
+                        pil_image.width * bytes_per_pixel, qt_format)
+        # QImage不会复制data，保存引用使data与QImage生命周期一致
+        qimage._pil_data = data
+        return qimage
+    
     @staticmethod
     def create_pixmap_from_pil_image(pil_image: Image.Image, max_size: tuple = None) -> QPixmap:
         """
@@ -21,25 +63,8 @@ class UIHelpers:
         Returns:
             QPixmap对象
         """
-        # 确保图像是RGB模式
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        # 获取图像数据
-        data = pil_image.tobytes("raw", "RGB")
-        qimage = QImage(data, pil_image.width, pil_image.height, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qimage)
-        
-        # 如果提供了最大尺寸，则缩放图像
-        if max_size:
-            pixmap = pixmap.scaled(
-                max_size[0], 
-                max_size[1], 
-                Qt.KeepAspectRatio, 
-                Qt.SmoothTransformation
-            )
-        
-        return pixmap
+        # 先在PIL中缩小，避免把大图完整转换后再由Qt缩放
+        return QPixmap.fromImage(UIHelpers.create_qimage_from_pil_image(pil_image, max_size))
     
     @staticmethod
     def get_resource_path(relative_path: str) -> str:
@@ -77,62 +102,3 @@ class UIHelpers:
             return True
         except Exception:
             return False
-
-class ImageUtils:
-    """
-    图像处理工具类
-    """
-    
-    @staticmethod
-    def resize_image_proportionally(image: Image.Image, max_width: int, max_height: int) -> Image.Image:
-        """
-        按比例调整图像大小
-        
-        Args:
-            image: 原始图像
-            max_width: 最大宽度
-            max_height: 最大高度
-            
-        Returns:
-            调整大小后的图像
-        """
-        original_width, original_height = image.size
-        ratio = min(max_width / original_width, max_height / original_height)
-        
-        if ratio < 1:  # 只有当图像大于最大尺寸时才缩小
-            new_width = int(original_width * ratio)
-            new_height = int(original_height * ratio)
-            return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        return image
-    
-    @staticmethod
-    def calculate_watermark_position(image_size: tuple, watermark_size: tuple, position_type: str = "center") -> tuple:
-        """
-        计算水印位置
-        
-        Args:
-            image_size: 图像尺寸 (width, height)
-            watermark_size: 水印尺寸 (width, height)
-            position_type: 位置类型 (top-left, top-center, top-right, center-left, center, center-right,
-                          bottom-left, bottom-center, bottom-right)
-            
-        Returns:
-            水印位置 (x, y)
-        """
-        img_width, img_height = image_size
-        wm_width, wm_height = watermark_size
-        
-        positions = {
-            "top-left": (10, 10),
-            "top-center": ((img_width - wm_width) // 2, 10),
-            "top-right": (img_width - wm_width - 10, 10),
-            "center-left": (10, (img_height - wm_height) // 2),
-            "center": ((img_width - wm_width) // 2, (img_height - wm_height) // 2),
-            "center-right": (img_width - wm_width - 10, (img_height - wm_height) // 2),
-            "bottom-left": (10, img_height - wm_height - 10),
-            "bottom-center": ((img_width - wm_width) // 2, img_height - wm_height - 10),
-            "bottom-right": (img_width - wm_width - 10, img_height - wm_height - 10)
-        }
-        
-        return positions.get(position_type, positions["center"])
\ No newline at end of file
@@ -0,0 +1,60 @@
+from PIL import Image
+
+class ImageUtils:
+    """
+    图像处理工具类
+    """
+    
+    @staticmethod
+    def resize_image_proportionally(image: Image.Image, max_width: int, max_height: int) -> Image.Image:
+        """
+        按比例调整图像大小
+        
+        Args:
+            image: 原始图像
+            max_width: 最大宽度
+            max_height: 最大高度
+            
+        Returns:
+            调整大小后的图像
+        """
+        original_width, original_height = image.size
+        ratio = min(max_width / original_width, max_height / original_height)
+        
+        if ratio < 1:  # 只有当图像大于最大尺寸时才缩小
+            new_width = int(original_width * ratio)
+            new_height = int(original_height * ratio)
+            return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        
+        return image
+    
+    @staticmethod
+    def calculate_watermark_position(image_size: tuple, watermark_size: tuple, position_type: str = "center") -> tuple:
+        """
+        计算水印位置
+        
+        Args:
+            image_size: 图像尺寸 (width, height)
+            watermark_size: 水印尺寸 (width, height)
+            position_type: 位置类型 (top-left, top-center, top-right, center-left, center, center-right,
+                          bottom-left, bottom-center, bottom-right)
+            
+        Returns:
+            水印位置 (x, y)
+        """
+        img_width, img_height = image_size
+        wm_width, wm_height = watermark_size
+        
+        positions = {
+            "top-left": (10, 10),
+            "top-center": ((img_width - wm_width) // 2, 10),
+            "top-right": (img_width - wm_width - 10, 10),
+            "center-left": (10, (img_height - wm_height) // 2),
+            "center": ((img_width - wm_width) // 2, (img_height - wm_height) // 2),
+            "center-right": (img_width - wm_width - 10, (img_height - wm_height) // 2),
+            "bottom-left": (10, img_height - wm_height - 10),
+            "bottom-center": ((img_width - wm_width) // 2, img_height - wm_height - 10),
+            "bottom-right": (img_width - wm_width - 10, img_height - wm_height - 10)
+        }
+        
+        return positions.get(position_type, positions["center"])
@@ -9,6 +9,7 @@ a = Analysis(
     datas=[
         ('src/modules', 'src/modules'),
         ('src/utils', 'src/utils'),
+        ('src/ui', 'src/ui'),
     ],
     hiddenimports=[
         'PIL._tkinter_finder',